@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Delete claim-checked AMQP message bodies older than AMQP_CLAIM_CHECK_RETENTION_DAYS. Run daily (e.g. from a k8s
+CronJob) if the bucket has no lifecycle rule on AMQP_CLAIM_CHECK_PREFIX.
+"""
+import argparse
+
+import src.config as config
+
+from src.common.amqp.utils.claim_check import delete_expired_claim_checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete expired claim-checked AMQP message bodies")
+    parser.add_argument("--retention-days", type=int, default=config.AMQP_CLAIM_CHECK_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    delete_expired_claim_checks(args.retention_days)
@@ -8,7 +8,7 @@ import threading
 import src.config as config
 
 from src.common.amqp.worker_config import WorkerConfigs
-from src.common.amqp.utils.queue_utils import publish
+from src.common.amqp.utils.queue_utils import publish, publish_batch
 from src.common.logger.logger import get_logger
 
 
@@ -52,6 +52,16 @@ def publisher_thread():
 
         time.sleep(5)
 
+    logger.info("Publishing a batch of 5 messages")
+
+    results = publish_batch(
+        exchange_name=config.EXCHANGE_NAME,
+        routing_key=WorkerConfigs.TEST_PROCESSOR.value.routing_key,
+        messages=[{**payload, "message_number": i} for i in range(5, 10)],
+        amqp_url=config.RABBIT_URL,
+    )
+    logger.info(f"Batch confirmed: {results}")
+
 
 def main():
     t1 = threading.Thread(target=consumer_thread, daemon=True)
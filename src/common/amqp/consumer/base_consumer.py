@@ -1,6 +1,12 @@
+import asyncio
+import contextvars
 import functools
-import json
+import importlib
+import inspect
+import multiprocessing
+import os
 import pika
+import time
 
 import src.config as config
 
@@ -8,32 +14,395 @@ from pika.adapters.asyncio_connection import AsyncioConnection
 from pika.spec import Basic
 from pika.channel import Channel
 from pika.exchange_type import ExchangeType
-from threading import Thread
-from typing import Callable, Optional
-
-from src.common.logger.logger import get_logger
-from src.common.amqp.utils.sanitize import print_sanitized_params
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock, Thread
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from src.common.logger.logger import get_logger, log_context
+from src.common.metrics.profiling import call_profiled, function_name, registry as profiling_registry
+from src.common.metrics.tracing import SpanContext, SpanKind, extract, record_exception, start_span
+from src.common.amqp.consumer.consumer_metrics import ConsumerMetrics
+from src.common.amqp.consumer.idempotency import IdempotencyGuard
+from src.common.amqp.consumer.priority_scheduler import PriorityScheduler
+from src.common.amqp.consumer.retry import RetryPolicy
+from src.common.amqp.utils.claim_check import ClaimCheck, is_claim_checked, resolve_body
+from src.common.amqp.utils.codec import decode_message
+from src.common.amqp.utils.sanitize import RedactionSpec, log_sanitized_params
 
 
 logger = get_logger(__name__)
 
+# What the workers get: the raw body, or a reference to fetch it from for claim-checked messages
+MessageBody = Union[bytes, ClaimCheck]
 
-def do_work(queue_consumer, basic_deliver: Basic.Deliver, params: dict):
-    """
-    LL: Ref from https://github.com/pika/pika/blob/main/examples/basic_consumer_threaded.py
-    For some reason they put the add_callback_threadsafe() here inside the thraeded fn so I'll do the same
+
+def load_params(body: MessageBody, content_type: Optional[str] = None):
+    """Fetch a claim-checked body if needed, then decode it. Blocking - runs on the workers"""
+    return decode_message(resolve_body(body), content_type)
+
+
+def run_job_finalizer(job_finalizer: Optional[Callable]):
+    if job_finalizer is None:
+        return
+
+    try:
+        job_finalizer()
+
+    except Exception as e:
+        logger.error(f"Job finalizer failed. E:{e}", exc_info=True)
+
+
+def call_processor(callback: Callable, params, job_finalizer: Optional[Callable] = None):
+    """Run the message processor, then the job finalizer on the same thread (it releases per-thread resources like
+    the thread's DB connection)"""
+    try:
+        return call_profiled(function_name(callback), callback, params)
+
+    finally:
+        run_job_finalizer(job_finalizer)
+
+
+def process_message(
+    callback: Callable,
+    body: MessageBody,
+    content_type: Optional[str] = None,
+    idempotency_guard: Optional[IdempotencyGuard] = None,
+    idempotency_key: Optional[str] = None,
+    redaction_spec: Optional[RedactionSpec] = None,
+    job_finalizer: Optional[Callable] = None,
+) -> Optional[bool]:
+    """Shared body of do_work() and do_work_in_process(): skip duplicates, decode the body, run the callback, log +
+    swallow errors. Decoding happens here, on the worker, so big payloads don't hold up the ioloop.
+
+    :return: False if decoding or the callback raised, None if another delivery of the message is still being
+        processed and this one should be requeued
     """
+    if idempotency_guard is not None and idempotency_key is not None:
+        state = idempotency_guard.begin(idempotency_key)
+        if state == IdempotencyGuard.DONE:
+            return True
+
+        if state == IdempotencyGuard.PROCESSING:
+            return None
+
     try:
-        logger.info("Received message:")
-        print_sanitized_params(params, hide_jwt=True, hide_list=True)
+        params = load_params(body, content_type)
 
-        queue_consumer._callback(params)
+        log_sanitized_params(params, redaction_spec)
+
+        call_processor(callback, params, job_finalizer)
 
     except Exception as e:
         logger.error(f"Dropping message! E:{e}")
+        record_exception(e)
+
+        if idempotency_guard is not None and idempotency_key is not None:
+            idempotency_guard.release(idempotency_key)
+
+        return False
+
+    if idempotency_guard is not None and idempotency_key is not None:
+        idempotency_guard.complete(idempotency_key)
+
+    return True
+
+
+def do_work(queue_consumer, basic_deliver: Basic.Deliver, body: MessageBody, content_type: Optional[str] = None):
+    """
+    LL: Ref from https://github.com/pika/pika/blob/main/examples/basic_consumer_threaded.py
+    For some reason they put the add_callback_threadsafe() here inside the thraeded fn so I'll do the same
+    """
+    with log_context(**queue_consumer.log_fields(basic_deliver)), start_span(
+        **queue_consumer.span_kwargs(basic_deliver)
+    ):
+        queue_consumer.metrics.message_started(basic_deliver)
+        start_time = time.perf_counter()
+        succeeded = False
+
+        try:
+            succeeded = process_message(
+                queue_consumer._callback,
+                body,
+                content_type,
+                idempotency_guard=queue_consumer.idempotency_guard,
+                idempotency_key=queue_consumer.pop_idempotency_key(basic_deliver),
+                redaction_spec=queue_consumer.redaction_spec,
+                job_finalizer=queue_consumer.job_finalizer,
+            )
+
+        finally:
+            queue_consumer.metrics.message_finished(
+                basic_deliver, time.perf_counter() - start_time, succeeded is not False
+            )
+            queue_consumer.settle_delivery(basic_deliver, succeeded)
+
+
+def batch_item_results(batch_results, batch_size: int) -> List[bool]:
+    """Per-message success flags from what a batch processor returned. None/True mean all succeeded, False that all
+    failed, a list/tuple has one flag per message. Anything else - or a list of the wrong length - is logged and
+    taken as success, the batch has run by then and retrying it would do the work twice"""
+    if batch_results is None or batch_results is True or batch_results is False:
+        return [batch_results is not False] * batch_size
+
+    if isinstance(batch_results, (list, tuple)):
+        if len(batch_results) == batch_size:
+            return [bool(succeeded) for succeeded in batch_results]
+
+        logger.error(
+            f"Batch processor returned {len(batch_results)} result(s) for {batch_size} message(s), "
+            f"treating the batch as succeeded"
+        )
+    else:
+        logger.error(
+            f"Batch processor returned {type(batch_results).__name__}, expected None, a bool or a list of "
+            f"{batch_size} flags - treating the batch as succeeded"
+        )
+
+    return [True] * batch_size
+
+
+def do_batch_work(
+    queue_consumer,
+    basic_delivers: List[Basic.Deliver],
+    bodies: List[MessageBody],
+    content_types: List[Optional[str]],
+):
+    """
+    LL: Micro-batch version of do_work(). The message_processor gets a list of params and may return a list of
+    per-message success flags (same order), None/True means they all succeeded (see batch_item_results()). Each
+    delivery is then acked/retried on its own, so one bad item doesn't take the whole batch with it
+    """
+    # One span for the whole batch, linked to each message's trace
+    trace_parents = [queue_consumer.pop_trace_parent(basic_deliver) for basic_deliver in basic_delivers]
+
+    with log_context(
+        queue=queue_consumer._queue, delivery_tags=[basic_deliver.delivery_tag for basic_deliver in basic_delivers]
+    ), start_span(
+        f"{queue_consumer._queue} process",
+        kind=SpanKind.CONSUMER,
+        attributes={
+            "messaging.system": "rabbitmq",
+            "messaging.destination.name": queue_consumer._queue,
+            "messaging.batch.message_count": len(basic_delivers),
+        },
+        links=[trace_parent for trace_parent in trace_parents if trace_parent is not None],
+    ):
+        guard = queue_consumer.idempotency_guard
+        keys = [queue_consumer.pop_idempotency_key(basic_deliver) for basic_deliver in basic_delivers]
+        # None = requeue, another delivery of the message is still being processed
+        results = [True] * len(basic_delivers)
+        params_list = [None] * len(basic_delivers)
+        # Indexes of the messages that actually go to the processor (finished duplicates are skipped + acked)
+        batch_indexes = []
+        for i, key in enumerate(keys):
+            state = guard.begin(key) if guard is not None and key is not None else IdempotencyGuard.CLAIMED
+            if state == IdempotencyGuard.CLAIMED:
+                batch_indexes.append(i)
+            elif state == IdempotencyGuard.PROCESSING:
+                results[i] = None
+
+        for i in list(batch_indexes):
+            try:
+                params_list[i] = load_params(bodies[i], content_types[i])
+
+            except Exception as e:
+                logger.error(f"Dropping message! E:{e}")
+                record_exception(e)
+                results[i] = False
+                batch_indexes.remove(i)
+
+                if guard is not None and keys[i] is not None:
+                    guard.release(keys[i])
+
+        for i in batch_indexes:
+            queue_consumer.metrics.message_started(basic_delivers[i])
+
+        start_time = time.perf_counter()
+
+        try:
+            logger.info(f"Received batch of {len(batch_indexes)} message(s)")
+            for i in batch_indexes:
+                log_sanitized_params(params_list[i], queue_consumer.redaction_spec, msg=f"Batch item {i}")
+
+            batch_results = (
+                call_processor(
+                    queue_consumer._callback,
+                    [params_list[i] for i in batch_indexes],
+                    queue_consumer.job_finalizer,
+                )
+                if batch_indexes
+                else None
+            )
+
+            for i, succeeded in zip(batch_indexes, batch_item_results(batch_results, len(batch_indexes))):
+                results[i] = succeeded
+
+        except Exception as e:
+            logger.error(f"Dropping batch! E:{e}")
+            record_exception(e)
+            for i in batch_indexes:
+                results[i] = False
+
+        finally:
+            duration = time.perf_counter() - start_time
+
+            processed = set(batch_indexes)
+
+            for i, basic_deliver in enumerate(basic_delivers):
+                if i in processed:
+                    queue_consumer.metrics.message_finished(basic_deliver, duration, results[i])
+
+                    if guard is not None and keys[i] is not None:
+                        if results[i]:
+                            guard.complete(keys[i])
+                        else:
+                            guard.release(keys[i])
+
+                queue_consumer.settle_delivery(basic_deliver, results[i])
+
+
+def do_work_in_process(
+    callback: Callable,
+    body: MessageBody,
+    content_type: Optional[str] = None,
+    idempotency_guard: Optional[IdempotencyGuard] = None,
+    idempotency_key: Optional[str] = None,
+    redaction_spec: Optional[RedactionSpec] = None,
+    log_fields: Optional[dict] = None,
+    span_kwargs: Optional[dict] = None,
+    job_finalizer: Optional[Callable] = None,
+) -> Tuple[float, float, bool]:
+    """
+    LL: Process pool version of do_work(). This runs in the child process so it can't hold on to the consumer - the
+    ack is sent from the parent once the future resolves (see BaseConsumer._on_process_work_done())
+
+    :return: (started_at wall clock, duration, succeeded) for the parent's metrics
+    """
+    started_at = time.time()
+    start_time = time.perf_counter()
+
+    with log_context(**(log_fields or {})), start_span(**(span_kwargs or {"name": function_name(callback)})):
+        succeeded = process_message(
+            callback,
+            body,
+            content_type,
+            idempotency_guard=idempotency_guard,
+            idempotency_key=idempotency_key,
+            redaction_spec=redaction_spec,
+            job_finalizer=job_finalizer,
+        )
+
+    return started_at, time.perf_counter() - start_time, succeeded
 
-    finally:
-        queue_consumer.add_callback_threadsafe(basic_deliver)
+
+def init_process_worker(module_names: Sequence[str], initializer: Optional[Callable] = None):
+    """Runs once in each pool child - pay for the heavy imports (langchain, vertexai etc.) and any per-process setup
+    like DB binding up front instead of on the first message"""
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+    if initializer is not None:
+        initializer()
+
+
+def warm_up_process_worker() -> int:
+    return os.getpid()
+
+
+async def do_work_async(
+    queue_consumer, basic_deliver: Basic.Deliver, body: MessageBody, content_type: Optional[str] = None
+):
+    """
+    LL: asyncio version of do_work(). This runs on the event loop, which is also the pika ioloop, so we ack directly
+    instead of going through add_callback_threadsafe(). async def processors are awaited natively, plain functions
+    are pushed to the consumer's executor (or the loop's default one) so they don't block the loop
+    """
+    async with queue_consumer.semaphore:
+        # Each task runs in its own copy of the context, so this never leaks into other messages
+        with log_context(**queue_consumer.log_fields(basic_deliver)), start_span(
+            **queue_consumer.span_kwargs(basic_deliver)
+        ):
+            queue_consumer.metrics.message_started(basic_deliver)
+            start_time = time.perf_counter()
+            succeeded = False
+            loop = asyncio.get_running_loop()
+            idempotency_guard = queue_consumer.idempotency_guard
+            idempotency_key = queue_consumer.pop_idempotency_key(basic_deliver)
+
+            try:
+                # The Redis calls are blocking, keep them off the loop
+                if idempotency_key is not None:
+                    state = await loop.run_in_executor(None, idempotency_guard.begin, idempotency_key)
+                    if state == IdempotencyGuard.DONE:
+                        succeeded = True
+                        return
+
+                    if state == IdempotencyGuard.PROCESSING:
+                        succeeded = None
+                        return
+
+                if isinstance(body, ClaimCheck) or len(body) >= config.AMQP_DECODE_OFFLOAD_BYTES:
+                    params = await loop.run_in_executor(queue_consumer._executor, load_params, body, content_type)
+                else:
+                    # Not worth the executor round trip
+                    params = load_params(body, content_type)
+
+                log_sanitized_params(params, queue_consumer.redaction_spec)
+
+                callback_name = function_name(queue_consumer._callback)
+
+                if inspect.iscoroutinefunction(queue_consumer._callback):
+                    callback_start_time = time.perf_counter()
+                    callback_failed = True
+
+                    try:
+                        await queue_consumer._callback(params)
+                        callback_failed = False
+
+                    finally:
+                        profiling_registry.record(
+                            callback_name, time.perf_counter() - callback_start_time, callback_failed
+                        )
+                        run_job_finalizer(queue_consumer.job_finalizer)
+
+                else:
+                    # run_in_executor() doesn't carry contextvars over, run in a copy so the log fields come along
+                    await loop.run_in_executor(
+                        queue_consumer._executor,
+                        contextvars.copy_context().run,
+                        call_processor,
+                        queue_consumer._callback,
+                        params,
+                        queue_consumer.job_finalizer,
+                    )
+
+                succeeded = True
+
+                if idempotency_key is not None:
+                    await loop.run_in_executor(None, idempotency_guard.complete, idempotency_key)
+
+            except Exception as e:
+                logger.error(f"Dropping message! E:{e}")
+                record_exception(e)
+
+                if idempotency_key is not None:
+                    await loop.run_in_executor(None, idempotency_guard.release, idempotency_key)
+
+            finally:
+                queue_consumer.metrics.message_finished(
+                    basic_deliver, time.perf_counter() - start_time, succeeded is not False
+                )
+                if succeeded is None:
+                    queue_consumer.requeue_later(basic_deliver)
+                    return
+
+                # Republishing for retry is a blocking publish too. In this context, so the retry carries the span
+                ack = await loop.run_in_executor(
+                    None, contextvars.copy_context().run, queue_consumer.resolve_delivery, basic_deliver, succeeded
+                )
+                queue_consumer.metrics.ack_scheduled(basic_deliver)
+                queue_consumer.on_message_callback(basic_deliver, ack=ack)
 
 
 class BaseConsumer(object):
@@ -61,6 +430,18 @@ class BaseConsumer(object):
         delay_exchange_name: Optional[str] = None,
         delay_exchange_type: Optional[ExchangeType] = ExchangeType.topic,
         priority: int = None,
+        prefetch_count: Optional[int] = 1,
+        max_workers: Optional[int] = None,
+        use_process_pool: Optional[bool] = False,
+        process_initializer: Optional[Callable] = None,
+        drain_timeout: Optional[float] = config.CONSUMER_DRAIN_TIMEOUT,
+        deduplicate: Optional[bool] = False,
+        retry_max_attempts: Optional[int] = None,
+        local_priority_scheduling: Optional[bool] = False,
+        batch_size: Optional[int] = None,
+        batch_timeout_ms: Optional[int] = None,
+        redaction_spec: Optional[RedactionSpec] = None,
+        job_finalizer: Optional[Callable] = None,
     ):
         """Create a new instance of the consumer class, passing in the AMQP
         URL used to connect to RabbitMQ.
@@ -71,7 +452,28 @@ class BaseConsumer(object):
         :param str amqp_url: The AMQP url to connect with
         :param str exchange_name: The RabbitMQ exchange name
         :param ExchangeType exchange_type: The RabbitMQ exchange type
+        :param int prefetch_count: The basic_qos prefetch count for the channel
+        :param int max_workers: Size of the worker thread pool. If None, a new thread is started per message
+        :param bool use_process_pool: Run the callback in a ProcessPoolExecutor of max_workers (default 1) children
+        :param Callable process_initializer: Extra setup to run once in each pool child (e.g. DB binding)
+        :param float drain_timeout: Secs in-flight messages get to finish on stop() before they are nacked + requeued
+        :param bool deduplicate: Skip messages that were already processed, and requeue ones still being processed
+            elsewhere - tracked in Redis by message_id (see IdempotencyGuard.message_key())
+        :param int retry_max_attempts: Retry failed messages through the delay exchange until this many attempts,
+            then dead-letter them. If None, failed messages are dropped
+        :param bool local_priority_scheduling: Hand prefetched messages to the worker pool by AMQP priority (with
+            aging) instead of arrival order. Needs max_workers, and prefetch_count > max_workers to have any effect
+        :param int batch_size: Hand the callback lists of up to batch_size messages instead of one at a time. Not
+            supported with use_process_pool
+        :param int batch_timeout_ms: Max time the first message of a batch waits for the batch to fill up
+        :param RedactionSpec redaction_spec: How received params are logged, defaults to DEFAULT_REDACTION_SPEC
+        :param Callable job_finalizer: Runs on the worker thread (or pool child) after every job, e.g. to return the
+            thread's DB connection to the pool. Must be picklable with use_process_pool
         """
+        if batch_size is not None and use_process_pool is True:
+            # do_batch_work() needs the consumer itself, which can't be pickled over to a pool child
+            raise ValueError(f"{queue_name}: batch_size can't be combined with use_process_pool")
+
         self.should_reconnect = False
         self.was_consuming = False
 
@@ -81,9 +483,8 @@ class BaseConsumer(object):
         self._consumer_tag = None
         self._url = amqp_url
         self._consuming = False
-        # In production, experiment with higher prefetch values
-        # for higher consumer throughput
-        self._prefetch_count = 1
+        # Prefetch should be >= max_workers, otherwise the pool never gets enough deliveries to keep busy
+        self._prefetch_count = prefetch_count
 
         self._queue = queue_name
         self._routing_key = routing_key
@@ -97,6 +498,68 @@ class BaseConsumer(object):
 
         self.__threads = []
 
+        # delivery_tag -> Basic.Deliver for every message handed to a worker but not acked/nacked yet. Only touched
+        # from the ioloop thread. While draining, new deliveries are requeued instead of being started
+        self._in_flight = {}
+        self._draining = False
+        self._drain_timeout = drain_timeout
+
+        # delivery_tag -> message_id/body hash (None if it has neither), only populated with deduplicate on
+        self.idempotency_guard = IdempotencyGuard(self._queue) if deduplicate is True else None
+        self._idempotency_keys = {}
+
+        # delivery_tag -> (properties, body) so failures can be republished as-is, only populated with retries on
+        self.retry_policy = (
+            RetryPolicy(self._queue, retry_max_attempts, amqp_url=self._url) if retry_max_attempts is not None else None
+        )
+        self._retry_deliveries = {}
+
+        # delivery_tag -> the publisher's SpanContext, only for messages that came with a traceparent header
+        self._trace_parents = {}
+
+        # Precompiled once, used to log every received message
+        self.redaction_spec = redaction_spec
+        self.job_finalizer = job_finalizer
+
+        # Queue wait, processing time, in-flight, ack latency and error counts for this queue
+        self.metrics = ConsumerMetrics(self._queue)
+
+        # LL: With max_workers set, deliveries run on a fixed-size pool instead of a new Thread each, so at most
+        # max_workers jobs are in flight and finished futures are dropped as soon as they complete
+        self._max_workers = max_workers
+        self._use_process_pool = use_process_pool
+        self._executor = None
+        # Future -> Basic.Deliver
+        self._futures = {}
+        self._futures_lock = Lock()
+        self._process_initializer = process_initializer
+        # Held while a broken process pool is replaced
+        self._executor_lock = Lock()
+
+        if self._use_process_pool is True:
+            # CPU-bound callbacks (e.g. PDF parsing) hold the GIL and starve the ioloop + heartbeats if run in a thread
+            self._max_workers = self._max_workers or 1
+            self._executor = self.create_process_pool()
+            self.warm_up_executor()
+
+        elif self._max_workers is not None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=self._queue)
+
+        # Micro-batching: deliveries collect here on the ioloop thread until batch_size or batch_timeout_ms, whichever
+        # comes first. Prefetch has to allow a full batch to be unacked at once
+        self._batch_size = batch_size
+        self._batch_timeout = (batch_timeout_ms or 0) / 1000
+        self._batch = []
+        self._batch_timer = None
+        if self._batch_size is not None:
+            self._prefetch_count = max(self._prefetch_count, self._batch_size * (self._max_workers or 1))
+
+        # Prefetched deliveries wait here rather than in the executor's FIFO queue, and only go to the pool when a
+        # worker is free, so a high priority chat message overtakes bulk work already sitting in the pod
+        self._scheduler = None
+        if local_priority_scheduling is True and self._executor is not None:
+            self._scheduler = PriorityScheduler(config.LOCAL_PRIORITY_AGING_INTERVAL)
+
     def connect(self) -> pika.SelectConnection:
         """This method connects to RabbitMQ, returning the connection handle.
         When the connection is established, the on_connection_open method
@@ -301,13 +764,72 @@ class BaseConsumer(object):
 
         """
         logger.info("Queue bound: %s", userdata)
+        if self.retry_policy is not None:
+            self.setup_retry_exchange()
+
+        else:
+            self.set_qos()
+
+    def setup_retry_exchange(self):
+        """Declare the delay exchange that failed messages are republished to. When it is done,
+        on_retry_exchange_declareok will bind the queue to it with its own retry routing key.
+
+        """
+        logger.info("Declaring retry exchange: %s", self.retry_policy.delay_exchange_name)
+        self._channel.exchange_declare(
+            exchange=self.retry_policy.delay_exchange_name,
+            exchange_type="x-delayed-message",
+            durable=True,
+            callback=self.on_retry_exchange_declareok,
+            arguments={"x-delayed-type": "topic"},
+        )
+
+    def on_retry_exchange_declareok(self, _unused_frame):
+        """Bind the queue to the delay exchange with retry.<queue>, so retries only come back to this queue.
+
+        :param pika.Frame.Method _unused_frame: Exchange.DeclareOk response frame
+
+        """
+        logger.info(
+            "Binding %s to %s with %s",
+            self.retry_policy.delay_exchange_name,
+            self._queue,
+            self.retry_policy.retry_routing_key,
+        )
+        self._channel.queue_bind(
+            self._queue,
+            self.retry_policy.delay_exchange_name,
+            routing_key=self.retry_policy.retry_routing_key,
+            callback=self.on_retry_bindok,
+        )
+
+    def on_retry_bindok(self, _unused_frame):
+        """Declare the dead-letter queue for messages that ran out of attempts, then carry on with QoS.
+
+        :param pika.frame.Method _unused_frame: The Queue.BindOk response frame
+
+        """
+        logger.info("Declaring dead-letter queue %s", self.retry_policy.dead_letter_queue)
+        self._channel.queue_declare(
+            queue=self.retry_policy.dead_letter_queue,
+            durable=True,
+            callback=self.on_dead_letter_queue_declareok,
+        )
+
+    def on_dead_letter_queue_declareok(self, _unused_frame):
+        """Invoked by pika when the dead-letter Queue.Declare has completed.
+
+        :param pika.frame.Method _unused_frame: The Queue.DeclareOk frame
+
+        """
+        logger.info("Dead-letter queue declared: %s", self.retry_policy.dead_letter_queue)
         self.set_qos()
 
     def set_qos(self):
-        """This method sets up the consumer prefetch to only be delivered
-        one message at a time. The consumer must acknowledge this message
-        before RabbitMQ will deliver another one. You should experiment
-        with different prefetch values to achieve desired performance.
+        """This method sets up the consumer prefetch to be delivered at most
+        prefetch_count unacknowledged messages at a time. The consumer must
+        acknowledge a message before RabbitMQ will deliver another one past
+        that limit. Keep it >= max_workers so the worker pool stays busy.
 
         """
         self._channel.basic_qos(prefetch_count=self._prefetch_count, callback=self.on_basic_qos_ok)
@@ -405,20 +927,59 @@ class BaseConsumer(object):
         add_callback_threadsafe() are also called from inside a thread. Over there the thrad calls an on_message()
         fn which creates a thread of do_work()
         """
+        if self._draining is True:
+            # Already prefetched before our Basic.Cancel went through - hand it straight back for another pod
+            self.nack_message(basic_deliver.delivery_tag)
+            return
+
+        self._in_flight[basic_deliver.delivery_tag] = basic_deliver
+        self.metrics.message_received(basic_deliver, properties)
+
+        if self.idempotency_guard is not None:
+            self._idempotency_keys[basic_deliver.delivery_tag] = IdempotencyGuard.message_key(properties, body)
+
+        if self.retry_policy is not None:
+            self._retry_deliveries[basic_deliver.delivery_tag] = (properties, body)
+
+        trace_parent = extract(properties.headers) if properties is not None else None
+        if trace_parent is not None:
+            self._trace_parents[basic_deliver.delivery_tag] = trace_parent
+
+        if properties is not None and is_claim_checked(properties.headers):
+            # Only a reference was enqueued, the worker fetches the real body
+            body = ClaimCheck(body.decode())
+
+        # The body is decoded by whichever worker picks it up, not here on the ioloop thread
+        content_type = properties.content_type if properties is not None else None
+
         # This is the main execution of a worker upon calling consumer().run()
         try:
-            th = Thread(
-                target=do_work,
-                args=(self, basic_deliver, json.loads(body)),
-                daemon=False,
-            )
-            th.start()
+            if self._batch_size is not None:
+                self.add_to_batch(basic_deliver, body, content_type)
+
+            elif self._scheduler is not None:
+                self._scheduler.push((basic_deliver, body, content_type), priority=properties.priority)
+                self.dispatch_scheduled_work()
+
+            elif self._executor is not None:
+                self.submit_work(basic_deliver, body, content_type)
 
-            # To be rigorous we need to collect these and join() when we terminate somewhere in stop()
-            self.__threads.append(th)
+            else:
+                th = Thread(
+                    target=do_work,
+                    args=(self, basic_deliver, body, content_type),
+                    daemon=False,
+                )
+                th.start()
+
+                # To be rigorous we need to collect these and join() when we terminate somewhere in stop()
+                # Drop finished threads here so the list doesn't grow forever
+                self.__threads = [t for t in self.__threads if t.is_alive()]
+                self.__threads.append(th)
 
         except Exception as e:
             logger.error(f"Error in do_work(): {e}", exc_info=True)
+            self.requeue_unstarted(basic_deliver)
 
         # LL - this shouldn't be here anymore as add_callback_threadsafe() is already called inside do_work() - else
         # we'll be ack'ing the same message twice
@@ -435,13 +996,361 @@ class BaseConsumer(object):
         # the finally clause above
         # self.acknowledge_message(basic_deliver.delivery_tag)
 
-    def add_callback_threadsafe(self, basic_deliver):
-        callback = functools.partial(self.on_message_callback, basic_deliver)
+    def submit_work(self, basic_deliver: Basic.Deliver, body: MessageBody, content_type: Optional[str] = None):
+        """Run do_work() for this delivery on the worker pool. do_work() acks through add_callback_threadsafe()
+        when it is done, the done callback only drops the finished future. If the job can't be handed to the pool
+        the delivery is nacked + requeued right away, so it never sits unacked on the channel.
+
+        :param pika.Spec.Basic.Deliver basic_deliver: basic_deliver method
+        :param body: The raw message body, or a ClaimCheck to fetch it from
+        :param str content_type: The message's content_type, picks the decoder
+
+        """
+        try:
+            if self._use_process_pool is True:
+                idempotency_key = self.pop_idempotency_key(basic_deliver)
+                job = functools.partial(
+                    do_work_in_process,
+                    self._callback,
+                    body,
+                    content_type,
+                    idempotency_guard=self.idempotency_guard,
+                    idempotency_key=idempotency_key,
+                    redaction_spec=self.redaction_spec,
+                    log_fields=self.log_fields(basic_deliver),
+                    span_kwargs=self.span_kwargs(basic_deliver),
+                    job_finalizer=self.job_finalizer,
+                )
+
+                executor = self._executor
+                try:
+                    future = executor.submit(job)
+
+                except BrokenProcessPool:
+                    # A child died since the last job finished - start a new pool and try once more
+                    executor = self.restart_process_pool(executor)
+                    future = executor.submit(job)
+
+                done_callback = functools.partial(self._on_process_work_done, executor, basic_deliver, idempotency_key)
+
+            else:
+                future = self._executor.submit(do_work, self, basic_deliver, body, content_type)
+                done_callback = self._reap_future
+
+        except Exception as e:
+            logger.error(f"Couldn't hand delivery_tag={basic_deliver.delivery_tag} to a worker! E:{e}", exc_info=True)
+            self.requeue_unstarted(basic_deliver)
+            return
+
+        with self._futures_lock:
+            self._futures[future] = basic_deliver
+
+        future.add_done_callback(done_callback)
+
+    def add_to_batch(self, basic_deliver: Basic.Deliver, body: MessageBody, content_type: Optional[str] = None):
+        self._batch.append((basic_deliver, body, content_type))
+
+        if len(self._batch) >= self._batch_size:
+            self.flush_batch()
+
+        elif self._batch_timer is None:
+            self._batch_timer = self._connection.ioloop.call_later(self._batch_timeout, self.flush_batch)
+
+    def flush_batch(self):
+        """Hand the collected deliveries to do_batch_work() on the worker pool (or a new thread without one)"""
+        if self._batch_timer is not None:
+            self._connection.ioloop.remove_timeout(self._batch_timer)
+            self._batch_timer = None
+
+        if not self._batch:
+            return
+
+        basic_delivers, bodies, content_types = (list(items) for items in zip(*self._batch))
+        self._batch = []
+
+        try:
+            if self._executor is not None:
+                future = self._executor.submit(do_batch_work, self, basic_delivers, bodies, content_types)
+
+                with self._futures_lock:
+                    self._futures[future] = basic_delivers
+
+                future.add_done_callback(self._reap_future)
+
+            else:
+                th = Thread(target=do_batch_work, args=(self, basic_delivers, bodies, content_types), daemon=False)
+                th.start()
+
+                self.__threads = [t for t in self.__threads if t.is_alive()]
+                self.__threads.append(th)
+
+        except Exception as e:
+            logger.error(f"Couldn't hand a batch of {len(basic_delivers)} to a worker! E:{e}", exc_info=True)
+            for basic_deliver in basic_delivers:
+                self.requeue_unstarted(basic_deliver)
+
+    def dispatch_scheduled_work(self):
+        """Move the highest priority scheduled deliveries to the pool while it has free workers. Runs on the ioloop
+        thread - on every delivery and every time a job finishes.
+
+        """
+        while len(self._scheduler) > 0 and not self._draining:
+            with self._futures_lock:
+                if len(self._futures) >= self._max_workers:
+                    return
+
+            basic_deliver, body, content_type = self._scheduler.pop()
+            self.submit_work(basic_deliver, body, content_type)
+
+    def _pop_future(self, future: Future) -> List[Basic.Deliver]:
+        """Forget a finished job and let the scheduler fill the freed worker.
+
+        :return: The job's deliveries (a batch has several)
+        """
+        with self._futures_lock:
+            basic_deliver = self._futures.pop(future, None)
+
+        if self._scheduler is not None and not self._draining and not self._connection.is_closed:
+            # A worker just freed up
+            self._connection.ioloop.add_callback_threadsafe(self.dispatch_scheduled_work)
+
+        if basic_deliver is None:
+            return []
+
+        return basic_deliver if isinstance(basic_deliver, list) else [basic_deliver]
+
+    def _reap_future(self, future: Future):
+        basic_delivers = self._pop_future(future)
+
+        if future.cancelled():
+            # Never picked up by a worker before we started draining
+            for cancelled_deliver in basic_delivers:
+                self.add_callback_threadsafe(cancelled_deliver, ack=False)
+
+        elif future.exception() is not None:
+            # do_work()/do_batch_work() catch everything, so this is the pool itself failing (e.g. the job couldn't
+            # be handed to a worker). Nack + requeue so the deliveries don't sit unacked on the channel - if the
+            # worker already acked, on_message_callback() drops the second one
+            logger.error(f"Requeueing {len(basic_delivers)} message(s), worker failed! E:{future.exception()}")
+            for failed_deliver in basic_delivers:
+                self.add_callback_threadsafe(failed_deliver, ack=False)
+
+    def _on_process_work_done(
+        self,
+        executor: ProcessPoolExecutor,
+        basic_deliver: Basic.Deliver,
+        idempotency_key: Optional[str],
+        future: Future,
+    ):
+        # Runs on the executor's management thread in this process, so hand the ack to the ioloop like do_work() does
+        if future.cancelled():
+            self._reap_future(future)
+            return
+
+        succeeded = False
+        requeue = False
+
+        try:
+            self._pop_future(future)
+            exception = future.exception()
+
+            if exception is None:
+                started_at, duration, succeeded = future.result()
+                self.metrics.message_started(basic_deliver, started_at=started_at)
+                self.metrics.message_finished(basic_deliver, duration, succeeded is not False)
+
+            else:
+                self.metrics.message_finished(basic_deliver, 0, False)
+
+            if isinstance(exception, BrokenProcessPool):
+                # A child died (OOM, segfault in a parser) - this fails every job in the pool, not just the one that
+                # killed it. None of them got to release their claim
+                self.restart_process_pool(executor)
+
+                if self.idempotency_guard is not None and idempotency_key is not None:
+                    self.idempotency_guard.release(idempotency_key)
+
+                # Run them again once. One that brings a worker down a second time goes to the retry policy instead
+                # of crash-looping the pool
+                requeue = not basic_deliver.redelivered
+                logger.error(
+                    f"Worker process died running delivery_tag={basic_deliver.delivery_tag}, "
+                    f"{'requeueing' if requeue else 'giving up on'} it! E:{exception}"
+                )
+
+        finally:
+            if requeue:
+                self._retry_deliveries.pop(basic_deliver.delivery_tag, None)
+                self.add_callback_threadsafe(basic_deliver, ack=False)
+
+            else:
+                self.settle_delivery(basic_deliver, succeeded)
+
+    def create_process_pool(self) -> ProcessPoolExecutor:
+        # Children are spawned rather than forked so they don't inherit the parent's AMQP/DB sockets
+        return ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_process_worker,
+            initargs=((self._callback.__module__,), self._process_initializer),
+        )
+
+    def restart_process_pool(self, broken_executor: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Replace a pool that broke because a child died - until then every submit() raises BrokenProcessPool. Every
+        job of the broken pool fails, so this is called once per job - only the first replaces it.
+
+        :return: The new pool
+        """
+        with self._executor_lock:
+            if self._executor is broken_executor and not self._closing:
+                logger.error("Process pool is broken, starting a new one")
+                broken_executor.shutdown(wait=False)
+                self._executor = self.create_process_pool()
+
+            return self._executor
+
+    def warm_up_executor(self):
+        """Start all pool children now and wait for their initializer to finish, so the first deliveries don't pay
+        for process start-up and imports"""
+        logger.info(f"Warming up {self._max_workers} worker process(es)")
+        futures = [self._executor.submit(warm_up_process_worker) for _ in range(self._max_workers)]
+        wait(futures)
+        logger.info(f"Worker processes ready: {sorted(set(f.result() for f in futures))}")
+
+    def resolve_delivery(self, basic_deliver: Basic.Deliver, succeeded: bool) -> bool:
+        """Called from the worker once the processor is done. Failed messages are handed to the retry policy.
+
+        :return: Whether to ack (True) or nack + requeue (False) the delivery
+        """
+        delivery = self._retry_deliveries.pop(basic_deliver.delivery_tag, None)
+
+        if succeeded or self.retry_policy is None or delivery is None:
+            return True
+
+        properties, body = delivery
+        return self.retry_policy.handle_failure(properties, body)
+
+    def requeue_unstarted(self, basic_deliver: Basic.Deliver):
+        """Nack + requeue a delivery that never reached a worker, so it doesn't stay unacked (and hold a prefetch slot)
+        forever. Runs on the ioloop thread"""
+        for pending in (self._idempotency_keys, self._retry_deliveries, self._trace_parents):
+            pending.pop(basic_deliver.delivery_tag, None)
+
+        if basic_deliver.delivery_tag not in self._in_flight:
+            return
+
+        if self._channel is not None and self._channel.is_open:
+            self.nack_message(basic_deliver.delivery_tag)
+            self.metrics.message_acked(basic_deliver)
+        else:
+            self._in_flight.pop(basic_deliver.delivery_tag, None)
+
+    def settle_delivery(self, basic_deliver: Basic.Deliver, succeeded: Optional[bool]):
+        """Ack, retry or requeue a finished delivery from a worker thread.
+
+        :param bool succeeded: What process_message() returned - None requeues it for later
+        """
+        if succeeded is None:
+            self.requeue_later(basic_deliver)
+            return
+
+        ack = self.resolve_delivery(basic_deliver, succeeded)
+        self.add_callback_threadsafe(basic_deliver, ack=ack)
+
+    def requeue_later(self, basic_deliver: Basic.Deliver):
+        """Nack + requeue a duplicate whose first delivery is still being processed, after DEDUP_REQUEUE_DELAY secs so
+        it doesn't bounce straight back. It keeps its prefetch slot until then, but not a worker. Thread-safe"""
+        self._retry_deliveries.pop(basic_deliver.delivery_tag, None)
+
+        if self._connection is None or self._connection.is_closed:
+            logger.warning(f"Connection closed, dropping late nack for delivery_tag={basic_deliver.delivery_tag}")
+            return
+
+        logger.info(f"Requeueing delivery_tag={basic_deliver.delivery_tag} in {config.DEDUP_REQUEUE_DELAY}s")
+        nack = functools.partial(self.add_callback_threadsafe, basic_deliver, ack=False)
+        self._connection.ioloop.add_callback_threadsafe(
+            functools.partial(self._connection.ioloop.call_later, config.DEDUP_REQUEUE_DELAY, nack)
+        )
+
+    def log_fields(self, basic_deliver: Basic.Deliver) -> dict:
+        """Added to every record the worker logs for this delivery, so parallel jobs can be told apart"""
+        return {"queue": self._queue, "delivery_tag": basic_deliver.delivery_tag}
+
+    def pop_idempotency_key(self, basic_deliver: Basic.Deliver) -> Optional[str]:
+        return self._idempotency_keys.pop(basic_deliver.delivery_tag, None)
+
+    def pop_trace_parent(self, basic_deliver: Basic.Deliver) -> Optional[SpanContext]:
+        return self._trace_parents.pop(basic_deliver.delivery_tag, None)
+
+    def span_kwargs(self, basic_deliver: Basic.Deliver) -> dict:
+        """start_span() kwargs for processing this delivery - continues the publisher's trace if it sent one.
+        Picklable, so process pool jobs can open the span in the child"""
+        return {
+            "name": f"{self._queue} process",
+            "kind": SpanKind.CONSUMER,
+            "parent": self.pop_trace_parent(basic_deliver),
+            "attributes": {
+                "messaging.system": "rabbitmq",
+                "messaging.destination.name": self._queue,
+                "messaging.rabbitmq.delivery_tag": basic_deliver.delivery_tag,
+            },
+        }
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self._in_flight)
+
+    def cancel_pending_work(self):
+        """Cancel pool jobs that haven't started yet, their done callbacks nack + requeue the deliveries"""
+        with self._futures_lock:
+            futures = list(self._futures)
+
+        cancelled = sum(future.cancel() for future in futures)
+
+        if self._scheduler is not None:
+            for basic_deliver, _, _ in self._scheduler.pop_all():
+                if self._channel is not None and self._channel.is_open:
+                    self.nack_message(basic_deliver.delivery_tag)
+                    self.metrics.message_acked(basic_deliver)
+                    cancelled += 1
+
+        if cancelled > 0:
+            logger.info(f"Requeueing {cancelled} message(s) that were waiting for a worker")
+
+    def shutdown_executor(self, wait: Optional[bool] = False):
+        if self._executor is not None:
+            logger.info(f"Shutting down worker pool with {self.in_flight_count} job(s) in flight")
+            self._executor.shutdown(wait=wait)
+
+    def add_callback_threadsafe(self, basic_deliver, ack: Optional[bool] = True):
+        if self._connection is None or self._connection.is_closed:
+            # Worker finished after the connection went away (reconnect/shutdown). Delivery tags only mean something
+            # on the channel they came from, so there is nothing to ack - the broker has already requeued it
+            logger.warning(f"Connection closed, dropping late ack for delivery_tag={basic_deliver.delivery_tag}")
+            return
+
+        self.metrics.ack_scheduled(basic_deliver)
+        callback = functools.partial(self.on_message_callback, basic_deliver, ack=ack)
         self._connection.ioloop.add_callback_threadsafe(callback)
 
-    def on_message_callback(self, basic_deliver):
-        logger.info(f"On Message callback. Acking message with delivery_tag={basic_deliver.delivery_tag}")
-        self.acknowledge_message(basic_deliver.delivery_tag)
+    def on_message_callback(self, basic_deliver, ack: Optional[bool] = True):
+        if basic_deliver.delivery_tag not in self._in_flight:
+            # Already nacked + requeued when the drain deadline passed
+            logger.warning(f"Dropping late ack for delivery_tag={basic_deliver.delivery_tag}, it was already requeued")
+            return
+
+        if self._channel is None or not self._channel.is_open:
+            logger.warning(f"Channel closed, not acking delivery_tag={basic_deliver.delivery_tag}")
+            return
+
+        if ack is True:
+            logger.info(f"On Message callback. Acking message with delivery_tag={basic_deliver.delivery_tag}")
+            self.acknowledge_message(basic_deliver.delivery_tag)
+
+        else:
+            self.nack_message(basic_deliver.delivery_tag)
+
+        self.metrics.message_acked(basic_deliver)
 
     def acknowledge_message(self, delivery_tag: int):
         """Acknowledge the message delivery from RabbitMQ by sending a
@@ -451,13 +1360,33 @@ class BaseConsumer(object):
 
         """
         logger.info("Acknowledging message %s", delivery_tag)
+        self._in_flight.pop(delivery_tag, None)
         self._channel.basic_ack(delivery_tag)
 
+    def nack_message(self, delivery_tag: int, requeue: Optional[bool] = True):
+        """Reject the message delivery by sending a Basic.Nack RPC method for the delivery tag. With requeue it
+        goes back to the queue for this or another consumer.
+
+        :param int delivery_tag: The delivery tag from the Basic.Deliver frame
+        :param bool requeue: Put the message back on the queue
+
+        """
+        logger.info("Rejecting message %s (requeue=%s)", delivery_tag, requeue)
+        self._in_flight.pop(delivery_tag, None)
+        self._channel.basic_nack(delivery_tag, requeue=requeue)
+
     def stop_consuming(self):
         """Tell RabbitMQ that you would like to stop consuming by sending the
         Basic.Cancel RPC command.
 
         """
+        self._draining = True
+        self.cancel_pending_work()
+
+        if self._batch_size is not None:
+            # Already prefetched - run what we have and let the drain wait for it like any other in-flight work
+            self.flush_batch()
+
         if self._channel:
             logger.info("Sending a Basic.Cancel RPC command to RabbitMQ")
             cb = functools.partial(self.on_cancelok, userdata=self._consumer_tag)
@@ -465,9 +1394,10 @@ class BaseConsumer(object):
 
     def on_cancelok(self, _unused_frame, userdata):
         """This method is invoked by pika when RabbitMQ acknowledges the
-        cancellation of a consumer. At this point we will close the channel.
-        This will invoke the on_channel_closed method once the channel has been
-        closed, which will in-turn close the connection.
+        cancellation of a consumer. At this point we will wait for in-flight
+        messages and then close the channel. This will invoke the
+        on_channel_closed method once the channel has been closed, which will
+        in-turn close the connection.
 
         :param pika.frame.Method _unused_frame: The Basic.CancelOk frame
         :param str|unicode userdata: Extra user data (consumer tag)
@@ -475,6 +1405,28 @@ class BaseConsumer(object):
         """
         self._consuming = False
         logger.info("RabbitMQ acknowledged the cancellation of the consumer: %s", userdata)
+        self.wait_for_in_flight(time.monotonic() + self._drain_timeout)
+
+    def wait_for_in_flight(self, deadline: float):
+        """Keep the ioloop (and channel) alive so worker acks still go out until every in-flight message is settled
+        or the drain deadline passes. Whatever is still running then is nacked with requeue so another pod can pick
+        it up straight away - its eventual ack is dropped in on_message_callback(). Then close the channel.
+
+        :param float deadline: time.monotonic() value to stop waiting at
+
+        """
+        if self._in_flight and self._channel is not None and self._channel.is_open:
+            if time.monotonic() < deadline:
+                logger.info(f"Draining: waiting for {self.in_flight_count} in-flight message(s)")
+                self._connection.ioloop.call_later(
+                    config.CONSUMER_DRAIN_POLL_INTERVAL, functools.partial(self.wait_for_in_flight, deadline)
+                )
+                return
+
+            for delivery_tag in list(self._in_flight):
+                logger.warning(f"Drain deadline passed, requeueing delivery_tag={delivery_tag}")
+                self.nack_message(delivery_tag)
+
         self.close_channel()
 
     def close_channel(self):
@@ -483,7 +1435,8 @@ class BaseConsumer(object):
 
         """
         logger.info("Closing the channel")
-        self._channel.close()
+        if self._channel is not None:
+            self._channel.close()
 
     def run(self):
         """Run the example consumer by connecting to RabbitMQ and then
@@ -512,13 +1465,40 @@ class BaseConsumer(object):
                 self._connection.ioloop.start()
             else:
                 self._connection.ioloop.stop()
+            self.shutdown_executor()
+            self.metrics.reset()
             logger.info("Stopped")
 
 
 class BaseAsyncIOConsumer(BaseConsumer):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, max_concurrency: Optional[int] = 1, **kwargs):
+        """Same as BaseConsumer, plus:
+
+        :param int max_concurrency: Max number of messages processed concurrently on the event loop
+
+        use_process_pool isn't supported - sync processors run in a copy of the message's context (log fields,
+        span), which can't be pickled over to a pool child. Neither are batch_size and local_priority_scheduling,
+        every message becomes its own task as soon as it arrives.
+
+        """
+        if kwargs.get("use_process_pool") is True:
+            raise ValueError("The asyncio consumer can't use a process pool, use the thread consumer instead")
+
+        if kwargs.get("batch_size") is not None or kwargs.get("local_priority_scheduling") is True:
+            raise ValueError(
+                "The asyncio consumer doesn't support batch_size or local_priority_scheduling, use the thread consumer"
+            )
+
         super().__init__(*args, **kwargs)
 
+        self._max_concurrency = max_concurrency
+        # Python 3.10+ semaphores bind to the running loop on first use, so it is safe to create it here
+        self.semaphore = asyncio.Semaphore(self._max_concurrency)
+        self._tasks = set()
+
+        # No point prefetching less than we can run at once
+        self._prefetch_count = max(self._prefetch_count, self._max_concurrency)
+
     def connect(self) -> AsyncioConnection:
         """This method connects to RabbitMQ, returning the connection handle.
         When the connection is established, the on_connection_open method
@@ -559,6 +1539,64 @@ class BaseAsyncIOConsumer(BaseConsumer):
         logger.error("Connection open failed: %s", err)
         self.reconnect()
 
+    def on_message(
+        self,
+        _unused_channel: Channel,
+        basic_deliver: pika.spec.Basic.Deliver,
+        properties: pika.BasicProperties,
+        body: str,
+    ):
+        """Invoked by pika when a message is delivered from RabbitMQ. Instead of a thread per message, schedule
+        do_work_async() as a task on the event loop - the semaphore caps how many run at once.
+
+        :param pika.channel.Channel _unused_channel: The channel object
+        :param pika.Spec.Basic.Deliver: basic_deliver method
+        :param pika.Spec.BasicProperties: properties
+        :param bytes body: The message body
+
+        """
+        if self._draining is True:
+            self.nack_message(basic_deliver.delivery_tag)
+            return
+
+        self._in_flight[basic_deliver.delivery_tag] = basic_deliver
+        self.metrics.message_received(basic_deliver, properties)
+
+        if self.idempotency_guard is not None:
+            self._idempotency_keys[basic_deliver.delivery_tag] = IdempotencyGuard.message_key(properties, body)
+
+        if self.retry_policy is not None:
+            self._retry_deliveries[basic_deliver.delivery_tag] = (properties, body)
+
+        trace_parent = extract(properties.headers) if properties is not None else None
+        if trace_parent is not None:
+            self._trace_parents[basic_deliver.delivery_tag] = trace_parent
+
+        if properties is not None and is_claim_checked(properties.headers):
+            # Only a reference was enqueued, the worker fetches the real body
+            body = ClaimCheck(body.decode())
+
+        try:
+            content_type = properties.content_type if properties is not None else None
+            task = self._connection.ioloop.create_task(do_work_async(self, basic_deliver, body, content_type))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        except Exception as e:
+            logger.error(f"Error in do_work(): {e}", exc_info=True)
+            self.requeue_unstarted(basic_deliver)
+
+    def requeue_later(self, basic_deliver: Basic.Deliver):
+        """Same as BaseConsumer.requeue_later(), but called on the event loop itself"""
+        self._retry_deliveries.pop(basic_deliver.delivery_tag, None)
+
+        logger.info(f"Requeueing delivery_tag={basic_deliver.delivery_tag} in {config.DEDUP_REQUEUE_DELAY}s")
+        self._connection.ioloop.call_later(config.DEDUP_REQUEUE_DELAY, self._requeue_now, basic_deliver)
+
+    def _requeue_now(self, basic_deliver: Basic.Deliver):
+        self.metrics.ack_scheduled(basic_deliver)
+        self.on_message_callback(basic_deliver, ack=False)
+
     def run(self):
         """Run the example consumer by connecting to RabbitMQ and then
         starting the IOLoop to block and allow the AsyncioConnection to operate.
@@ -581,7 +1619,9 @@ class BaseAsyncIOConsumer(BaseConsumer):
         if not self._closing:
             self._closing = True
             logger.info("Stopping")
-            if self._consuming:
+            # When called from a callback on the loop itself (e.g. reconnect()), run_forever() would raise - just stop
+            # the loop so run() returns
+            if self._consuming and not self._connection.ioloop.is_running():
                 self.stop_consuming()
                 self._connection.ioloop.run_forever()
             else:
@@ -589,11 +1629,11 @@ class BaseAsyncIOConsumer(BaseConsumer):
             logger.info("Stopped")
 
             # LL - ref from https://github.com/pika/pika/blob/main/examples/basic_consumer_threaded.py
-            for th in self.__threads:
-                try:
-                    th.join()
-
-                except Exception as e:
-                    logger.error(e, exc_info=True)
-
-            self.__threads = []
+            # Same idea as joining the threads there - let in-flight tasks finish once the loop is free
+            loop = self._connection.ioloop
+            if self._tasks and not loop.is_running():
+                logger.info(f"Waiting for {len(self._tasks)} in-flight task(s)")
+                loop.run_until_complete(asyncio.gather(*self._tasks, return_exceptions=True))
+
+            self.shutdown_executor()
+            self.metrics.reset()
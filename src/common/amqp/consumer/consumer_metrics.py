@@ -0,0 +1,90 @@
+import time
+
+from threading import Lock
+from typing import Optional
+
+import pika
+
+from pika.spec import Basic
+
+from src.common.metrics.metrics import MetricsRegistry, get_metrics_registry
+
+
+class ConsumerMetrics(object):
+    """Throughput/latency metrics for one consumer, labelled by queue so every WorkerConfig gets its own series.
+
+    Lifecycle of a delivery: received (ioloop) -> started/finished (worker thread, process or task) ->
+    ack scheduled (worker) -> acked (ioloop). Timestamps are wall clock so they also work across the process pool.
+
+    """
+
+    def __init__(self, queue_name: str, registry: Optional[MetricsRegistry] = None):
+        registry = registry or get_metrics_registry()
+
+        self._labels = {"queue": queue_name}
+        self._received_at = {}
+        self._ack_scheduled_at = {}
+        self._lock = Lock()
+
+        self.received = registry.counter("amqp_messages_received_total", "Deliveries received from the broker")
+        self.processed = registry.counter("amqp_messages_processed_total", "Messages processed, by status")
+        self.in_flight = registry.gauge("amqp_messages_in_flight", "Deliveries received but not acked yet")
+        self.broker_wait = registry.histogram(
+            "amqp_broker_wait_seconds", "Time from publish (timestamp property) to delivery"
+        )
+        self.queue_wait = registry.histogram(
+            "amqp_queue_wait_seconds", "Time from delivery to processing start, i.e. waiting for a free worker"
+        )
+        self.processing = registry.histogram("amqp_processing_seconds", "message_processor run time")
+        self.ack_latency = registry.histogram(
+            "amqp_ack_latency_seconds", "Time from processing end to the ack going out on the ioloop"
+        )
+
+    def message_received(self, basic_deliver: Basic.Deliver, properties: Optional[pika.BasicProperties] = None):
+        now = time.time()
+        with self._lock:
+            self._received_at[basic_deliver.delivery_tag] = now
+
+        self.received.inc(**self._labels)
+        self.in_flight.inc(**self._labels)
+
+        if properties is not None and properties.timestamp:
+            self.broker_wait.observe(max(now - properties.timestamp, 0), **self._labels)
+
+    def message_started(self, basic_deliver: Basic.Deliver, started_at: Optional[float] = None):
+        started_at = started_at or time.time()
+        with self._lock:
+            received_at = self._received_at.get(basic_deliver.delivery_tag)
+
+        if received_at is not None:
+            self.queue_wait.observe(max(started_at - received_at, 0), **self._labels)
+
+    def message_finished(self, basic_deliver: Basic.Deliver, duration: float, succeeded: bool):
+        self.processing.observe(duration, **self._labels)
+        self.processed.inc(status="success" if succeeded else "error", **self._labels)
+
+    def ack_scheduled(self, basic_deliver: Basic.Deliver):
+        with self._lock:
+            self._ack_scheduled_at[basic_deliver.delivery_tag] = time.time()
+
+    def message_acked(self, basic_deliver: Basic.Deliver):
+        now = time.time()
+        with self._lock:
+            received_at = self._received_at.pop(basic_deliver.delivery_tag, None)
+            ack_scheduled_at = self._ack_scheduled_at.pop(basic_deliver.delivery_tag, None)
+
+        if received_at is not None:
+            self.in_flight.dec(**self._labels)
+
+        if ack_scheduled_at is not None:
+            self.ack_latency.observe(max(now - ack_scheduled_at, 0), **self._labels)
+
+    def reset(self):
+        """Forget deliveries that will never be acked on this consumer's channel (connection gone)"""
+        with self._lock:
+            pending = len(self._received_at)
+            self._received_at.clear()
+            self._ack_scheduled_at.clear()
+
+        if pending > 0:
+            self.in_flight.dec(pending, **self._labels)
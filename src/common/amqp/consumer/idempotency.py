@@ -0,0 +1,127 @@
+import hashlib
+
+from typing import Optional
+
+import pika
+
+import src.config as config
+
+from src.common.logger.logger import get_logger
+from src.common.redis.utils import get_connection
+
+
+logger = get_logger(__name__)
+
+
+class IdempotencyGuard(object):
+    """Redis-backed processing state per message, so a redelivered message (e.g. after a reconnect) that is already
+    done is skipped instead of rerunning the whole job.
+
+    The state is a single key per message: SET NX "processing" when a worker picks it up, "done" once it succeeded,
+    deleted again if it failed so a retry can run. Only "done" messages are skipped - a redelivery of one that is
+    still "processing" is requeued, the first run may yet fail (or its worker may have died). If Redis is unavailable
+    the guard fails open and processes anyway.
+
+    """
+
+    CLAIMED = "claimed"
+    PROCESSING = "processing"
+    DONE = "done"
+
+    def __init__(
+        self,
+        namespace: str,
+        done_ttl: Optional[int] = config.DEDUP_DONE_TTL,
+        processing_ttl: Optional[int] = config.DEDUP_PROCESSING_TTL,
+    ):
+        """
+        :param str namespace: Key prefix, normally the queue name
+        :param int done_ttl: Secs a finished message is remembered for
+        :param int processing_ttl: Secs a "processing" claim is held for - must outlast the slowest job, but lets
+            messages from a crashed worker run again eventually
+        """
+        self.namespace = namespace
+        self.done_ttl = done_ttl
+        self.processing_ttl = processing_ttl
+        self._connection = None
+
+    def __getstate__(self):
+        # Pickled over to process pool children, which open their own client
+        return {**self.__dict__, "_connection": None}
+
+    def _get_connection(self):
+        # One client for the guard's lifetime, redis.Redis reconnects through its pool on its own. Not kept while
+        # Redis is unreachable, so a later message tries again
+        if self._connection is None:
+            self._connection = get_connection()
+
+        return self._connection
+
+    @staticmethod
+    def message_key(
+        properties: Optional[pika.BasicProperties],
+        body: bytes,
+        body_hash_fallback: bool = config.DEDUP_BODY_HASH_FALLBACK,
+    ) -> Optional[str]:
+        """The publisher's message_id if there is one, otherwise a hash of the raw body with body_hash_fallback on.
+
+        :return: None if the message can't be deduplicated
+        """
+        if properties is not None and properties.message_id:
+            return f"id:{properties.message_id}"
+
+        if not body_hash_fallback:
+            return None
+
+        if isinstance(body, str):
+            body = body.encode()
+
+        return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+    def _redis_key(self, key: str) -> str:
+        return f"amqp_dedup:{self.namespace}:{key}"
+
+    def begin(self, key: str) -> str:
+        """Claim the message for processing.
+
+        :return: CLAIMED if this worker should run it, DONE if it already ran (ack + skip), PROCESSING if another
+            delivery of it is still running (requeue)
+        """
+        try:
+            connection = self._get_connection()
+            if connection is None:
+                return self.CLAIMED
+
+            if connection.set(self._redis_key(key), self.PROCESSING, nx=True, ex=self.processing_ttl):
+                return self.CLAIMED
+
+            state = connection.get(self._redis_key(key))
+            if isinstance(state, bytes):
+                state = state.decode()
+
+            # Also if the claim expired in between - requeueing is always safe, the next delivery claims it
+            state = self.DONE if state == self.DONE else self.PROCESSING
+            logger.info(f"Duplicate message {key}, state={state}")
+            return state
+
+        except Exception as e:
+            logger.error(f"Idempotency check failed for {key}, processing anyway. E:{e}")
+            return self.CLAIMED
+
+    def complete(self, key: str):
+        try:
+            connection = self._get_connection()
+            if connection is not None:
+                connection.set(self._redis_key(key), self.DONE, ex=self.done_ttl)
+
+        except Exception as e:
+            logger.error(f"Failed to mark message {key} as done. E:{e}")
+
+    def release(self, key: str):
+        try:
+            connection = self._get_connection()
+            if connection is not None:
+                connection.delete(self._redis_key(key))
+
+        except Exception as e:
+            logger.error(f"Failed to release message {key}. E:{e}")
@@ -0,0 +1,167 @@
+import pika
+
+from pika.channel import Channel
+from typing import List, Optional
+
+import src.config as config
+
+from src.common.amqp.consumer.base_consumer import BaseConsumer
+from src.common.logger.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class SharedConnectionConsumer(BaseConsumer):
+    """A BaseConsumer that doesn't own its connection. It consumes its queue on its own channel of the
+    MultiQueueConsumer's connection, with its own prefetch, worker pool, retries etc. Connection level events are
+    handled by the parent.
+
+    """
+
+    def __init__(self, parent: "MultiQueueConsumer", *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._parent = parent
+
+    def attach(self, connection: pika.SelectConnection):
+        """Called by the parent once the shared connection is open"""
+        self._connection = connection
+        self._closing = False
+        self.open_channel()
+
+    def on_channel_closed(self, channel: Channel, reason: Exception):
+        """Invoked by pika when this consumer's channel is closed. Let the parent decide whether the connection goes
+        too - other queues may still be draining on it.
+
+        :param pika.channel.Channel: The closed channel
+        :param Exception reason: why the channel was closed
+
+        """
+        logger.warning("Channel %i was closed: %s", channel, reason)
+        self._channel = None
+        self._consuming = False
+        self._parent.on_child_channel_closed(self)
+
+    def stop(self):
+        """Start draining this queue. Unlike BaseConsumer.stop() this doesn't run the ioloop - the parent does, once
+        for all queues.
+
+        """
+        if not self._closing:
+            self._closing = True
+            logger.info(f"Stopping consumer for {self._queue}")
+            if self._consuming:
+                self.stop_consuming()
+            elif self._channel is not None and self._channel.is_open:
+                # Still declaring its topology - nothing to drain
+                self.close_channel()
+
+
+class MultiQueueConsumer(object):
+    """Serves several queues from one process over a single AMQP connection, so small queues don't each need their
+    own pod (and their own copy of the langchain/vertexai/boto3 imports). Every queue gets its own channel,
+    prefetch and worker pool.
+
+    Exposes the same run/stop/should_reconnect/was_consuming surface as BaseConsumer so ReconnectingQueueConsumer
+    can drive it.
+
+    """
+
+    def __init__(self, consumer_kwargs_list: List[dict], amqp_url: Optional[str] = config.RABBIT_URL):
+        """
+        :param list consumer_kwargs_list: BaseConsumer kwargs, one dict per queue
+        :param str amqp_url: The AMQP url to connect with
+        """
+        self.should_reconnect = False
+
+        self._url = amqp_url
+        self._connection = None
+        self._closing = False
+        self._consumers = [
+            SharedConnectionConsumer(self, amqp_url=amqp_url, **consumer_kwargs)
+            for consumer_kwargs in consumer_kwargs_list
+        ]
+
+    @property
+    def was_consuming(self) -> bool:
+        return any(consumer.was_consuming for consumer in self._consumers)
+
+    def connect(self) -> pika.SelectConnection:
+        logger.info("Connecting to %s", self._url)
+
+        return pika.SelectConnection(
+            parameters=pika.URLParameters(self._url),
+            on_open_callback=self.on_connection_open,
+            on_open_error_callback=self.on_connection_open_error,
+            on_close_callback=self.on_connection_closed,
+        )
+
+    def on_connection_open(self, connection: pika.SelectConnection):
+        logger.info(f"Connection opened, starting {len(self._consumers)} queue consumer(s)")
+        for consumer in self._consumers:
+            consumer.attach(connection)
+
+    def on_connection_open_error(self, _unused_connection: pika.SelectConnection, err: Exception):
+        logger.error("Connection open failed: %s", err)
+        self.reconnect()
+
+    def on_connection_closed(self, _unused_connection: pika.SelectConnection, reason: Exception):
+        for consumer in self._consumers:
+            consumer._channel = None
+            consumer._consuming = False
+
+        if self._closing:
+            self._connection.ioloop.stop()
+
+        else:
+            logger.warning("Connection closed, reconnect necessary: %s", reason)
+            self.reconnect()
+
+    def on_child_channel_closed(self, consumer: SharedConnectionConsumer):
+        if not self._closing:
+            # Same as BaseConsumer - an unexpected channel close means something is wrong, start over
+            logger.warning(f"Channel for {consumer._queue} closed unexpectedly, closing connection")
+            self.close_connection()
+
+        elif all(consumer._channel is None for consumer in self._consumers):
+            # Every queue has drained
+            self.close_connection()
+
+    def reconnect(self):
+        self.should_reconnect = True
+        self.stop()
+
+    def close_connection(self):
+        if self._connection.is_closing or self._connection.is_closed:
+            logger.info("Connection is closing or already closed")
+        else:
+            logger.info("Closing connection")
+            self._connection.close()
+
+    def run(self):
+        self._connection = self.connect()
+        self._connection.ioloop.start()
+
+    def stop(self):
+        """Drain every queue, then close the shared connection. Like BaseConsumer.stop(), the ioloop is started
+        again so the Basic.Cancel/ack/Channel.Close traffic can go out.
+
+        """
+        if not self._closing:
+            self._closing = True
+            logger.info("Stopping")
+
+            if any(consumer._channel is not None for consumer in self._consumers):
+                for consumer in self._consumers:
+                    consumer.stop()
+
+                self._connection.ioloop.start()
+
+            else:
+                self._connection.ioloop.stop()
+
+            for consumer in self._consumers:
+                consumer.shutdown_executor()
+                consumer.metrics.reset()
+
+            logger.info("Stopped")
@@ -0,0 +1,41 @@
+import heapq
+import itertools
+import time
+
+from typing import Any, List, Optional
+
+
+class PriorityScheduler(object):
+    """Local ordering of prefetched deliveries by their AMQP priority, highest first, with aging so low priority
+    work can't starve behind a steady stream of high priority messages.
+
+    An item's effective priority is priority + waited_secs / aging_interval, i.e. it gains one priority level for
+    every aging_interval secs it waits. Since every item ages at the same rate, the ordering only depends on
+    priority - enqueued_at / aging_interval, which never changes, so a plain heap works. Not thread-safe - only use
+    it from the ioloop thread.
+
+    """
+
+    def __init__(self, aging_interval: float):
+        """
+        :param float aging_interval: Secs of waiting worth one priority level
+        """
+        self._aging_interval = aging_interval
+        self._heap = []
+        # Tie-breaker so equal keys stay FIFO and items never get compared
+        self._counter = itertools.count()
+
+    def push(self, item: Any, priority: Optional[int] = None):
+        key = time.monotonic() / self._aging_interval - (priority or 0)
+        heapq.heappush(self._heap, (key, next(self._counter), item))
+
+    def pop(self) -> Any:
+        return heapq.heappop(self._heap)[-1]
+
+    def pop_all(self) -> List[Any]:
+        items = [entry[-1] for entry in sorted(self._heap)]
+        self._heap = []
+        return items
+
+    def __len__(self) -> int:
+        return len(self._heap)
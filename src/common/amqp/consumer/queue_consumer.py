@@ -1,9 +1,11 @@
 import time
 
-from typing import Optional
+from typing import Callable, List, Optional
 
 from src.common.logger.logger import get_logger
 from src.common.amqp.consumer.base_consumer import BaseConsumer, BaseAsyncIOConsumer
+from src.common.amqp.consumer.multi_queue_consumer import MultiQueueConsumer
+from src.common.amqp.utils.sanitize import RedactionSpec
 
 
 logger = get_logger(__name__)
@@ -29,6 +31,17 @@ class ReconnectingQueueConsumer(object):
         exchange_type: str,
         priority: int = None,
         reconnect_delay: Optional[int] = 5,
+        prefetch_count: Optional[int] = 1,
+        max_workers: Optional[int] = None,
+        use_process_pool: Optional[bool] = False,
+        process_initializer: Optional[Callable] = None,
+        deduplicate: Optional[bool] = False,
+        retry_max_attempts: Optional[int] = None,
+        local_priority_scheduling: Optional[bool] = False,
+        batch_size: Optional[int] = None,
+        batch_timeout_ms: Optional[int] = None,
+        redaction_spec: Optional[RedactionSpec] = None,
+        job_finalizer: Optional[Callable] = None,
     ):
         self._reconnect_delay = reconnect_delay
         self._amqp_url = amqp_url
@@ -38,7 +51,24 @@ class ReconnectingQueueConsumer(object):
         self.exchange_type = exchange_type
         self.callback = callback
         self.priority = priority
-        self._consumer = self._base_consumer(
+        self.prefetch_count = prefetch_count
+        self.max_workers = max_workers
+        self.use_process_pool = use_process_pool
+        self.process_initializer = process_initializer
+        self.deduplicate = deduplicate
+        self.retry_max_attempts = retry_max_attempts
+        self.local_priority_scheduling = local_priority_scheduling
+        self.batch_size = batch_size
+        self.batch_timeout_ms = batch_timeout_ms
+        self.redaction_spec = redaction_spec
+        self.job_finalizer = job_finalizer
+        self._consumer = self._create_consumer()
+
+    def _create_consumer(self):
+        return self._base_consumer(**self._consumer_kwargs())
+
+    def _consumer_kwargs(self) -> dict:
+        return dict(
             queue_name=self.queue_name,
             routing_key=self.routing_key,
             callback=self.callback,
@@ -46,6 +76,17 @@ class ReconnectingQueueConsumer(object):
             exchange_name=self.exchange_name,
             exchange_type=self.exchange_type,
             priority=self.priority,
+            prefetch_count=self.prefetch_count,
+            max_workers=self.max_workers,
+            use_process_pool=self.use_process_pool,
+            process_initializer=self.process_initializer,
+            deduplicate=self.deduplicate,
+            retry_max_attempts=self.retry_max_attempts,
+            local_priority_scheduling=self.local_priority_scheduling,
+            batch_size=self.batch_size,
+            batch_timeout_ms=self.batch_timeout_ms,
+            redaction_spec=self.redaction_spec,
+            job_finalizer=self.job_finalizer,
         )
 
     def run(self):
@@ -67,14 +108,7 @@ class ReconnectingQueueConsumer(object):
             reconnect_delay = self._get_reconnect_delay()
             logger.info("Reconnecting after %d seconds", reconnect_delay)
             time.sleep(reconnect_delay)
-            self._consumer = self._base_consumer(
-                queue_name=self.queue_name,
-                routing_key=self.routing_key,
-                callback=self.callback,
-                amqp_url=self._amqp_url,
-                exchange_name=self.exchange_name,
-                priority=self.priority,
-            )
+            self._consumer = self._create_consumer()
 
     def _get_reconnect_delay(self):
         if self._consumer.was_consuming:
@@ -93,10 +127,42 @@ class ReconnectingQueueConsumer(object):
 
 
 class ReconnectingAsyncIOQueueConsumer(ReconnectingQueueConsumer):
+    """Reconnecting wrapper around BaseAsyncIOConsumer. Every consumer it creates runs on the same asyncio event
+    loop, so async def message processors can run max_concurrency messages at a time in one thread.
+
+    """
+
     @staticmethod
     def _base_consumer(*args, **kwargs):
         return BaseAsyncIOConsumer(*args, **kwargs)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, max_concurrency: Optional[int] = 1, **kwargs):
+        # Needs to be set before super().__init__() creates the first consumer
+        self.max_concurrency = max_concurrency
         super().__init__(*args, **kwargs)
-        raise NotImplementedError(f"ReconnectingAsyncIOQueueConsumer has not been tested")
+
+    def _consumer_kwargs(self) -> dict:
+        kwargs = super()._consumer_kwargs()
+        kwargs["max_concurrency"] = self.max_concurrency
+        return kwargs
+
+
+class ReconnectingMultiQueueConsumer(ReconnectingQueueConsumer):
+    """Reconnecting wrapper around MultiQueueConsumer - several queues, one connection, one channel per queue. A
+    reconnect recreates every queue's consumer.
+
+    """
+
+    def __init__(self, amqp_url: str, consumer_kwargs_list: List[dict], reconnect_delay: Optional[int] = 5):
+        """
+        :param str amqp_url: The AMQP url to connect with
+        :param list consumer_kwargs_list: BaseConsumer kwargs (queue_name, routing_key, callback, ...), one per queue
+        :param int reconnect_delay: Initial reconnect delay in secs
+        """
+        self._reconnect_delay = reconnect_delay
+        self._amqp_url = amqp_url
+        self.consumer_kwargs_list = consumer_kwargs_list
+        self._consumer = self._create_consumer()
+
+    def _create_consumer(self):
+        return MultiQueueConsumer(self.consumer_kwargs_list, amqp_url=self._amqp_url)
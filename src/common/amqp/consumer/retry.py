@@ -0,0 +1,122 @@
+import pika
+import time
+
+from typing import Optional
+
+import src.config as config
+
+from src.common.amqp.publisher.publisher_pool import get_publisher_pool
+from src.common.logger.logger import get_logger
+from src.common.metrics.tracing import inject
+
+
+logger = get_logger(__name__)
+
+
+class RetryPolicy(object):
+    """Delayed retries for failed messages, then a dead-letter queue.
+
+    A failed message is republished to the x-delayed-message exchange with an exponential x-delay, routed back to
+    only this queue through a dedicated retry.<queue> binding. The number of failures so far travels in the
+    x-retry-count header. Once max_attempts is reached it goes to <queue>.dead_letter instead.
+
+    """
+
+    RETRY_COUNT_HEADER = "x-retry-count"
+
+    def __init__(
+        self,
+        queue_name: str,
+        max_attempts: int,
+        base_delay_ms: Optional[int] = config.RETRY_BASE_DELAY_MS,
+        max_delay_ms: Optional[int] = config.RETRY_MAX_DELAY_MS,
+        delay_exchange_name: Optional[str] = config.DELAY_EXCHANGE_NAME,
+        amqp_url: Optional[str] = None,
+    ):
+        """
+        :param str queue_name: The queue being consumed
+        :param int max_attempts: Total attempts including the first delivery
+        :param int base_delay_ms: Delay before the first retry, doubled for every further one
+        :param int max_delay_ms: Cap on the delay
+        :param str delay_exchange_name: The x-delayed-message exchange
+        :param str amqp_url: The AMQP url to publish retries with
+        """
+        self.queue_name = queue_name
+        self.max_attempts = max_attempts
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.delay_exchange_name = delay_exchange_name
+        self.amqp_url = amqp_url
+
+    @property
+    def retry_routing_key(self) -> str:
+        return f"retry.{self.queue_name}"
+
+    @property
+    def dead_letter_queue(self) -> str:
+        return f"{self.queue_name}.dead_letter"
+
+    def get_retry_count(self, properties: Optional[pika.BasicProperties]) -> int:
+        if properties is None or not properties.headers:
+            return 0
+
+        return int(properties.headers.get(self.RETRY_COUNT_HEADER, 0))
+
+    def get_delay_ms(self, retry_count: int) -> int:
+        return min(self.base_delay_ms * 2 ** (retry_count - 1), self.max_delay_ms)
+
+    def handle_failure(self, properties: Optional[pika.BasicProperties], body: bytes) -> bool:
+        """Republish a failed message for a delayed retry, or to the dead-letter queue once out of attempts.
+
+        :return: True if it was republished and the original delivery can be acked. False if publishing failed, so
+            the original should be requeued instead of being lost
+        """
+        retry_count = self.get_retry_count(properties) + 1
+        # The retry continues the failed attempt's trace - or keeps the publisher's traceparent outside of a span
+        headers = inject((properties.headers if properties is not None else None) or {})
+        headers[self.RETRY_COUNT_HEADER] = retry_count
+        priority = properties.priority if properties is not None else None
+
+        try:
+            if retry_count < self.max_attempts:
+                delay_ms = self.get_delay_ms(retry_count)
+                headers["x-delay"] = delay_ms
+                logger.warning(f"Retrying message in {delay_ms} ms (attempt {retry_count + 1}/{self.max_attempts})")
+
+                get_publisher_pool(self.amqp_url).publish(
+                    self.delay_exchange_name,
+                    self.retry_routing_key,
+                    body,
+                    properties=self._retry_properties(properties, headers, priority),
+                )
+
+            else:
+                headers.pop("x-delay", None)
+                logger.error(f"Giving up after {retry_count} attempt(s), moving message to {self.dead_letter_queue}")
+
+                # Default exchange routes straight to the queue with the same name
+                get_publisher_pool(self.amqp_url).publish(
+                    "",
+                    self.dead_letter_queue,
+                    body,
+                    properties=self._retry_properties(properties, headers, priority),
+                )
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to republish failed message, requeueing it. E:{e}", exc_info=True)
+            return False
+
+    @staticmethod
+    def _retry_properties(
+        properties: Optional[pika.BasicProperties], headers: dict, priority: Optional[int]
+    ) -> pika.BasicProperties:
+        return pika.BasicProperties(
+            delivery_mode=2,
+            timestamp=int(time.time()),
+            headers=headers,
+            priority=priority,
+            content_type=properties.content_type if properties is not None else None,
+            message_id=properties.message_id if properties is not None else None,
+        )
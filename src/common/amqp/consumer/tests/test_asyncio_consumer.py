@@ -0,0 +1,20 @@
+import pytest
+
+from src.common.amqp.consumer.base_consumer import BaseAsyncIOConsumer
+
+
+def test_process_pool_rejected():
+    with pytest.raises(ValueError):
+        BaseAsyncIOConsumer("queue", "key", print, use_process_pool=True)
+
+
+@pytest.mark.parametrize("kwargs", [{"batch_size": 10}, {"local_priority_scheduling": True, "max_workers": 4}])
+def test_batching_and_priority_scheduling_rejected(kwargs):
+    with pytest.raises(ValueError):
+        BaseAsyncIOConsumer("queue", "key", print, **kwargs)
+
+
+def test_prefetch_covers_concurrency():
+    consumer = BaseAsyncIOConsumer("queue", "key", print, max_concurrency=4)
+
+    assert consumer._prefetch_count == 4
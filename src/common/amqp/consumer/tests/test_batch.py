@@ -0,0 +1,95 @@
+import pytest
+
+import src.config as config
+
+from concurrent.futures import Future
+
+from src.common.amqp.consumer.base_consumer import BaseConsumer, batch_item_results
+
+
+def test_none_and_true_mean_all_succeeded():
+    assert batch_item_results(None, 3) == [True, True, True]
+    assert batch_item_results(True, 2) == [True, True]
+
+
+def test_false_means_all_failed():
+    assert batch_item_results(False, 2) == [False, False]
+
+
+def test_per_message_flags():
+    assert batch_item_results([True, 0, "ok"], 3) == [True, False, True]
+    assert batch_item_results((False, True), 2) == [False, True]
+
+
+def test_wrong_length_is_not_retried():
+    assert batch_item_results([False], 3) == [True, True, True]
+
+
+def test_unexpected_type_is_not_retried():
+    assert batch_item_results({"a": 1}, 2) == [True, True]
+    assert batch_item_results(1, 1) == [True]
+
+
+def test_batching_rejected_with_process_pool():
+    with pytest.raises(ValueError):
+        BaseConsumer("queue", "key", print, batch_size=10, use_process_pool=True)
+
+
+class FakeIOLoop(object):
+    def __init__(self):
+        self.callbacks = []
+        self.timers = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+    def call_later(self, delay, callback):
+        self.timers.append((delay, callback))
+
+
+class FakeConnection(object):
+    is_closed = False
+
+    def __init__(self):
+        self.ioloop = FakeIOLoop()
+
+
+class FakeDeliver(object):
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
+def test_failed_batch_future_is_nacked():
+    consumer = BaseConsumer("queue", "key", print)
+    consumer._connection = FakeConnection()
+    nacked = []
+    consumer.on_message_callback = lambda basic_deliver, ack=True: nacked.append((basic_deliver.delivery_tag, ack))
+
+    future = Future()
+    consumer._futures[future] = [FakeDeliver(1), FakeDeliver(2)]
+    future.set_exception(RuntimeError("can't pickle"))
+    consumer._reap_future(future)
+
+    for callback in consumer._connection.ioloop.callbacks:
+        callback()
+
+    assert nacked == [(1, False), (2, False)]
+    assert not consumer._futures
+
+
+def test_in_progress_duplicate_is_requeued_after_delay():
+    consumer = BaseConsumer("queue", "key", print)
+    consumer._connection = FakeConnection()
+    settled = []
+    consumer.on_message_callback = lambda basic_deliver, ack=True: settled.append((basic_deliver.delivery_tag, ack))
+
+    consumer.settle_delivery(FakeDeliver(3), None)
+    consumer._connection.ioloop.callbacks.pop()()
+
+    assert settled == []
+    delay, callback = consumer._connection.ioloop.timers.pop()
+    assert delay == config.DEDUP_REQUEUE_DELAY
+
+    callback()
+    consumer._connection.ioloop.callbacks.pop()()
+    assert settled == [(3, False)]
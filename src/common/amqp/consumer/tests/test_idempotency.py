@@ -0,0 +1,133 @@
+import pickle
+
+import pika
+import pytest
+
+from src.common.amqp.consumer import idempotency
+from src.common.amqp.consumer.base_consumer import process_message
+from src.common.amqp.consumer.idempotency import IdempotencyGuard
+
+
+class FakeRedis(object):
+    """The part of redis.Redis the guard uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+
+        self.values[key] = value
+        self.ttls[key] = ex
+        return True
+
+    def get(self, key):
+        # redis.Redis returns bytes without decode_responses
+        value = self.values.get(key)
+        return value.encode() if value is not None else None
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class BrokenRedis(object):
+    def __getattr__(self, name):
+        raise ConnectionError("redis down")
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(idempotency, "get_connection", lambda: fake)
+    return fake
+
+
+def make_guard() -> IdempotencyGuard:
+    return IdempotencyGuard("jobs", done_ttl=100, processing_ttl=10)
+
+
+def test_message_key_prefers_message_id():
+    assert IdempotencyGuard.message_key(pika.BasicProperties(message_id="m1"), b"body", True) == "id:m1"
+    assert IdempotencyGuard.message_key(None, b"body", True) == IdempotencyGuard.message_key(None, "body", True)
+    assert IdempotencyGuard.message_key(None, b"a", True).startswith("sha256:")
+    assert IdempotencyGuard.message_key(None, b"a", True) != IdempotencyGuard.message_key(None, b"b", True)
+
+
+def test_body_hash_is_opt_in():
+    assert IdempotencyGuard.message_key(pika.BasicProperties(message_id="m1"), b"body", False) == "id:m1"
+    assert IdempotencyGuard.message_key(pika.BasicProperties(), b"body", False) is None
+    assert IdempotencyGuard.message_key(None, b"body", False) is None
+
+
+def test_duplicate_is_requeued_while_processing(redis):
+    guard = make_guard()
+
+    assert guard.begin("id:m1") == IdempotencyGuard.CLAIMED
+    assert redis.values["amqp_dedup:jobs:id:m1"] == IdempotencyGuard.PROCESSING
+    assert redis.ttls["amqp_dedup:jobs:id:m1"] == 10
+    assert guard.begin("id:m1") == IdempotencyGuard.PROCESSING
+
+
+def test_done_message_is_skipped(redis):
+    guard = make_guard()
+    guard.begin("id:m1")
+    guard.complete("id:m1")
+
+    assert redis.values["amqp_dedup:jobs:id:m1"] == IdempotencyGuard.DONE
+    assert redis.ttls["amqp_dedup:jobs:id:m1"] == 100
+    assert guard.begin("id:m1") == IdempotencyGuard.DONE
+
+
+def test_released_message_can_run_again(redis):
+    guard = make_guard()
+    guard.begin("id:m1")
+    guard.release("id:m1")
+
+    assert guard.begin("id:m1") == IdempotencyGuard.CLAIMED
+
+
+def test_fails_open_without_redis(monkeypatch):
+    guard = make_guard()
+
+    monkeypatch.setattr(idempotency, "get_connection", lambda: None)
+    assert guard.begin("id:m1") == IdempotencyGuard.CLAIMED
+
+    monkeypatch.setattr(idempotency, "get_connection", lambda: BrokenRedis())
+    assert guard.begin("id:m1") == IdempotencyGuard.CLAIMED
+    guard.complete("id:m1")
+    guard.release("id:m1")
+
+
+def test_process_message_skips_done_and_requeues_in_progress(redis):
+    guard = make_guard()
+    calls = []
+
+    def run(key):
+        return process_message(calls.append, b'{"a": 1}', idempotency_guard=guard, idempotency_key=key)
+
+    assert run("id:m1") is True
+    assert run("id:m1") is True
+    assert len(calls) == 1
+
+    guard.begin("id:m2")
+    assert run("id:m2") is None
+    assert len(calls) == 1
+
+
+def test_client_is_reused_and_not_pickled(monkeypatch):
+    connections = []
+
+    def get_connection():
+        connections.append(FakeRedis())
+        return connections[-1]
+
+    monkeypatch.setattr(idempotency, "get_connection", get_connection)
+    guard = make_guard()
+    guard.begin("id:m1")
+    guard.complete("id:m1")
+    guard.release("id:m1")
+
+    assert len(connections) == 1
+    assert pickle.loads(pickle.dumps(guard))._connection is None
@@ -0,0 +1,58 @@
+import pytest
+
+from src.common.amqp.consumer import priority_scheduler
+from src.common.amqp.consumer.priority_scheduler import PriorityScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(priority_scheduler, "time", fake)
+    return fake
+
+
+def test_highest_priority_first(clock):
+    scheduler = PriorityScheduler(aging_interval=10)
+    scheduler.push("low", 1)
+    scheduler.push("high", 9)
+    scheduler.push("none", None)
+
+    assert [scheduler.pop() for _ in range(3)] == ["high", "low", "none"]
+    assert len(scheduler) == 0
+
+
+def test_equal_priority_is_fifo(clock):
+    scheduler = PriorityScheduler(aging_interval=10)
+    for item in ("a", "b", "c"):
+        scheduler.push(item, 5)
+
+    assert [scheduler.pop() for _ in range(3)] == ["a", "b", "c"]
+
+
+def test_waiting_items_age_past_newer_higher_priority_ones(clock):
+    scheduler = PriorityScheduler(aging_interval=10)
+    scheduler.push("old low", 1)
+
+    # 30 secs = 3 levels: 1 + 3 beats a fresh 3, but not a fresh 5
+    clock.now += 30
+    scheduler.push("new 3", 3)
+    scheduler.push("new 5", 5)
+
+    assert [scheduler.pop() for _ in range(3)] == ["new 5", "old low", "new 3"]
+
+
+def test_pop_all_drains_in_order(clock):
+    scheduler = PriorityScheduler(aging_interval=10)
+    scheduler.push("low", 1)
+    scheduler.push("high", 9)
+
+    assert scheduler.pop_all() == ["high", "low"]
+    assert len(scheduler) == 0
@@ -0,0 +1,119 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from src.common.amqp.consumer.base_consumer import BaseConsumer
+
+
+class FakeIOLoop(object):
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+
+class FakeConnection(object):
+    is_closed = False
+
+    def __init__(self):
+        self.ioloop = FakeIOLoop()
+
+
+class FakeChannel(object):
+    is_open = True
+
+    def __init__(self):
+        self.nacked = []
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacked.append((delivery_tag, requeue))
+
+
+class FakeDeliver(object):
+    def __init__(self, delivery_tag, redelivered=False):
+        self.delivery_tag = delivery_tag
+        self.redelivered = redelivered
+
+
+class FakeExecutor(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.jobs = []
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+
+        self.jobs.append(fn)
+        return Future()
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+def make_consumer(monkeypatch, executor) -> BaseConsumer:
+    consumer = BaseConsumer("queue", "key", print)
+    consumer._use_process_pool = True
+    consumer._executor = executor
+    consumer._connection = FakeConnection()
+    consumer._channel = FakeChannel()
+    monkeypatch.setattr(consumer, "create_process_pool", lambda: FakeExecutor())
+    return consumer
+
+
+def test_broken_pool_is_replaced_on_submit(monkeypatch):
+    broken = FakeExecutor(BrokenProcessPool("child died"))
+    consumer = make_consumer(monkeypatch, broken)
+    basic_deliver = FakeDeliver(1)
+    consumer._in_flight[1] = basic_deliver
+
+    consumer.submit_work(basic_deliver, b"{}", "application/json")
+
+    assert broken.shut_down is True
+    assert consumer._executor is not broken
+    assert len(consumer._executor.jobs) == 1
+    assert list(consumer._futures.values()) == [basic_deliver]
+    assert consumer._channel.nacked == []
+
+
+def test_failed_submit_is_requeued(monkeypatch):
+    consumer = make_consumer(monkeypatch, FakeExecutor(RuntimeError("shut down")))
+    basic_deliver = FakeDeliver(1)
+    consumer._in_flight[1] = basic_deliver
+
+    consumer.submit_work(basic_deliver, b"{}", "application/json")
+
+    assert consumer._channel.nacked == [(1, True)]
+    assert not consumer._in_flight
+    assert not consumer._futures
+
+
+def run_broken_job(consumer: BaseConsumer, basic_deliver: FakeDeliver) -> list:
+    settled = []
+    consumer.on_message_callback = lambda basic_deliver, ack=True: settled.append((basic_deliver.delivery_tag, ack))
+
+    broken = consumer._executor
+    future = Future()
+    consumer._futures[future] = basic_deliver
+    future.set_exception(BrokenProcessPool("child died"))
+    consumer._on_process_work_done(broken, basic_deliver, None, future)
+
+    for callback in consumer._connection.ioloop.callbacks:
+        callback()
+
+    assert consumer._executor is not broken
+    return settled
+
+
+def test_job_that_broke_the_pool_is_requeued_once(monkeypatch):
+    consumer = make_consumer(monkeypatch, FakeExecutor())
+
+    assert run_broken_job(consumer, FakeDeliver(1)) == [(1, False)]
+
+
+def test_job_that_broke_the_pool_twice_is_not_requeued(monkeypatch):
+    consumer = make_consumer(monkeypatch, FakeExecutor())
+
+    # No retry policy, so it is dropped like any other failure
+    assert run_broken_job(consumer, FakeDeliver(1, redelivered=True)) == [(1, True)]
@@ -0,0 +1,89 @@
+import pika
+import pytest
+
+from src.common.amqp.consumer import retry
+from src.common.amqp.consumer.retry import RetryPolicy
+from src.common.metrics.tracing import TRACEPARENT_HEADER, extract, start_span
+
+
+class FakePublisherPool(object):
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.published = []
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        if self.fail:
+            raise ConnectionError("broker down")
+
+        self.published.append((exchange, routing_key, body, properties))
+
+
+@pytest.fixture
+def publisher_pool(monkeypatch):
+    pool = FakePublisherPool()
+    monkeypatch.setattr(retry, "get_publisher_pool", lambda amqp_url=None: pool)
+    return pool
+
+
+def make_policy(max_attempts: int = 3) -> RetryPolicy:
+    return RetryPolicy("jobs", max_attempts, base_delay_ms=1000, max_delay_ms=5000, delay_exchange_name="delay")
+
+
+def test_delay_doubles_and_is_capped():
+    policy = make_policy()
+
+    assert [policy.get_delay_ms(n) for n in range(1, 6)] == [1000, 2000, 4000, 5000, 5000]
+
+
+def test_retry_count_from_headers():
+    policy = make_policy()
+
+    assert policy.get_retry_count(None) == 0
+    assert policy.get_retry_count(pika.BasicProperties()) == 0
+    assert policy.get_retry_count(pika.BasicProperties(headers={"x-retry-count": "2"})) == 2
+
+
+def test_first_failure_is_retried_with_delay(publisher_pool):
+    policy = make_policy()
+    properties = pika.BasicProperties(headers={"tenant": "a"}, priority=5, message_id="m1")
+
+    assert policy.handle_failure(properties, b"body") is True
+
+    exchange, routing_key, body, published_properties = publisher_pool.published[0]
+    assert (exchange, routing_key, body) == ("delay", "retry.jobs", b"body")
+    assert published_properties.headers == {"tenant": "a", "x-retry-count": 1, "x-delay": 1000}
+    assert published_properties.priority == 5
+    assert published_properties.message_id == "m1"
+
+
+def test_last_attempt_goes_to_dead_letter_queue(publisher_pool):
+    policy = make_policy(max_attempts=3)
+    properties = pika.BasicProperties(headers={"x-retry-count": 2, "x-delay": 2000})
+
+    assert policy.handle_failure(properties, b"body") is True
+
+    exchange, routing_key, _, published_properties = publisher_pool.published[0]
+    assert (exchange, routing_key) == ("", "jobs.dead_letter")
+    assert published_properties.headers == {"x-retry-count": 3}
+
+
+def test_publish_failure_requeues(monkeypatch):
+    monkeypatch.setattr(retry, "get_publisher_pool", lambda amqp_url=None: FakePublisherPool(fail=True))
+
+    assert make_policy().handle_failure(None, b"body") is False
+
+
+def test_retry_continues_the_trace(publisher_pool):
+    policy = make_policy()
+    traceparent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    properties = pika.BasicProperties(headers={TRACEPARENT_HEADER: traceparent})
+
+    # Outside of a span the publisher's traceparent is kept as-is
+    policy.handle_failure(properties, b"body")
+    assert publisher_pool.published[0][3].headers[TRACEPARENT_HEADER] == traceparent
+
+    with start_span("jobs process", parent=extract(properties.headers)) as span:
+        policy.handle_failure(properties, b"body")
+
+    retried = extract(publisher_pool.published[1][3].headers)
+    assert (retried.trace_id, retried.span_id) == (span.context.trace_id, span.context.span_id)
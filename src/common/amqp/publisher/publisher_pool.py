@@ -0,0 +1,292 @@
+import atexit
+import pika
+import time
+
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+from pika.adapters.blocking_connection import BlockingChannel, BlockingConnection
+from pika.exceptions import AMQPChannelError, AMQPConnectionError, NackError, UnroutableError
+
+import src.config as config
+
+from src.common.logger.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def enable_async_confirms(channel: BlockingChannel, ack_nack_callback: Callable) -> bool:
+    """Put a BlockingChannel in confirm mode with a non-blocking ack/nack callback, so many messages can be published
+    back to back and confirmed together.
+
+    BlockingChannel.confirm_delivery() makes every basic_publish() wait for its own confirm, so this goes through
+    the underlying pika.channel.Channel (BlockingChannel._impl, pika 1.x). That is private API - if a pika upgrade
+    moves it, this returns False and the caller has to fall back to per-message confirms.
+
+    :return: Whether async confirms were enabled
+    """
+    impl = getattr(channel, "_impl", None)
+    confirm_delivery = getattr(impl, "confirm_delivery", None)
+
+    if confirm_delivery is None:
+        logger.warning("pika channel internals changed, falling back to one confirm round trip per message")
+        return False
+
+    confirm_delivery(ack_nack_callback=ack_nack_callback)
+    return True
+
+
+class PooledChannel(object):
+    """A BlockingConnection with a single confirm-mode channel on it. BlockingConnection isn't thread-safe, so each
+    pooled channel gets its own connection and is only ever used by the thread that checked it out.
+
+    """
+
+    def __init__(self, amqp_url: str):
+        self._url = amqp_url
+        self._connection = None
+        self._channel = None
+
+    @property
+    def is_open(self) -> bool:
+        return (
+            self._connection is not None
+            and self._connection.is_open
+            and self._channel is not None
+            and self._channel.is_open
+        )
+
+    def open(self):
+        self.close()
+
+        logger.info("Opening pooled publisher connection")
+        self._connection = pika.BlockingConnection(pika.URLParameters(self._url))
+        self._channel = self._connection.channel()
+
+        # basic_publish() now blocks until the broker confirms and raises NackError if it refuses the message
+        self._channel.confirm_delivery()
+
+    def get_channel(self) -> BlockingChannel:
+        if not self.is_open:
+            self.open()
+
+        else:
+            # Idle blocking connections only service heartbeats when asked to - do it on checkout, and if the broker
+            # already dropped us while idle, reconnect now rather than failing the publish
+            try:
+                self._connection.process_data_events(time_limit=0)
+
+            except AMQPConnectionError as e:
+                logger.warning(f"Pooled publisher connection lost while idle, reconnecting. E:{e}")
+                self.open()
+
+        return self._channel
+
+    def get_connection(self) -> BlockingConnection:
+        self.get_channel()
+        return self._connection
+
+    def close(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+
+        except Exception as e:
+            logger.warning(f"Error closing pooled publisher connection. E:{e}")
+
+        finally:
+            self._connection = None
+            self._channel = None
+
+
+class PublisherPool(object):
+    """Long-lived, thread-safe pool of publisher channels for one AMQP url. Channels are opened lazily, reused across
+    publishes and reopened if the connection is lost, so publishing no longer pays for a TCP + AMQP handshake each time.
+
+    """
+
+    def __init__(
+        self,
+        amqp_url: Optional[str] = None,
+        pool_size: Optional[int] = config.AMQP_PUBLISHER_POOL_SIZE,
+        checkout_timeout: Optional[float] = config.AMQP_PUBLISHER_CHECKOUT_TIMEOUT,
+        max_retries: Optional[int] = config.AMQP_PUBLISHER_MAX_RETRIES,
+    ):
+        if amqp_url is None:
+            amqp_url = config.RABBIT_URL
+
+        self._url = amqp_url
+        self._checkout_timeout = checkout_timeout
+        self._max_retries = max_retries
+
+        self._pool = LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(PooledChannel(self._url))
+
+    @contextmanager
+    def _checkout(self) -> Iterator[PooledChannel]:
+        try:
+            pooled_channel = self._pool.get(timeout=self._checkout_timeout)
+
+        except Empty:
+            raise TimeoutError(f"No publisher channel available after {self._checkout_timeout} secs")
+
+        try:
+            yield pooled_channel
+
+        except (AMQPConnectionError, AMQPChannelError):
+            pooled_channel.close()
+            raise
+
+        finally:
+            self._pool.put(pooled_channel)
+
+    @contextmanager
+    def channel(self) -> Iterator[BlockingChannel]:
+        """Check out a channel for the duration of the with block. If anything inside fails at the connection or
+        channel level, the pooled connection is dropped and will be reopened on its next checkout.
+
+        """
+        with self._checkout() as pooled_channel:
+            yield pooled_channel.get_channel()
+
+    def publish(
+        self,
+        exchange: str,
+        routing_key: str,
+        body: str,
+        properties: Optional[pika.BasicProperties] = None,
+    ):
+        """Publish a single message and wait for the broker to confirm it. Connection/channel errors are retried on
+        a fresh connection, a broker nack (pika.exceptions.NackError) is raised straight away.
+
+        """
+        for attempt in range(self._max_retries + 1):
+            try:
+                with self.channel() as channel:
+                    channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+                return
+
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                if attempt >= self._max_retries:
+                    raise
+
+                logger.warning(f"Publish to {exchange}/{routing_key} failed, retrying (attempt {attempt + 1}). E:{e}")
+
+    def publish_batch(
+        self,
+        exchange: str,
+        routing_key: str,
+        bodies: Sequence[str],
+        properties: Optional[Union[pika.BasicProperties, Sequence[pika.BasicProperties]]] = None,
+        confirm_timeout: Optional[float] = config.AMQP_PUBLISHER_CONFIRM_TIMEOUT,
+    ) -> List[bool]:
+        """Publish all bodies back to back on one channel, then wait once for the broker's confirms instead of a
+        round trip per message.
+
+        :param properties: Shared by every body, or a list with one per body
+        :return: One bool per body, True if the broker acked it. Nacked, unconfirmed (timeout) or unsent messages
+            are False so the caller can retry just those
+        """
+        results = [None] * len(bodies)
+        pending = [len(bodies)]
+        properties_list = properties if isinstance(properties, (list, tuple)) else [properties] * len(bodies)
+
+        def on_confirm(frame):
+            confirmed = isinstance(frame.method, pika.spec.Basic.Ack)
+            delivery_tag = frame.method.delivery_tag
+            # Delivery tags on a fresh confirm channel start at 1 and follow publish order
+            indexes = range(delivery_tag) if frame.method.multiple else (delivery_tag - 1,)
+
+            for index in indexes:
+                if results[index] is None:
+                    results[index] = confirmed
+                    pending[0] -= 1
+
+        try:
+            with self._checkout() as pooled_channel:
+                channel = None
+
+                try:
+                    connection = pooled_channel.get_connection()
+                    # A dedicated channel per batch, so delivery tags map straight onto indexes
+                    channel = connection.channel()
+
+                    if enable_async_confirms(channel, on_confirm):
+                        for body, body_properties in zip(bodies, properties_list):
+                            channel.basic_publish(
+                                exchange=exchange, routing_key=routing_key, body=body, properties=body_properties
+                            )
+
+                    else:
+                        channel.confirm_delivery()
+
+                        for index, (body, body_properties) in enumerate(zip(bodies, properties_list)):
+                            try:
+                                channel.basic_publish(
+                                    exchange=exchange, routing_key=routing_key, body=body, properties=body_properties
+                                )
+                                results[index] = True
+
+                            except (NackError, UnroutableError):
+                                results[index] = False
+
+                            pending[0] -= 1
+
+                    deadline = time.monotonic() + confirm_timeout
+                    while pending[0] > 0 and time.monotonic() < deadline:
+                        connection.process_data_events(time_limit=max(deadline - time.monotonic(), 0))
+
+                except (AMQPConnectionError, AMQPChannelError) as e:
+                    logger.error(
+                        f"Batch publish to {exchange}/{routing_key} failed after {len(bodies) - pending[0]} "
+                        f"confirm(s). E:{e}"
+                    )
+                    pooled_channel.close()
+
+                finally:
+                    if channel is not None and channel.is_open:
+                        channel.close()
+
+        except TimeoutError as e:
+            logger.error(f"Batch publish to {exchange}/{routing_key} failed. E:{e}")
+
+        return [result is True for result in results]
+
+    def close(self):
+        while True:
+            try:
+                pooled_channel = self._pool.get_nowait()
+
+            except Empty:
+                break
+
+            pooled_channel.close()
+
+
+_publisher_pools: Dict[str, PublisherPool] = {}
+_publisher_pools_lock = Lock()
+
+
+def get_publisher_pool(amqp_url: Optional[str] = None) -> PublisherPool:
+    """One shared PublisherPool per AMQP url for the whole process"""
+    if amqp_url is None:
+        amqp_url = config.RABBIT_URL
+
+    with _publisher_pools_lock:
+        if amqp_url not in _publisher_pools:
+            _publisher_pools[amqp_url] = PublisherPool(amqp_url)
+
+        return _publisher_pools[amqp_url]
+
+
+@atexit.register
+def close_publisher_pools():
+    with _publisher_pools_lock:
+        for publisher_pool in _publisher_pools.values():
+            publisher_pool.close()
+
+        _publisher_pools.clear()
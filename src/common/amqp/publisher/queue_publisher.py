@@ -1,44 +1,53 @@
-import json
 import pika
+import time
 
+from uuid import uuid4
+
+from src.common.amqp.publisher.publisher_pool import get_publisher_pool
+from src.common.amqp.utils.claim_check import offload_body
+from src.common.amqp.utils.codec import encode_message
 from src.common.logger.logger import get_logger
-from src.config import RABBIT_URL, TEST_DUMMY_AMQP_PUBLISH
+from src.common.metrics.tracing import SpanKind, inject, start_span
+from src.config import TEST_DUMMY_AMQP_PUBLISH
 
 
 logger = get_logger(__name__)
 
 
-def get_amqp_connection(amqp_url=None):
-    if amqp_url is None:
-        amqp_url = RABBIT_URL
-
-    connection = pika.BlockingConnection(pika.URLParameters(amqp_url))
-    return connection
-
-
-def publish_message(channel, exchange, routing_key, message, priority):
-    if TEST_DUMMY_AMQP_PUBLISH is False:
-        channel.basic_publish(
-            exchange=exchange,
-            routing_key=routing_key,
-            body=message,
-            properties=pika.BasicProperties(delivery_mode=2, priority=priority),
-        )
-
-    else:
+def publish_to_queue(exchange_name, routing_key, data, amqp_url=None, priority=None):
+    if TEST_DUMMY_AMQP_PUBLISH is True:
         logger.warning(
-            f"TEST_DUMMY_AMQP_PUBLISH is True - not publishing to queue. Got payload={message}, "
-            f"exchange={exchange}, routing_key={routing_key}, priority={priority}"
+            f"TEST_DUMMY_AMQP_PUBLISH is True - not publishing to queue. Got payload={data}, "
+            f"exchange={exchange_name}, routing_key={routing_key}, priority={priority}"
+        )
+        return
+
+    with start_span(
+        f"{exchange_name} publish",
+        kind=SpanKind.PRODUCER,
+        attributes={
+            "messaging.system": "rabbitmq",
+            "messaging.destination.name": exchange_name,
+            "messaging.rabbitmq.destination.routing_key": routing_key,
+        },
+    ):
+        message, content_type = encode_message(data)
+        # Large bodies go to object storage, only a reference is enqueued
+        message, headers = offload_body(message, content_type)
+
+        # Persistent pooled connection with publisher confirms instead of a new connection per message
+        get_publisher_pool(amqp_url).publish(
+            exchange_name,
+            routing_key,
+            message,
+            properties=pika.BasicProperties(
+                delivery_mode=2,
+                timestamp=int(time.time()),
+                priority=priority,
+                content_type=content_type,
+                # What consumers with deduplicate on recognise redeliveries by
+                message_id=uuid4().hex,
+                # The consumer's span picks up from here
+                headers=inject(headers),
+            ),
         )
-
-
-def publish_to_queue(exchange_name, routing_key, data, amqp_url=None, priority=None):
-    connection = get_amqp_connection(amqp_url)
-
-    try:
-        channel = connection.channel()
-        message = json.dumps(data)
-        publish_message(channel, exchange_name, routing_key, message, priority)
-
-    finally:
-        connection.close()
@@ -0,0 +1,117 @@
+import pika
+
+from pika.exceptions import ChannelClosedByBroker, NackError
+
+from src.common.amqp.publisher.publisher_pool import PublisherPool
+
+
+class Frame(object):
+    def __init__(self, method):
+        self.method = method
+
+
+class FakeImpl(object):
+    def __init__(self):
+        self.ack_nack_callback = None
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.ack_nack_callback = ack_nack_callback
+
+
+class FakeChannel(object):
+    """BlockingChannel with the pika 1.x internals publish_batch() uses for async confirms"""
+
+    def __init__(self, with_impl: bool = True, nack_bodies=()):
+        if with_impl:
+            self._impl = FakeImpl()
+        self.nack_bodies = nack_bodies
+        self.published = []
+        self.is_open = True
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append(body)
+        if not hasattr(self, "_impl") and body in self.nack_bodies:
+            raise NackError([])
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeConnection(object):
+    def __init__(self, channel: FakeChannel, frames=()):
+        self._channel = channel
+        self._frames = list(frames)
+
+    def channel(self):
+        return self._channel
+
+    def process_data_events(self, time_limit=0):
+        for frame in self._frames:
+            self._channel._impl.ack_nack_callback(frame)
+        self._frames = []
+
+
+class FakePooledChannel(object):
+    def __init__(self, connection: FakeConnection):
+        self._connection = connection
+
+    def get_connection(self):
+        return self._connection
+
+    def close(self):
+        pass
+
+
+def make_pool(connection: FakeConnection) -> PublisherPool:
+    pool = PublisherPool("amqp://localhost", pool_size=1)
+    pool._pool.get_nowait()
+    pool._pool.put(FakePooledChannel(connection))
+    return pool
+
+
+def test_confirms_map_onto_publish_order():
+    channel = FakeChannel()
+    frames = [
+        Frame(pika.spec.Basic.Ack(delivery_tag=2, multiple=True)),
+        Frame(pika.spec.Basic.Nack(delivery_tag=3)),
+        Frame(pika.spec.Basic.Ack(delivery_tag=4)),
+    ]
+    pool = make_pool(FakeConnection(channel, frames))
+
+    assert pool.publish_batch("ex", "key", [b"1", b"2", b"3", b"4"]) == [True, True, False, True]
+    assert channel.published == [b"1", b"2", b"3", b"4"]
+    assert not channel.is_open
+
+
+def test_unconfirmed_messages_fail_after_timeout():
+    pool = make_pool(FakeConnection(FakeChannel(), [Frame(pika.spec.Basic.Ack(delivery_tag=1))]))
+
+    assert pool.publish_batch("ex", "key", [b"1", b"2"], confirm_timeout=0.01) == [True, False]
+
+
+def test_falls_back_to_per_message_confirms():
+    channel = FakeChannel(with_impl=False, nack_bodies=(b"2",))
+    pool = make_pool(FakeConnection(channel))
+
+    assert pool.publish_batch("ex", "key", [b"1", b"2", b"3"]) == [True, False, True]
+
+
+class BrokenConnection(FakeConnection):
+    def channel(self):
+        raise ChannelClosedByBroker(406, "PRECONDITION_FAILED")
+
+
+def test_channel_open_failure_fails_every_message():
+    pool = make_pool(BrokenConnection(FakeChannel()))
+
+    assert pool.publish_batch("ex", "key", [b"1", b"2"]) == [False, False]
+
+
+def test_checkout_timeout_fails_every_message():
+    pool = PublisherPool("amqp://localhost", pool_size=1, checkout_timeout=0.01)
+    pool._pool.get_nowait()
+
+    assert pool.publish_batch("ex", "key", [b"1", b"2"]) == [False, False]
@@ -0,0 +1,117 @@
+import functools
+import uuid
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, Union
+
+import src.config as config
+
+from src.common.aws.aws import AWS, get_s3_object, put_s3_object
+from src.common.gs.gs import GS, download_bytes_from_gs, gs_bucket_key_to_uri, upload_bytes_to_gs
+from src.common.logger.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Set on messages whose body is an s3:// or gs:// reference to the real (encoded) body
+CLAIM_CHECK_HEADER = "x-claim-check"
+
+
+@dataclass(frozen=True)
+class ClaimCheck:
+    """Stands in for the body of a claim-checked delivery until a worker fetches it. Picklable, so it can go to
+    process pool children as is."""
+
+    reference: str
+
+
+def offload_body(body: bytes, content_type: Optional[str] = None) -> Tuple[bytes, Optional[dict]]:
+    """Claim-check pattern: bodies over AMQP_CLAIM_CHECK_THRESHOLD_BYTES are written to object storage and only a
+    reference is enqueued, so broker memory doesn't grow with document size.
+
+    The object is not deleted after the message is acked - retries and the dead-letter queue republish the same
+    reference - so the bucket needs a lifecycle rule on AMQP_CLAIM_CHECK_PREFIX, or delete_expired_claim_checks()
+    run periodically (scripts/cleanup_claim_checks.py).
+
+    :return: (body to publish, extra headers). Small bodies come back unchanged with no headers
+    """
+    if not config.AMQP_CLAIM_CHECK_THRESHOLD_BYTES or len(body) <= config.AMQP_CLAIM_CHECK_THRESHOLD_BYTES:
+        return body, None
+
+    key = f"{config.AMQP_CLAIM_CHECK_PREFIX}{uuid.uuid4()}"
+
+    if config.AMQP_CLAIM_CHECK_BACKEND == "gs":
+        upload_bytes_to_gs(GS().get_gs_client(), body, config.AMQP_CLAIM_CHECK_BUCKET, key, content_type=content_type)
+        reference = gs_bucket_key_to_uri(config.AMQP_CLAIM_CHECK_BUCKET, key)
+
+    else:
+        put_s3_object(AWS().get_s3_client(), config.AMQP_CLAIM_CHECK_BUCKET, key, body, content_type=content_type)
+        reference = f"s3://{config.AMQP_CLAIM_CHECK_BUCKET}/{key}"
+
+    logger.info(f"Offloaded {len(body)} B message body to {reference}")
+
+    return reference.encode(), {CLAIM_CHECK_HEADER: True}
+
+
+def is_claim_checked(headers: Optional[dict]) -> bool:
+    return bool(headers) and bool(headers.get(CLAIM_CHECK_HEADER))
+
+
+# Redeliveries and retries of the same message on this worker skip the download
+@functools.lru_cache(maxsize=config.AMQP_CLAIM_CHECK_CACHE_SIZE)
+def fetch_body(reference: str) -> bytes:
+    logger.info(f"Fetching claim-checked message body from {reference}")
+
+    scheme, _, path = reference.partition("://")
+    bucket, _, key = path.partition("/")
+
+    if scheme == "gs":
+        return download_bytes_from_gs(GS().get_gs_client(), bucket, key)
+
+    if scheme == "s3":
+        return get_s3_object(AWS().get_s3_client(), bucket, key)
+
+    raise ValueError(f"Unknown claim check reference: {reference}")
+
+
+def resolve_body(body: Union[bytes, ClaimCheck]) -> bytes:
+    """The real body for a delivery - fetched from object storage if it was claim-checked. Blocking, so call it
+    from a worker rather than the ioloop"""
+    if isinstance(body, ClaimCheck):
+        return fetch_body(body.reference)
+
+    return body
+
+
+def delete_expired_claim_checks(retention_days: int = config.AMQP_CLAIM_CHECK_RETENTION_DAYS) -> int:
+    """Delete offloaded bodies under AMQP_CLAIM_CHECK_PREFIX older than retention_days, for buckets without a
+    lifecycle rule. Anything still referenced by a queued, retried or dead-lettered message past that age can no
+    longer be fetched.
+
+    :return: How many objects were deleted
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    bucket, prefix = config.AMQP_CLAIM_CHECK_BUCKET, config.AMQP_CLAIM_CHECK_PREFIX
+    deleted = 0
+
+    if config.AMQP_CLAIM_CHECK_BACKEND == "gs":
+        gs = GS().get_gs_client()
+        for blob in gs.list_blobs(bucket, prefix=prefix, timeout=config.GCP_TIMEOUT):
+            if blob.time_created < cutoff:
+                blob.delete(timeout=config.GCP_TIMEOUT_SHORT)
+                deleted += 1
+
+    else:
+        s3 = AWS().get_s3_client()
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            expired = [{"Key": obj["Key"]} for obj in page.get("Contents", []) if obj["LastModified"] < cutoff]
+            if expired:
+                # Max 1000 keys per call, same as the page size
+                s3.delete_objects(Bucket=bucket, Delete={"Objects": expired, "Quiet": True})
+                deleted += len(expired)
+
+    logger.info(f"Deleted {deleted} claim-checked message bodies older than {retention_days} days from {bucket}")
+
+    return deleted
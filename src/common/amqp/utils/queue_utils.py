@@ -1,13 +1,18 @@
 """
 LL: THIS IS UNTESTED
 """
-import json
 import pika
+import time
 
-from typing import Optional
+from typing import List, Optional
+from uuid import uuid4
 
 from src.config import RABBIT_URL
+from src.common.amqp.publisher.publisher_pool import get_publisher_pool
+from src.common.amqp.utils.claim_check import offload_body
+from src.common.amqp.utils.codec import encode_message
 from src.common.logger.logger import get_logger
+from src.common.metrics.tracing import inject
 
 
 logger = get_logger(__name__)
@@ -22,21 +27,6 @@ def get_amqp_connection(amqp_url: Optional[str] = None) -> pika.BlockingConnecti
     return connection
 
 
-def publish_message(
-    channel: pika.channel.Channel,
-    exchange: str,
-    routing_key: str,
-    message: dict,
-    priority: Optional[int] = 0,
-):
-    channel.basic_publish(
-        exchange=exchange,
-        routing_key=routing_key,
-        body=message,
-        properties=pika.BasicProperties(delivery_mode=2, priority=priority),
-    )
-
-
 def publish_delayed_message(
     exchange_name: str,
     routing_key: str,
@@ -44,18 +34,21 @@ def publish_delayed_message(
     delay: str,
     priority: Optional[int] = None,
 ):
-    connection = get_amqp_connection()
-    try:
-        channel = connection.channel()
-        message = json.dumps(data)
-        channel.basic_publish(
-            exchange_name,
-            routing_key,
-            message,
-            properties=pika.BasicProperties(delivery_mode=2, headers={"x-delay": f"{delay}"}, priority=priority),
-        )
-    finally:
-        connection.close()
+    message, content_type = encode_message(data)
+    message, headers = offload_body(message, content_type)
+    get_publisher_pool().publish(
+        exchange_name,
+        routing_key,
+        message,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            timestamp=int(time.time()),
+            headers=inject({"x-delay": f"{delay}", **(headers or {})}),
+            priority=priority,
+            content_type=content_type,
+            message_id=uuid4().hex,
+        ),
+    )
 
 
 def publish(
@@ -65,16 +58,67 @@ def publish(
     amqp_url: Optional[str] = None,
     priority: Optional[int] = 0,
 ):
-    connection = get_amqp_connection(amqp_url)
+    message, content_type = encode_message(data)
+    message, headers = offload_body(message, content_type)
+    get_publisher_pool(amqp_url).publish(
+        exchange_name,
+        routing_key,
+        message,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            timestamp=int(time.time()),
+            priority=priority,
+            content_type=content_type,
+            # The consumer's span picks up from here
+            headers=inject(headers),
+            message_id=uuid4().hex,
+        ),
+    )
 
-    try:
-        channel = connection.channel()
-        message = json.dumps(data)
 
-        publish_message(channel, exchange_name, routing_key, message, priority)
+def publish_batch(
+    exchange_name: str,
+    routing_key: str,
+    messages: List[dict],
+    priority: Optional[int] = 0,
+    amqp_url: Optional[str] = None,
+) -> List[bool]:
+    """Publish many messages over one channel and wait for a single round of publisher confirms.
+
+    :return: Per-message success, in the same order as messages
+    """
+    bodies = []
+    properties = []
+    timestamp = int(time.time())
+
+    for data in messages:
+        body, content_type = encode_message(data)
+        body, headers = offload_body(body, content_type)
+        bodies.append(body)
+        # Per message, since only the claim-checked ones carry the header
+        properties.append(
+            pika.BasicProperties(
+                delivery_mode=2,
+                timestamp=timestamp,
+                priority=priority,
+                content_type=content_type,
+                headers=inject(headers),
+                message_id=uuid4().hex,
+            )
+        )
 
-    finally:
-        connection.close()
+    results = get_publisher_pool(amqp_url).publish_batch(exchange_name, routing_key, bodies, properties=properties)
+
+    failed = results.count(False)
+    if failed > 0:
+        logger.error(
+            f"publish_batch: {failed}/{len(messages)} message(s) to {exchange_name}/{routing_key} not confirmed"
+        )
+
+    else:
+        logger.info(f"publish_batch: {len(messages)} message(s) to {exchange_name}/{routing_key} confirmed")
+
+    return results
 
 
 def declare_exchange(
@@ -1,4 +1,8 @@
-from typing import Optional
+import json
+import logging
+import re
+
+from typing import Any, Iterable, Optional
 
 from src.common.logger.logger import get_logger
 
@@ -78,3 +82,128 @@ def print_sanitized_params(params: dict, hide_jwt: Optional[bool] = True, hide_l
             logger.info(f"{k}: Unable to serialize. E:{e}")
 
     logger.info("-" * 30)
+
+
+class RedactionSpec(object):
+    """Precompiled rules for logging message params: keys to leave out, keys whose values are redacted (matched
+    once against a single regex instead of ad-hoc "jwt" in k checks) and size/depth limits so printing a big
+    extraction payload stays cheap. Build one per WorkerConfig, it is reused for every message.
+
+    """
+
+    DEFAULT_DROP_KEYS = ("queue_consumer", "basic_deliver")
+    DEFAULT_REDACT_PATTERNS = (r"jwt", r"token", r"password", r"secret", r"api_?key", r"authorization")
+    REDACTED = "<redacted>"
+
+    def __init__(
+        self,
+        drop_keys: Optional[Iterable[str]] = DEFAULT_DROP_KEYS,
+        redact_patterns: Optional[Iterable[str]] = DEFAULT_REDACT_PATTERNS,
+        hide_list: Optional[bool] = True,
+        max_str_len: Optional[int] = 64,
+        max_depth: Optional[int] = 4,
+        max_items: Optional[int] = 32,
+        max_nodes: Optional[int] = 256,
+    ):
+        """
+        :param drop_keys: Keys that are left out entirely
+        :param redact_patterns: Regexes (case-insensitive, searched anywhere in the key) whose values are redacted
+        :param bool hide_list: Print lists as their length only
+        :param int max_str_len: Longer strings are truncated
+        :param int max_depth: Nesting depth below which containers are summarised
+        :param int max_items: Max entries printed per dict/list
+        :param int max_nodes: Max values printed in total, the walk stops once it is used up
+        """
+        self.drop_keys = frozenset(drop_keys or ())
+        patterns = tuple(redact_patterns or ())
+        self.redact_re = re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE) if patterns else None
+        self.hide_list = hide_list
+        self.max_str_len = max_str_len
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.max_nodes = max_nodes
+
+    def is_redacted(self, key: Any) -> bool:
+        return self.redact_re is not None and isinstance(key, str) and self.redact_re.search(key) is not None
+
+    def sanitize(self, params: Any) -> Any:
+        """Bounded copy of params for printing - never touches more than max_nodes values"""
+        budget = [self.max_nodes]
+        return self._sanitize(params, 0, budget)
+
+    def _sanitize(self, value: Any, depth: int, budget: list) -> Any:
+        budget[0] -= 1
+
+        if isinstance(value, str):
+            if len(value) > self.max_str_len:
+                return f"{value[:self.max_str_len]}..truncated for print.."
+            return value
+
+        if isinstance(value, dict):
+            if depth >= self.max_depth:
+                return f"Dict with {len(value)} keys"
+
+            sanitized = {}
+            for i, (k, v) in enumerate(value.items()):
+                if k in self.drop_keys:
+                    continue
+
+                if i >= self.max_items or budget[0] <= 0:
+                    sanitized["..."] = f"{len(value) - i} more keys"
+                    break
+
+                sanitized[k] = self.REDACTED if self.is_redacted(k) else self._sanitize(v, depth + 1, budget)
+
+            return sanitized
+
+        if isinstance(value, (list, tuple)):
+            if self.hide_list or depth >= self.max_depth:
+                return f"List with {len(value)} items"
+
+            sanitized = []
+            for i, v in enumerate(value):
+                if i >= self.max_items or budget[0] <= 0:
+                    sanitized.append(f"...{len(value) - i} more items")
+                    break
+
+                sanitized.append(self._sanitize(v, depth + 1, budget))
+
+            return sanitized
+
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+
+        text = repr(value)
+        if len(text) > self.max_str_len:
+            return f"{text[:self.max_str_len]}..truncated for print.."
+        return text
+
+
+DEFAULT_REDACTION_SPEC = RedactionSpec()
+
+
+class SanitizedParams(object):
+    """Deferred rendering of sanitized params - the walk and the JSON dump only happen if a handler actually formats
+    the record"""
+
+    __slots__ = ("params", "spec")
+
+    def __init__(self, params: Any, spec: Optional[RedactionSpec] = None):
+        self.params = params
+        self.spec = spec or DEFAULT_REDACTION_SPEC
+
+    def __str__(self) -> str:
+        try:
+            return json.dumps(self.spec.sanitize(self.params), default=str)
+
+        except Exception as e:
+            return f"<unable to serialize params. E:{e}>"
+
+
+def log_sanitized_params(params: Any, spec: Optional[RedactionSpec] = None, msg: Optional[str] = "Received message"):
+    """Single INFO record with the sanitized params, instead of print_sanitized_params()'s one line per key. Does no
+    work at all when INFO is disabled"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    logger.info(f"{msg} params=%s", SanitizedParams(params, spec))
@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+from src.common.amqp.utils import codec
+from src.common.amqp.utils.codec import (
+    JSON_CONTENT_TYPE,
+    MSGPACK_CONTENT_TYPE,
+    JsonCodec,
+    OrjsonCodec,
+    decode_message,
+    encode_message,
+    get_codec,
+)
+
+
+PAYLOAD = {"client_id": 17047, "text": "Grüße", "tags": ["a", "b"], "nested": {"score": 0.5, "none": None}}
+
+
+@pytest.mark.parametrize("codec_name", ["json", "orjson", "msgpack"])
+def test_round_trip(codec_name):
+    if codec_name == "orjson":
+        pytest.importorskip("orjson")
+    if codec_name == "msgpack":
+        pytest.importorskip("msgpack")
+
+    body, content_type = encode_message(PAYLOAD, codec_name)
+
+    assert decode_message(body, content_type) == PAYLOAD
+
+
+def test_json_and_orjson_share_the_wire_format():
+    pytest.importorskip("orjson")
+
+    body, content_type = encode_message(PAYLOAD, "orjson")
+
+    assert content_type == JSON_CONTENT_TYPE
+    assert JsonCodec().decode(body) == PAYLOAD
+
+
+def test_missing_content_type_decodes_as_json():
+    assert decode_message(b'{"a": 1}') == {"a": 1}
+    assert decode_message(b'{"a": 1}', "text/plain") == {"a": 1}
+
+
+def test_unknown_codec_falls_back_to_json():
+    assert get_codec("protobuf").content_type == JSON_CONTENT_TYPE
+
+
+def test_orjson_falls_back_to_stdlib_for_big_ints_and_nan():
+    pytest.importorskip("orjson")
+    orjson_codec = OrjsonCodec()
+
+    assert orjson_codec.decode(orjson_codec.encode({"big": 2 ** 70})) == {"big": 2 ** 70}
+    assert math.isnan(orjson_codec.decode(JsonCodec().encode({"x": float("nan")}))["x"])
+
+
+def test_msgpack_without_library_raises(monkeypatch):
+    monkeypatch.setattr(codec, "_msgpack_codec", None)
+
+    with pytest.raises(ValueError):
+        decode_message(b"\x80", MSGPACK_CONTENT_TYPE)
@@ -0,0 +1,50 @@
+import pytest
+
+from src.common.amqp.publisher import queue_publisher
+from src.common.amqp.utils import queue_utils
+from src.common.metrics.tracing import extract, start_span
+
+
+class FakePublisherPool(object):
+    def __init__(self):
+        self.properties = []
+
+    def publish(self, exchange_name, routing_key, body, properties=None):
+        self.properties.append(properties)
+
+    def publish_batch(self, exchange_name, routing_key, bodies, properties=None):
+        self.properties.extend(properties)
+        return [True] * len(bodies)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    fake = FakePublisherPool()
+    monkeypatch.setattr(queue_utils, "get_publisher_pool", lambda amqp_url=None: fake)
+    monkeypatch.setattr(queue_publisher, "get_publisher_pool", lambda amqp_url=None: fake)
+    monkeypatch.setattr(queue_publisher, "TEST_DUMMY_AMQP_PUBLISH", False)
+    return fake
+
+
+def publish_everywhere():
+    queue_publisher.publish_to_queue("ex", "key", {"a": 1})
+    queue_utils.publish("ex", "key", {"a": 1})
+    queue_utils.publish_delayed_message("ex", "key", {"a": 1}, "1000")
+    queue_utils.publish_batch("ex", "key", [{"a": 1}, {"a": 1}])
+
+
+def test_every_message_gets_its_own_message_id(pool):
+    publish_everywhere()
+
+    message_ids = [properties.message_id for properties in pool.properties]
+    assert len(message_ids) == 5
+    assert all(message_ids)
+    assert len(set(message_ids)) == 5
+
+
+def test_every_publish_path_carries_the_trace(pool):
+    with start_span("request") as span:
+        publish_everywhere()
+
+    assert [extract(properties.headers).trace_id for properties in pool.properties] == [span.context.trace_id] * 5
+    assert pool.properties[2].headers["x-delay"] == "1000"
@@ -0,0 +1,71 @@
+import json
+
+from src.common.amqp.utils.sanitize import RedactionSpec, SanitizedParams
+
+
+def test_drops_and_redacts_keys():
+    spec = RedactionSpec()
+    params = {
+        "queue_consumer": object(),
+        "user_jwt": "eyJ...",
+        "Authorization": "Bearer x",
+        "nested": {"OPENAI_API_KEY": "sk-1", "client_id": 7},
+        "text": "hello",
+    }
+
+    assert spec.sanitize(params) == {
+        "user_jwt": RedactionSpec.REDACTED,
+        "Authorization": RedactionSpec.REDACTED,
+        "nested": {"OPENAI_API_KEY": RedactionSpec.REDACTED, "client_id": 7},
+        "text": "hello",
+    }
+
+
+def test_no_redact_patterns():
+    assert RedactionSpec(redact_patterns=()).sanitize({"token": "t"}) == {"token": "t"}
+
+
+def test_truncates_strings_and_reprs():
+    spec = RedactionSpec(max_str_len=4)
+
+    assert spec.sanitize({"s": "abcdefgh", "o": b"abcdefgh"}) == {
+        "s": "abcd..truncated for print..",
+        "o": "b'ab..truncated for print..",
+    }
+
+
+def test_lists_hidden_or_capped():
+    assert RedactionSpec().sanitize({"ids": [1, 2, 3]}) == {"ids": "List with 3 items"}
+    assert RedactionSpec(hide_list=False, max_items=2).sanitize([1, 2, 3]) == [1, 2, "...1 more items"]
+
+
+def test_depth_and_item_limits():
+    spec = RedactionSpec(max_depth=2, max_items=2)
+
+    assert spec.sanitize({"a": {"b": {"c": 1}}}) == {"a": {"b": "Dict with 1 keys"}}
+    assert spec.sanitize({"a": 1, "b": 2, "c": 3}) == {"a": 1, "b": 2, "...": "1 more keys"}
+
+
+def test_node_budget_stops_the_walk():
+    spec = RedactionSpec(hide_list=False, max_items=1000, max_nodes=10)
+
+    sanitized = spec.sanitize(list(range(1000)))
+
+    assert len(sanitized) < 20
+    assert sanitized[-1].endswith("more items")
+
+
+def test_sanitized_params_render_lazily_as_json():
+    class Params(dict):
+        walked = False
+
+        def items(self):
+            Params.walked = True
+            return super().items()
+
+    params = Params(password="p", count=2)
+    rendered = SanitizedParams(params)
+
+    assert Params.walked is False
+    assert json.loads(str(rendered)) == {"password": RedactionSpec.REDACTED, "count": 2}
+    assert Params.walked is True
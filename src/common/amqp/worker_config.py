@@ -3,16 +3,20 @@ import time
 
 from dataclasses import dataclass
 from enum import Enum
-from typing import Callable, Optional
+from typing import Callable, Iterable, Optional
 
 
 from src.chat.processor import chat_processor
 import src.config as config
 
+from src.common.amqp.utils.sanitize import DEFAULT_REDACTION_SPEC, RedactionSpec
 from src.common.amqp.consumer.queue_consumer import (
     ReconnectingQueueConsumer,
     ReconnectingAsyncIOQueueConsumer,
+    ReconnectingMultiQueueConsumer,
 )
+from src.common.data_models.bind_models import connect_and_bind_models
+from src.common.data_models.models import release_connection
 from src.common.logger.logger import get_logger
 from src.knowledge_extraction.processor import knowledge_extraction_processor
 
@@ -36,6 +40,40 @@ class WorkerConfig:
     routing_key: str
     bind_to_delay_exchange: bool = False
     priority: int = config.X_MAX_PRIORITY
+    # basic_qos prefetch for the consumer channel
+    prefetch_count: int = 1
+    # Size of the consumer's ThreadPoolExecutor. None keeps the old one-thread-per-message behaviour
+    max_workers: Optional[int] = None
+    # Run message_processor in spawned child processes (max_workers of them) for CPU-bound work that would otherwise
+    # hold the GIL and stall the ioloop heartbeats. message_processor must be a picklable module-level function
+    use_process_pool: bool = False
+    # Runs once in each child process after message_processor's module is imported
+    process_initializer: Optional[Callable] = None
+    # Use the asyncio consumer - async def processors run on the event loop, max_concurrency messages at a time. Not
+    # with use_process_pool, batch_size or local_priority_scheduling
+    use_asyncio: bool = False
+    max_concurrency: int = 1
+    # Skip redelivered messages that are already done and requeue ones still being processed (keyed on message_id in
+    # Redis, see DEDUP_BODY_HASH_FALLBACK for messages without one)
+    deduplicate: bool = False
+    # Retry failed messages with exponential backoff through the delay exchange, dead-letter after this many attempts.
+    # None drops failed messages
+    retry_max_attempts: Optional[int] = None
+    # Run prefetched messages by AMQP priority (with aging) instead of arrival order. Needs max_workers and a
+    # prefetch_count above it, so there is a local buffer to reorder
+    local_priority_scheduling: bool = False
+    # Micro-batching (thread consumer only, not with use_process_pool): message_processor gets a list of up to
+    # batch_size params, collected for at most batch_timeout_ms, and may return a list of per-message success flags.
+    # Meant for embedding-style work
+    batch_size: Optional[int] = None
+    batch_timeout_ms: int = config.DEFAULT_BATCH_TIMEOUT_MS
+    # Which keys are dropped/redacted and how much of each received message gets logged
+    redaction_spec: RedactionSpec = DEFAULT_REDACTION_SPEC
+    # Runs on the worker thread after every message - by default hands the thread's DB connection back to the pool
+    job_finalizer: Optional[Callable] = release_connection
+    # Max pooled DB connections for this worker, defaults to DB_POOL_SIZE. Should cover max_workers (or
+    # prefetch_count without a pool) threads
+    db_pool_size: Optional[int] = None
 
 
 class WorkerConfigs(Enum):
@@ -52,6 +90,11 @@ class WorkerConfigs(Enum):
         queue=config.CHAT_PROCESSOR_QUEUE,
         routing_key=config.CHAT_PROCESSOR_ROUTING_KEY,
         bind_to_delay_exchange=False,
+        prefetch_count=config.CHAT_PROCESSOR_PREFETCH_COUNT,
+        max_workers=config.CHAT_PROCESSOR_MAX_WORKERS,
+        local_priority_scheduling=config.CHAT_PROCESSOR_LOCAL_PRIORITY_SCHEDULING,
+        use_asyncio=config.CHAT_PROCESSOR_USE_ASYNCIO,
+        max_concurrency=config.CHAT_PROCESSOR_MAX_CONCURRENCY,
     )
 
     KNOWLEDGE_EXTRACTION_PROCESSOR = WorkerConfig(
@@ -60,38 +103,88 @@ class WorkerConfigs(Enum):
         routing_key=config.KNOWLEDGE_EXTRACTION_PROCESSOR_ROUTING_KEY,
         priority=config.KNOWLEDGE_EXTRACTION_PROCESSOR_MESSAGE_PRIORITY,
         bind_to_delay_exchange=False,
+        prefetch_count=config.KNOWLEDGE_EXTRACTION_PROCESSOR_PREFETCH_COUNT,
+        max_workers=config.KNOWLEDGE_EXTRACTION_PROCESSOR_MAX_WORKERS,
+        local_priority_scheduling=config.KNOWLEDGE_EXTRACTION_PROCESSOR_LOCAL_PRIORITY_SCHEDULING,
+        use_process_pool=config.KNOWLEDGE_EXTRACTION_PROCESSOR_USE_PROCESS_POOL,
+        process_initializer=connect_and_bind_models,
+        deduplicate=config.KNOWLEDGE_EXTRACTION_PROCESSOR_DEDUPLICATE,
+        retry_max_attempts=config.KNOWLEDGE_EXTRACTION_PROCESSOR_RETRY_MAX_ATTEMPTS,
     )
 
+    def get_db_pool_size(self) -> int:
+        return self.value.db_pool_size or config.DB_POOL_SIZE
+
     @staticmethod
     def get_available_configs():
         return tuple([k.name for k in WorkerConfigs])
 
-    def create_consumer(self, asyncio: Optional[bool] = False) -> ReconnectingQueueConsumer:
-        # Ajai - Currently we are using ReconnectingQueueConsumer, keep asyncio False
-        # AsyncIO consumer is not tested
-        if asyncio is True:
-            self.consumer_constructor = ReconnectingAsyncIOQueueConsumer
-
-        else:
-            self.consumer_constructor = ReconnectingQueueConsumer
-        logger.info(f"Creating a {self.consumer_constructor}")
-
-        self.exchange_name = config.EXCHANGE_NAME
-        self.exchange_type = "topic"
+    def get_exchange(self):
+        exchange_name = config.EXCHANGE_NAME
+        exchange_type = "topic"
         logger.info(f"Bind to delay exchange is set to {self.value.bind_to_delay_exchange}")
 
         if self.value.bind_to_delay_exchange is True:
-            self.exchange_name = config.DELAY_EXCHANGE_NAME
-            self.exchange_type = "x-delayed-message"
+            exchange_name = config.DELAY_EXCHANGE_NAME
+            exchange_type = "x-delayed-message"
+
+        return exchange_name, exchange_type
 
+    def consumer_kwargs(self) -> dict:
+        """Queue consumer kwargs for this worker, without the amqp_url"""
+        self.exchange_name, self.exchange_type = self.get_exchange()
         logger.info(f"Binding {self.name} to exchange: {self.exchange_name}")
-        consumer = self.consumer_constructor(
+
+        return dict(
             queue_name=self.value.queue,
             routing_key=self.value.routing_key,
             callback=self.value.message_processor,
-            amqp_url=config.RABBIT_URL,
             exchange_name=self.exchange_name,
             exchange_type=self.exchange_type,
             priority=self.value.priority,
+            prefetch_count=self.value.prefetch_count,
+            max_workers=self.value.max_workers,
+            use_process_pool=self.value.use_process_pool,
+            process_initializer=self.value.process_initializer,
+            deduplicate=self.value.deduplicate,
+            retry_max_attempts=self.value.retry_max_attempts,
+            local_priority_scheduling=self.value.local_priority_scheduling,
+            batch_size=self.value.batch_size,
+            batch_timeout_ms=self.value.batch_timeout_ms,
+            redaction_spec=self.value.redaction_spec,
+            job_finalizer=self.value.job_finalizer,
         )
+
+    def create_consumer(self, asyncio: Optional[bool] = None) -> ReconnectingQueueConsumer:
+        # Falls back to the WorkerConfig's use_asyncio if not explicitly set
+        if asyncio is None:
+            asyncio = self.value.use_asyncio
+
+        consumer_kwargs = self.consumer_kwargs()
+        if asyncio is True:
+            self.consumer_constructor = ReconnectingAsyncIOQueueConsumer
+            consumer_kwargs["max_concurrency"] = self.value.max_concurrency
+
+        else:
+            self.consumer_constructor = ReconnectingQueueConsumer
+        logger.info(f"Creating a {self.consumer_constructor}")
+
+        consumer = self.consumer_constructor(amqp_url=config.RABBIT_URL, **consumer_kwargs)
         return consumer
+
+    @staticmethod
+    def create_multi_queue_consumer(worker_configs: Iterable["WorkerConfigs"]) -> ReconnectingMultiQueueConsumer:
+        """One consumer serving every given worker over a shared connection, each on its own channel with its own
+        prefetch and worker pool. Asyncio workers fall back to the thread consumer here, since the shared connection
+        is a SelectConnection - give them max_workers for concurrency instead.
+
+        """
+        consumer_kwargs_list = []
+        for worker_config in worker_configs:
+            if worker_config.value.use_asyncio:
+                logger.warning(f"{worker_config.name} uses asyncio, running it on the thread consumer instead")
+
+            consumer_kwargs_list.append(worker_config.consumer_kwargs())
+
+        logger.info(f"Creating a {ReconnectingMultiQueueConsumer} for {len(consumer_kwargs_list)} queue(s)")
+        return ReconnectingMultiQueueConsumer(amqp_url=config.RABBIT_URL, consumer_kwargs_list=consumer_kwargs_list)
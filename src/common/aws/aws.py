@@ -159,6 +159,20 @@ def update_to_s3(s3, bucket, key, content):
     logger.debug("Updated the content to %s with key: %s", bucket, key)
 
 
+def put_s3_object(s3, bucket, key, content: bytes, content_type: Optional[str] = None):
+    """Private object straight from memory, unlike update_to_s3() which makes it public"""
+    extra_args = {}
+    if content_type is not None:
+        extra_args["ContentType"] = content_type
+
+    s3.put_object(Bucket=bucket, Key=key, Body=content, **extra_args)
+    logger.debug("Put %d B to %s with key: %s", len(content), bucket, key)
+
+
+def get_s3_object(s3, bucket, key) -> bytes:
+    return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
 def get_url_s3_data(url: str) -> Optional[dict]:
     try:
         parsed_data = urlparse(url)
@@ -4,6 +4,8 @@ from collections import Counter, defaultdict
 from types import MappingProxyType
 from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple, Union
 
+import src.config as config
+
 from src.common.classes.asset.placeholder_map import (
     ConceptPlaceholderMap,
     concept_map_to_concept_placeholder_dimension_map,
@@ -322,7 +324,14 @@ class Concept(object):
             f"{self.__scene_placeholder_types[scene_index][placeholder_name]} but asset as type {asset.asset_type}"
         )
         self.__scene_placeholders[scene_index][placeholder_name] = asset
-        logger.info(f"Set asset for scene_index={scene_index}, {placeholder_name} --> {asset}")
+        # Called for every placeholder in asset selection loops - sampled, and only rendered if emitted
+        logger.info(
+            "Set asset for scene_index=%s, %s --> %s",
+            scene_index,
+            placeholder_name,
+            asset,
+            sample_rate=config.LOG_HOT_PATH_SAMPLE_RATE,
+        )
 
     def unset_scene_placeholder(self, scene_index: int, placeholder_name: str):
         """
@@ -1,6 +1,8 @@
 from collections import defaultdict
 from typing import Dict, List, Optional, Set, Union
 
+import src.config as config
+
 from src.asset_selection.common.constants import AssetState, InputAssetType
 from src.common.classes.asset.asset import BaseAsset, VideoAsset
 from src.common.logger.logger import get_logger
@@ -152,8 +154,9 @@ class PreferredAssetMap(object):
             self.__preferred_assets_info.update({iscene: iasset_info})
 
             logger.info(
-                f"PreferredAssetmap().add_update_video_segments() - Added placeholder_video_segments="
-                f"{iasset_info.get('placeholder_video_segments', None)} to scene={iscene}"
+                "PreferredAssetmap().add_update_video_segments() - Added placeholder_video_segments=%s to scene=%s",
+                iasset_info.get("placeholder_video_segments", None),
+                iscene,
             )
 
     def get_preferred_asset_by_scene_and_placeholder(
@@ -174,9 +177,13 @@ class PreferredAssetMap(object):
         except Exception as e:
             logger.warning(f"Failed to get asset for scene={scene}, placeholder={placeholder}. E: {e}")
 
+        # Called for every placeholder in asset selection loops - sampled, and only rendered if emitted
         logger.info(
-            f"PreferredAssetMap().get_preferred_asset_by_scene_and_placeholder(): scene={scene}, "
-            f"placeholder={placeholder} --> asset={placeholder_asset}"
+            "PreferredAssetMap().get_preferred_asset_by_scene_and_placeholder(): scene=%s, placeholder=%s --> asset=%s",
+            scene,
+            placeholder,
+            placeholder_asset,
+            sample_rate=config.LOG_HOT_PATH_SAMPLE_RATE,
         )
 
         return placeholder_asset
@@ -229,7 +236,7 @@ class PreferredAssetMap(object):
         if len(preferred_assets) == 0:
             preferred_assets = None
 
-        logger.info(f"PreferredAssetMap().preferred_assets(): returning {preferred_assets}")
+        logger.info("PreferredAssetMap().preferred_assets(): returning %s", preferred_assets)
 
         return preferred_assets
 
@@ -262,7 +269,7 @@ class PreferredAssetMap(object):
         if len(preferred_assets_by_scene) == 0:
             preferred_assets_by_scene = None
 
-        logger.info(f"PreferredAssetMap().get_preferred_assets_by_scene(): returning {preferred_assets_by_scene}")
+        logger.info("PreferredAssetMap().get_preferred_assets_by_scene(): returning %s", preferred_assets_by_scene)
 
         return preferred_assets_by_scene
 
@@ -13,7 +13,9 @@ from langchain_openai import ChatOpenAI
 from langchain_google_vertexai import ChatVertexAI
 
 from src.common.classes.base_chat_processor.constants import LLM, LLM_FAILURE_RESPONSE
+from src.common.classes.base_chat_processor.tracing_callback import TracingCallbackHandler
 from src.common.logger.logger import get_logger
+from src.common.metrics.tracing import traced
 from src.common.vectorstore.vector_store_service import VectorStoreService
 from qdrant_client import models  # type: ignore
 from src.common.constants import VectorType
@@ -102,6 +104,7 @@ class BaseChatProcessor(object):
             return_intermediate_steps=False,
         )
 
+    @traced(name="BaseChatProcessor.chat")
     def chat(
         self,
         human_message_input: str,
@@ -116,7 +119,8 @@ class BaseChatProcessor(object):
                 {
                     "input": human_message_input,
                     "chat_history": history_messages,
-                }
+                },
+                config={"callbacks": [TracingCallbackHandler()]},
             )
         except Exception as e:
             logger.error(f"BaseChatProcessor: chat - Error calling Agent Invoke: {e}", exc_info=True)
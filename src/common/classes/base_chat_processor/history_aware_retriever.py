@@ -116,7 +116,12 @@ class ChatHistoryAwareRetriever(BaseTool):
         if any(map(lambda x: x is None, (self.llm, self.messages_handler, self.chain))):
             raise ValueError("init_fields has to be used before tool call")
         else:
-            docs = self.chain.invoke({"input": input, "chat_history": self.messages_handler.messages})
+            # Pass the tool run's callbacks down, so the history-aware/multi-query LLM calls and vector store
+            # queries show up under it (e.g. as tracing spans)
+            docs = self.chain.invoke(
+                {"input": input, "chat_history": self.messages_handler.messages},
+                config={"callbacks": run_manager.get_child()} if run_manager is not None else None,
+            )
 
             docs = list(LongContextReorder().transform_documents(docs))
 
@@ -138,10 +143,15 @@ class ChatHistoryAwareRetriever(BaseTool):
     def log_context(docs: list[Document]) -> None:
         try:
             for i, doc in enumerate(docs):
+                # One record per doc, rendered only if INFO is on
                 logger.info(
-                    f"CONTEXT on position: {i} -- {doc.metadata.get('document_type', 'None')}:{doc.metadata.get('asset_id', 'None')} -- PAGE: {doc.metadata.get('page_number', 'None')}"
+                    "CONTEXT on position: %s -- %s:%s -- PAGE: %s\n%s",
+                    i,
+                    doc.metadata.get("document_type", "None"),
+                    doc.metadata.get("asset_id", "None"),
+                    doc.metadata.get("page_number", "None"),
+                    doc.page_content,
                 )
-                logger.info(doc.page_content)
         except Exception as e:
             logger.error(f"Error while logging context: {e}")
             pass
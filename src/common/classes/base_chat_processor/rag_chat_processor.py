@@ -30,11 +30,13 @@ from src.common.classes.base_chat_processor.history_aware_retriever import (
     DEFAULT_HISTORY_AWARE_RETRIEVER_PROMPT,
     DEFAULT_MULTI_QUERY_RETRIEVER_PROMPT,
 )
+from src.common.classes.base_chat_processor.tracing_callback import TracingCallbackHandler
 from src.common.logger.logger import get_logger
+from src.common.metrics.tracing import SpanKind, start_span, traced
 from src.common.vectorstore.vector_store_service import VectorStoreService
 from src.common.constants import VectorType
 
-from src.config import OPENAI_LLM_MODEL
+from src.config import CHAT_HISTORY_WINDOW_SIZE, OPENAI_LLM_MODEL
 
 from src.chat.language.utils import Language
 from src.chat.text_translation.google_translation_service import GoogleTranslationService
@@ -127,6 +129,7 @@ class RAGChatProcessor(object):
             max_iterations=7,
         )
 
+    @traced(name="RAGChatProcessor.chat")
     def chat(self, human_message_input: str, max_openai_failures: int = 3) -> tuple[str, bool]:
         """Main chat function
 
@@ -140,11 +143,13 @@ class RAGChatProcessor(object):
         failures_count = 0
         while not is_successful_generation and (failures_count <= max_openai_failures):
             try:
+                # LLM calls, vector store queries and tool runs as child spans of chat()
                 result = self.rag_chain.invoke(
                     {
                         "input": human_message_input,
                         "chat_history": self.chat_history.messages,
-                    }
+                    },
+                    config={"callbacks": [TracingCallbackHandler()]},
                 )
                 if result["output"] in AGENT_MAX_ITERATION_ERRORS:
                     raise AgentMaxIterationsException()
@@ -185,7 +190,8 @@ class RAGChatProcessor(object):
         state_["answer"] = state_.pop("output")
 
         data = Dataset.from_list([state_])
-        results = evaluate(dataset=data, metrics=self.metrics, llm=self.llm)
+        with start_span("ragas.evaluate"):
+            results = evaluate(dataset=data, metrics=self.metrics, llm=self.llm)
 
         if self.save_metrics:
             if self.metrics_history is None:
@@ -210,20 +216,23 @@ class RAGChatProcessor(object):
                 f"Input text: {text}\n"
                 f"Target Language: {self.language}"
             )
-            translated_text = self.google_translate_service.translate_text(
-                contents=[text], target_language_code=self.language
-            )
+            with start_span("translation.google", kind=SpanKind.CLIENT, attributes={"language": self.language}):
+                translated_text = self.google_translate_service.translate_text(
+                    contents=[text], target_language_code=self.language
+                )
             return translated_text[0]
         except Exception as e:
             logger.error(f"RAGChatProcessor.__translate_text: Force translation failed, Reason: {e}")
         return text
 
     def __set_chat_history(self):
-        chat_history_temp = self.message_handler_db.messages[-50:]
-        # Take only last 50 messages to avoid token limit error
+        # Take only the last messages to avoid token limit error. SqlMessageHistory only loads that many to begin
+        # with, other histories are truncated here
+        chat_history_temp = self.message_handler_db.messages[-CHAT_HISTORY_WINDOW_SIZE:]
         logger.info(
             f"""Chat history set successfully. """
             f"""Truncated {len(self.message_handler_db.messages) - len(chat_history_temp)} """
-            f"""messages from the beginning of conversation."""
+            f"""messages from the beginning of conversation"""
+            f"""{' (older messages not loaded)' if getattr(self.message_handler_db, 'has_older', False) else ''}."""
         )
         self.chat_history = InMemoryChatMessageHistory(messages=chat_history_temp)
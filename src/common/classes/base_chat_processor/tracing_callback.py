@@ -0,0 +1,123 @@
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src.common.metrics.tracing import Span, SpanKind, StatusCode, create_span, get_current_span
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Turns langchain's run callbacks into spans under the current span, so a chat trace shows every LLM call,
+    retriever (vector store) query and tool run the agent made - e.g. the multi-query LLM call and each of the
+    resulting similarity searches inside retrieve_contexts.
+
+    Chains don't get spans of their own (there are dozens per agent step), they just pass their parent on.
+
+        rag_chain.invoke(inputs, config={"callbacks": [TracingCallbackHandler()]})
+
+    """
+
+    def __init__(self):
+        # run_id -> span for LLM/retriever/tool runs
+        self._spans: Dict[UUID, Span] = {}
+        # run_id -> nearest traced ancestor, for chain runs
+        self._parents: Dict[UUID, Optional[Span]] = {}
+
+    def _parent(self, parent_run_id: Optional[UUID]) -> Optional[Span]:
+        if parent_run_id is not None:
+            if parent_run_id in self._spans:
+                return self._spans[parent_run_id]
+
+            if parent_run_id in self._parents:
+                return self._parents[parent_run_id]
+
+        return get_current_span()
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: str, attributes: dict):
+        self._spans[run_id] = create_span(name, kind, parent=self._parent(parent_run_id), attributes=attributes)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, attributes: Optional[dict] = None) -> None:
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+
+        if attributes:
+            span.attributes.update(attributes)
+
+        if error is not None:
+            span.record_exception(error)
+        else:
+            span.set_status(StatusCode.OK)
+
+        span.end()
+
+    def on_chain_start(
+        self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID, parent_run_id=None, **kwargs
+    ) -> None:
+        self._parents[run_id] = self._parent(parent_run_id)
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs) -> None:
+        self._parents.pop(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._parents.pop(run_id, None)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts, *, run_id: UUID, parent_run_id=None, **kwargs) -> None:
+        self._start_llm(serialized, run_id, parent_run_id, kwargs)
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages, *, run_id: UUID, parent_run_id=None, **kwargs
+    ) -> None:
+        self._start_llm(serialized, run_id, parent_run_id, kwargs)
+
+    def _start_llm(self, serialized: Optional[Dict[str, Any]], run_id: UUID, parent_run_id: Optional[UUID], kwargs):
+        invocation_params = kwargs.get("invocation_params") or {}
+        model = invocation_params.get("model") or invocation_params.get("model_name")
+
+        self._start(
+            run_id,
+            parent_run_id,
+            f"llm {(serialized or {}).get('name', 'llm')}",
+            SpanKind.CLIENT,
+            {"gen_ai.request.model": model} if model else {},
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+
+        self._end(
+            run_id,
+            attributes={
+                "gen_ai.usage.input_tokens": token_usage.get("prompt_tokens"),
+                "gen_ai.usage.output_tokens": token_usage.get("completion_tokens"),
+            }
+            if token_usage
+            else None,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_retriever_start(
+        self, serialized: Dict[str, Any], query: str, *, run_id: UUID, parent_run_id=None, **kwargs
+    ) -> None:
+        name = (serialized or {}).get("name", "retriever")
+        self._start(run_id, parent_run_id, f"retriever {name}", SpanKind.CLIENT, {})
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, attributes={"documents": len(documents)})
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, parent_run_id=None, **kwargs
+    ) -> None:
+        self._start(run_id, parent_run_id, f"tool {(serialized or {}).get('name', 'tool')}", SpanKind.INTERNAL, {})
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
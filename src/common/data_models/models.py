@@ -20,6 +20,9 @@ db_config = {
     "port_env_var": "DB_PORT",
     "username_env_var": "DB_USERNAME",
     "password_env_var": "DB_PASSWORD",
+    # Optional - without a replica host every query goes to the primary
+    "replica_host_env_var": "DB_REPLICA_HOST",
+    "replica_port_env_var": "DB_REPLICA_PORT",
     "db_alias_name": "project x database",  # Human-readable name for logging purpose
 }
 
@@ -42,6 +45,24 @@ def close():
     db_manager.close()
 
 
+def release_connection():
+    """Hand the calling thread's connection back to the pool - run after every worker job"""
+    db_manager.release()
+
+
+def get_pool_stats() -> dict:
+    return db_manager.get_pool_stats()
+
+
+def read_only(query):
+    """Run a select on the read replica. Stays on the primary if there is no replica, or if this job/request already
+    wrote something (read-your-writes) - only use it for queries that can tolerate replica lag otherwise.
+
+        rows = models.read_only(models.ChatHistories.select().where(...))
+    """
+    return query.bind(db_manager.get_read_db())
+
+
 db = db_manager.get_db_instance()
 
 
@@ -95,6 +116,9 @@ class BaseModel(Model):
 
 #     class Meta:
 #         table_name = "ChatHistories"
+#         indexes = (
+#             (("session_id", "deleted_at", "created_at"), False),
+#         )
 
 
 # class AssetTypes(BaseModel):
@@ -1,11 +1,43 @@
 import os
 from src.common.database.database import Database, get_logger
+from src.common.database.pool import ObservablePoolMixin, PoolReaper
+from src.common.database.routing import StickyWritesMixin, read_from_primary, reset_primary_stickiness
+from playhouse.pool import PooledDatabase, PooledMySQLDatabase
 from playhouse.shortcuts import ReconnectMixin
 from peewee import MySQLDatabase, SqliteDatabase
 
+import src.config as config
 from src.config import TEST_MODE
 
 
+class ReconnectPooledMySQLDatabase(ReconnectMixin, ObservablePoolMixin, PooledMySQLDatabase):
+    """Connection pool that hands each thread its own connection (peewee keeps connection state per thread), so
+    worker threads run their queries in parallel. A thread holds its connection until it calls close(), which
+    returns it to the pool - see DatabaseManager.release().
+
+    Idle connections are pinged on checkout and discarded if the server dropped them, and a query that fails on a
+    lost connection is retried once on a fresh one (ReconnectMixin).
+
+    """
+
+    def _is_closed(self, conn) -> bool:
+        # Health check on checkout. No reconnect here - a dead connection is discarded and the pool opens a new one
+        try:
+            conn.ping(False)
+        except Exception:
+            return True
+
+        return False
+
+    def _can_reuse(self, conn) -> bool:
+        # Connections that died mid-query don't go back in the pool
+        return conn.open
+
+
+class PrimaryPooledMySQLDatabase(StickyWritesMixin, ReconnectPooledMySQLDatabase):
+    """The primary's pool - writes through it pin the rest of the job's reads to the primary"""
+
+
 class DatabaseManager(object):
     def __init__(self, db_config):
         self.logger = get_logger()
@@ -14,22 +46,27 @@ class DatabaseManager(object):
         self.db_port = int(os.environ.get(db_config["port_env_var"], "3306"))
         self.db_username = os.environ.get(db_config["username_env_var"], "root")
         self.db_password = os.environ.get(db_config["password_env_var"], "password")
+        # Optional read replica, same database and credentials
+        self.replica_host = os.environ.get(db_config.get("replica_host_env_var", ""))
+        self.replica_port = int(os.environ.get(db_config.get("replica_port_env_var", ""), self.db_port))
         self.db_config = db_config
         self.db = self.__initialize_db_connection()
+        self.replica_db = self.__get_replica_db_connection()
+        self.reapers = [PoolReaper(db) for db in (self.db, self.replica_db) if isinstance(db, ObservablePoolMixin)]
         self.logger.info(f"Initializing DatabaseManager for {db_config['db_alias_name']}")
 
     def __get_db_connection(self):
         if TEST_MODE is False:
-
-            class ReconnectMySQLDatabase(ReconnectMixin, MySQLDatabase):
-                pass
-
-            return ReconnectMySQLDatabase(
+            return PrimaryPooledMySQLDatabase(
                 self.db_name,
                 host=self.db_host,
                 port=self.db_port,
                 user=self.db_username,
                 password=self.db_password,
+                max_connections=config.DB_POOL_SIZE,
+                stale_timeout=config.DB_POOL_STALE_TIMEOUT,
+                timeout=config.DB_POOL_TIMEOUT,
+                pool_name=self.db_name,
             )
         else:
             return Database().get_connection(
@@ -40,6 +77,23 @@ class DatabaseManager(object):
                 db_password=self.db_password,
             )
 
+    def __get_replica_db_connection(self):
+        if TEST_MODE is True or not self.replica_host:
+            return None
+
+        self.logger.info(f"DatabaseManager :: Read replica for {self.db_config['db_alias_name']}: {self.replica_host}")
+        return ReconnectPooledMySQLDatabase(
+            self.db_name,
+            host=self.replica_host,
+            port=self.replica_port,
+            user=self.db_username,
+            password=self.db_password,
+            max_connections=config.DB_POOL_SIZE,
+            stale_timeout=config.DB_POOL_STALE_TIMEOUT,
+            timeout=config.DB_POOL_TIMEOUT,
+            pool_name=f"{self.db_name}-replica",
+        )
+
     def __initialize_db_connection(self):
         try:
             return self.__get_db_connection()
@@ -56,10 +110,52 @@ class DatabaseManager(object):
     def get_db_instance(self):
         return self.db
 
+    def get_read_db(self):
+        """Where read-only selects should go: the replica, unless there is none or this job already wrote through
+        the primary (read-your-writes)"""
+        if self.replica_db is None or read_from_primary():
+            return self.db
+
+        return self.replica_db
+
+    def set_pool_size(self, max_connections: int):
+        """Size the pools for the threads this process runs. Call before connect() - a pool that has handed out a
+        connection can't be resized (RuntimeError)"""
+        for db in (self.db, self.replica_db):
+            if isinstance(db, ObservablePoolMixin):
+                db.set_max_connections(max_connections)
+                self.logger.info(f"DatabaseManager :: Pool size set to {max_connections}")
+
+    def release(self):
+        """Return the calling thread's connections to the pools and end its read-your-writes stickiness. Call at the
+        end of every job/request, otherwise the thread keeps them (and threads that exit leak them)"""
+        for db in (self.db, self.replica_db):
+            if isinstance(db, PooledDatabase) and not db.is_closed():
+                db.close()
+
+        reset_primary_stickiness()
+
+    def get_pool_stats(self) -> dict:
+        """Pool size, in-use/idle connections, checkouts, waits, wait time and checkout failures - the replica's
+        under "replica". Empty without a pool (test mode)"""
+        if not isinstance(self.db, ObservablePoolMixin):
+            return {}
+
+        stats = self.db.get_pool_stats()
+        if self.replica_db is not None:
+            stats["replica"] = self.replica_db.get_pool_stats()
+
+        return stats
+
     def connect(self):
         try:
             self.db.execute_sql("Select 1 as a")  # Actual connection gets created only when we run a sql query
             self.logger.info(f'DatabaseManager :: Established connection with {self.db_config["db_alias_name"]}')
+            self.connect_replica()
+            # The check ran on the main thread, which doesn't run jobs - don't let it hold a pooled connection
+            self.release()
+            for reaper in self.reapers:
+                reaper.start()
         except Exception as e:
             self.logger.error(f"DatabaseManager :: Error running sample sql query: E:{e}")
             Database().close_connection(db_name=self.db_name, db_host=self.db_host, db_username=self.db_username)
@@ -73,5 +169,17 @@ class DatabaseManager(object):
             self.db.execute_sql("Select 1 as a")  # Actual connection gets created only when we run a sql query.
             self.logger.info(f'DatabaseManager :: Established connection with {self.db_config["db_alias_name"]}')
 
+    def connect_replica(self):
+        if self.replica_db is None:
+            return
+
+        try:
+            self.replica_db.execute_sql("Select 1 as a")
+            self.logger.info(f"DatabaseManager :: Established connection with replica {self.replica_host}")
+        except Exception as e:
+            # Better slower reads than none
+            self.logger.error(f"DatabaseManager :: Replica unreachable, reading from the primary instead: E:{e}")
+            self.replica_db = None
+
     def close(self):
         Database().close_connection(db_name=self.db_name, db_host=self.db_host, db_username=self.db_username)
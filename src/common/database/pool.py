@@ -0,0 +1,220 @@
+import heapq
+import time
+
+from threading import Condition, Event, Thread
+from typing import Optional
+
+from playhouse.pool import MaxConnectionsExceeded, PooledDatabase
+
+import src.config as config
+
+from src.common.logger.logger import get_logger
+from src.common.metrics.metrics import MetricsRegistry, get_metrics_registry
+
+
+logger = get_logger(__name__)
+
+
+# Seconds - a healthy checkout takes well under a millisecond, anything in the upper buckets is pool starvation
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolStats(object):
+    """Checkout/wait metrics for one connection pool, labelled by pool so they can be told apart on /metrics"""
+
+    def __init__(self, pool_name: str, registry: Optional[MetricsRegistry] = None):
+        registry = registry or get_metrics_registry()
+
+        self._labels = {"pool": pool_name}
+
+        self.checkouts = registry.counter("db_pool_checkouts_total", "Connection checkouts, by status")
+        self.waits = registry.counter("db_pool_waits_total", "Checkouts that had to wait for a free connection")
+        self.wait_time = registry.histogram(
+            "db_pool_wait_seconds", "Time a checkout waited for a connection", buckets=POOL_WAIT_BUCKETS
+        )
+        self.reaped = registry.counter("db_pool_reaped_total", "Idle connections closed by the stale reaper")
+        self.connections = registry.gauge("db_pool_connections", "Pooled connections, by state")
+
+    def checked_out(self, wait_time: float, waited: bool):
+        self.checkouts.inc(status="ok", **self._labels)
+        self.wait_time.observe(wait_time, **self._labels)
+        if waited:
+            self.waits.inc(**self._labels)
+
+    def checkout_failed(self, wait_time: float):
+        self.checkouts.inc(status="failed", **self._labels)
+        self.wait_time.observe(wait_time, **self._labels)
+
+    def stale_reaped(self, count: int):
+        self.reaped.inc(count, **self._labels)
+
+    def set_connections(self, in_use: int, idle: int):
+        self.connections.set(in_use, state="in_use", **self._labels)
+        self.connections.set(idle, state="idle", **self._labels)
+
+    def snapshot(self) -> dict:
+        return {
+            "in_use": self.connections.get(state="in_use", **self._labels),
+            "idle": self.connections.get(state="idle", **self._labels),
+            "checkouts": self.checkouts.get(status="ok", **self._labels),
+            "checkout_failures": self.checkouts.get(status="failed", **self._labels),
+            "waits": self.waits.get(**self._labels),
+            "wait_seconds": self.wait_time.snapshot(),
+            "reaped": self.reaped.get(**self._labels),
+        }
+
+
+class ObservablePoolMixin(object):
+    """For peewee PooledDatabase subclasses (list it before them). Adds:
+
+    - a checkout wait that blocks until a connection is returned instead of peewee's 100 ms polling. timeout keeps
+      peewee's meaning: secs to wait, 0 waits forever, None fails straight away
+    - checkout/wait/failure metrics and in-use/idle gauges (PoolStats)
+    - reap_stale(), to close idle connections past stale_timeout without waiting for the next checkout
+
+    """
+
+    def __init__(self, *args, pool_name: str = "default", timeout=None, **kwargs):
+        self._returned = Condition()
+        self.pool_stats = PoolStats(pool_name)
+        timeout = self._parse_timeout(timeout)
+        super().__init__(*args, timeout=timeout, **kwargs)
+        self._set_wait_timeout(timeout)
+
+    def init(self, database, timeout=None, **kwargs):
+        timeout = self._parse_timeout(timeout)
+        super().init(database, timeout=timeout, **kwargs)
+        self._set_wait_timeout(timeout)
+
+    @staticmethod
+    def _parse_timeout(timeout) -> Optional[float]:
+        return float(timeout) if timeout is not None else None
+
+    def _set_wait_timeout(self, timeout: Optional[float]):
+        # peewee truncates timeout with int(), which turns e.g. 0.5 into 0 - wait forever
+        if timeout is not None:
+            self._wait_timeout = float("inf") if timeout == 0 else timeout
+
+    def connect(self, reuse_if_open=False):
+        start_time = time.perf_counter()
+        waited = False
+        # Set by PooledDatabase: None, or inf for timeout=0
+        checkout_timeout = self._wait_timeout or 0
+
+        while True:
+            try:
+                # Skip PooledDatabase.connect() and its sleep loop, we wait on _returned instead
+                result = super(PooledDatabase, self).connect(reuse_if_open)
+                break
+
+            except MaxConnectionsExceeded:
+                remaining = checkout_timeout - (time.perf_counter() - start_time)
+                if remaining <= 0:
+                    self.pool_stats.checkout_failed(time.perf_counter() - start_time)
+                    logger.error(f"No free DB connection after {checkout_timeout} secs ({self.pool_size_info})")
+                    raise
+
+                waited = True
+                with self._returned:
+                    # Capped in case the return we're waiting for slipped in before we got here
+                    self._returned.wait(min(remaining, 0.1))
+
+        self.pool_stats.checked_out(time.perf_counter() - start_time, waited)
+        self._update_gauges()
+
+        return result
+
+    def _close(self, conn, close_conn=False):
+        super()._close(conn, close_conn)
+        self._update_gauges()
+
+        with self._returned:
+            self._returned.notify()
+
+    def set_max_connections(self, max_connections: int):
+        """Resize the pool. Only before its first checkout - peewee takes max_connections in the constructor and
+        doesn't expect it to change under connections that are already out (init() would also reset the connect
+        params), so a pool that has been used is left alone.
+
+        :raises RuntimeError: If the pool already has connections
+        """
+        with self._lock:
+            if self._in_use or self._connections:
+                raise RuntimeError(f"Can't resize a DB pool that is already in use ({self.pool_size_info})")
+
+            self._max_connections = max_connections
+
+    def _update_gauges(self):
+        self.pool_stats.set_connections(len(self._in_use), len(self._connections))
+
+    @property
+    def pool_size_info(self) -> str:
+        return f"in use: {len(self._in_use)}, idle: {len(self._connections)}, max: {self._max_connections}"
+
+    def get_pool_stats(self) -> dict:
+        self._update_gauges()
+        return {
+            "max_connections": self._max_connections,
+            "stale_timeout": self._stale_timeout,
+            "timeout": self._wait_timeout,
+            **self.pool_stats.snapshot(),
+        }
+
+    def reap_stale(self) -> int:
+        """Close idle connections older than stale_timeout. peewee only checks for staleness when a connection is
+        checked out or returned, so after a burst the extra connections would otherwise stay open (and count against
+        the server's max_connections) until the next one.
+
+        :return: How many were closed
+        """
+        if not self._stale_timeout:
+            return 0
+
+        with self._lock:
+            stale, fresh = [], []
+            # Heap entries are (timestamp, ..., conn)
+            for entry in self._connections:
+                (stale if self._is_stale(entry[0]) else fresh).append(entry)
+
+            if not stale:
+                return 0
+
+            heapq.heapify(fresh)
+            self._connections = fresh
+
+            for entry in stale:
+                # Straight to the driver, these were never checked out
+                super(PooledDatabase, self)._close(entry[-1])
+
+        self.pool_stats.stale_reaped(len(stale))
+        self._update_gauges()
+
+        return len(stale)
+
+
+class PoolReaper(object):
+    """Background thread running reap_stale() on a pool every interval secs"""
+
+    def __init__(self, db: ObservablePoolMixin, interval: float = config.DB_POOL_REAPER_INTERVAL):
+        self._db = db
+        self._interval = interval
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self._interval > 0:
+            self._thread = Thread(target=self._run, name="db-pool-reaper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                reaped = self._db.reap_stale()
+                if reaped:
+                    logger.info(f"Closed {reaped} stale DB connection(s) ({self._db.pool_size_info})")
+
+            except Exception as e:
+                logger.error(f"DB pool reaper failed. E:{e}")
@@ -1,8 +1,20 @@
 import os
 from playhouse.pool import PooledMySQLDatabase
 from src.common.database.database import get_logger
+from src.common.database.pool import ObservablePoolMixin, PoolReaper
+from src.common.database.routing import StickyWritesMixin, read_from_primary, reset_primary_stickiness
 from peewee import *
 
+import src.config as config
+
+
+class ObservablePooledMySQLDatabase(ObservablePoolMixin, PooledMySQLDatabase):
+    pass
+
+
+class PrimaryObservablePooledMySQLDatabase(StickyWritesMixin, ObservablePooledMySQLDatabase):
+    pass
+
 
 class PooledDatabaseManager:
     def __init__(self, db_config):
@@ -14,22 +26,44 @@ class PooledDatabaseManager:
         self.db_port = int(os.environ.get(db_config["port_env_var"], "3306"))
         self.db_username = os.environ.get(db_config["username_env_var"], "root")
         self.db_password = os.environ.get(db_config["password_env_var"], "root")
+        # Optional read replica, same database and credentials
+        self.replica_host = os.environ.get(db_config.get("replica_host_env_var", ""))
+        self.replica_port = int(os.environ.get(db_config.get("replica_port_env_var", ""), self.db_port))
         self.db_config = db_config
         self.db = self.__initialize_db_connection()
+        self.replica_db = self.__get_replica_db_connection() if self.replica_host else None
+        self.reapers = [PoolReaper(db) for db in (self.db, self.replica_db) if db is not None]
         self.logger.info(
             f"Initializing PooledDatabaseManager for {db_config['db_alias_name']}"
         )
 
     def __get_db_connection(self):
-        return PooledMySQLDatabase(
+        return PrimaryObservablePooledMySQLDatabase(
             self.db_name,
             host=self.db_host,
             port=self.db_port,
             user=self.db_username,
             password=self.db_password,
-            max_connections=8,
-            stale_timeout=300,
-            timeout=0,
+            max_connections=config.DB_POOL_SIZE,
+            stale_timeout=config.DB_POOL_STALE_TIMEOUT,
+            timeout=config.DB_POOL_TIMEOUT,
+            pool_name=self.db_name,
+            charset="utf8mb4",
+            use_unicode=True,
+        )
+
+    def __get_replica_db_connection(self):
+        self.logger.info(f"PooledDatabaseManager :: Read replica: {self.replica_host}")
+        return ObservablePooledMySQLDatabase(
+            self.db_name,
+            host=self.replica_host,
+            port=self.replica_port,
+            user=self.db_username,
+            password=self.db_password,
+            max_connections=config.DB_POOL_SIZE,
+            stale_timeout=config.DB_POOL_STALE_TIMEOUT,
+            timeout=config.DB_POOL_TIMEOUT,
+            pool_name=f"{self.db_name}-replica",
             charset="utf8mb4",
             use_unicode=True,
         )
@@ -46,9 +80,43 @@ class PooledDatabaseManager:
     def get_db_instance(self):
         return self.db
 
+    def get_read_db(self):
+        """The replica, unless there is none or this job already wrote through the primary (read-your-writes)"""
+        if self.replica_db is None or read_from_primary():
+            return self.db
+
+        return self.replica_db
+
+    def set_pool_size(self, max_connections: int):
+        """Call before connect() - a pool that has handed out a connection can't be resized (RuntimeError)"""
+        for db in (self.db, self.replica_db):
+            if db is not None:
+                db.set_max_connections(max_connections)
+        self.logger.info(f"PooledDatabaseManager :: Pool size set to {max_connections}")
+
+    def release(self):
+        """Return the calling thread's connections to the pools and end its read-your-writes stickiness"""
+        for db in (self.db, self.replica_db):
+            if db is not None and not db.is_closed():
+                db.close()
+
+        reset_primary_stickiness()
+
+    def get_pool_stats(self) -> dict:
+        """Pool size, in-use/idle connections, checkouts, waits, wait time and checkout failures - the replica's
+        under "replica"
+        """
+        stats = self.db.get_pool_stats()
+        if self.replica_db is not None:
+            stats["replica"] = self.replica_db.get_pool_stats()
+
+        return stats
+
     def connect(self):
         try:
             self.db.connect()
+            for reaper in self.reapers:
+                reaper.start()
             self.logger.info(
                 f'PooledDatabaseManager :: Established connection with {self.db_config["db_alias_name"]}'
             )
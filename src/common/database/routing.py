@@ -0,0 +1,35 @@
+from contextvars import ContextVar
+
+
+# Set once the current request/job has written through the primary. Reads then stay on the primary until the job
+# ends (DatabaseManager.release()), so they see the job's own writes regardless of replica lag
+_read_from_primary: ContextVar[bool] = ContextVar("read_from_primary", default=False)
+
+_READ_ONLY_STATEMENTS = ("SELECT", "SHOW", "EXPLAIN", "DESCRIBE")
+
+
+def is_read_only_statement(sql: str) -> bool:
+    return sql.lstrip()[:8].upper().startswith(_READ_ONLY_STATEMENTS)
+
+
+def read_from_primary() -> bool:
+    return _read_from_primary.get()
+
+
+def stick_to_primary():
+    _read_from_primary.set(True)
+
+
+def reset_primary_stickiness():
+    _read_from_primary.set(False)
+
+
+class StickyWritesMixin(object):
+    """For the primary's peewee Database (list it before the database class): any statement that isn't a plain read
+    makes the rest of the current request/job read from the primary too (read-your-writes)"""
+
+    def execute_sql(self, sql, *args, **kwargs):
+        if not is_read_only_statement(sql):
+            stick_to_primary()
+
+        return super().execute_sql(sql, *args, **kwargs)
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from playhouse.pool import MaxConnectionsExceeded, PooledSqliteDatabase
+
+from src.common.database.pool import ObservablePoolMixin
+
+
+class ObservablePooledSqliteDatabase(ObservablePoolMixin, PooledSqliteDatabase):
+    pass
+
+
+def make_db(timeout, pool_name: str, **kwargs) -> ObservablePooledSqliteDatabase:
+    return ObservablePooledSqliteDatabase(
+        ":memory:", max_connections=1, timeout=timeout, pool_name=pool_name, check_same_thread=False, **kwargs
+    )
+
+
+def connect_in_thread(db) -> dict:
+    outcome = {}
+
+    def run():
+        start_time = time.perf_counter()
+        try:
+            db.connect()
+            outcome["connected"] = True
+            db.close()
+        except MaxConnectionsExceeded:
+            outcome["connected"] = False
+        outcome["secs"] = time.perf_counter() - start_time
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    outcome["thread"] = thread
+    return outcome
+
+
+def test_timeout_none_fails_straight_away():
+    db = make_db(None, "test_none")
+    db.connect()
+
+    outcome = connect_in_thread(db)
+    outcome["thread"].join(5)
+
+    assert outcome["connected"] is False
+    assert outcome["secs"] < 0.5
+    assert db.get_pool_stats()["checkout_failures"] == 1
+    db.close()
+
+
+def test_timeout_zero_waits_for_a_returned_connection():
+    db = make_db(0, "test_zero")
+    db.connect()
+
+    outcome = connect_in_thread(db)
+    time.sleep(0.3)
+    assert outcome["thread"].is_alive()
+
+    db.close()
+    outcome["thread"].join(5)
+
+    assert outcome["connected"] is True
+    assert db.get_pool_stats()["waits"] == 1
+
+
+def test_timeout_expires():
+    db = make_db(1, "test_expires")
+    db.connect()
+
+    outcome = connect_in_thread(db)
+    outcome["thread"].join(5)
+
+    assert outcome["connected"] is False
+    assert 0.9 < outcome["secs"] < 3
+    db.close()
+
+
+def test_fractional_timeout_is_not_truncated():
+    db = make_db("0.5", "test_fractional")
+    assert db.get_pool_stats()["timeout"] == 0.5
+
+    db.init(":memory:", timeout=0.25)
+    assert db.get_pool_stats()["timeout"] == 0.25
+
+    db.connect()
+    outcome = connect_in_thread(db)
+    outcome["thread"].join(5)
+
+    assert outcome["connected"] is False
+    assert outcome["secs"] < 1
+    db.close()
+
+
+def test_reap_stale_closes_idle_connections():
+    db = make_db(None, "test_reap", stale_timeout=1)
+    db.connect()
+    db.close()
+    assert db.get_pool_stats()["idle"] == 1
+
+    assert db.reap_stale() == 0
+    time.sleep(1.1)
+    assert db.reap_stale() == 1
+
+    stats = db.get_pool_stats()
+    assert (stats["idle"], stats["reaped"]) == (0, 1)
+
+
+@pytest.mark.parametrize("timeout", [None, 0])
+def test_stats_report_peewee_timeout(timeout):
+    stats = make_db(timeout, f"test_stats_{timeout}").get_pool_stats()
+
+    assert stats["timeout"] == (float("inf") if timeout == 0 else None)
+
+
+def test_resize_only_before_first_checkout():
+    db = make_db(None, "test_resize")
+    db.set_max_connections(4)
+    assert db.get_pool_stats()["max_connections"] == 4
+
+    db.connect()
+    db.close()
+
+    with pytest.raises(RuntimeError):
+        db.set_max_connections(8)
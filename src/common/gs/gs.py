@@ -79,6 +79,27 @@ def upload_to_gs(
     return key, url
 
 
+# LL - also wrapping this with retry for 2nd-level guard
+@retry(delay=1, backoff=2, max_delay=4, tries=5)
+def upload_bytes_to_gs(gs, content: bytes, bucket: str, key: str, content_type: Optional[str] = None):
+    bucket = gs.bucket(bucket)
+    blob = bucket.blob(key)
+    blob.upload_from_string(
+        content, content_type=content_type or "application/octet-stream", timeout=config.GCP_TIMEOUT
+    )
+
+    logger.debug(f"Uploaded {len(content)} B to {bucket.name}/{key}")
+
+
+# LL - also wrapping this with retry for 2nd-level guard
+@retry(delay=1, backoff=2, max_delay=4, tries=5)
+def download_bytes_from_gs(gs, bucket_name: str, key: str) -> bytes:
+    bucket = gs.bucket(bucket_name)
+    blob = bucket.blob(key)
+
+    return blob.download_as_bytes(timeout=config.GCP_TIMEOUT)
+
+
 def delete_from_gs(gs, bucket: str, key: str):
     bucket = gs.get_bucket(bucket, timeout=config.GCP_TIMEOUT_SHORT)
     blob = bucket.blob(key)
@@ -1,13 +1,94 @@
+import atexit
+import copy
 import functools
+import json
 import logging
+import queue
 import sys
 import time
 import src.config as config
 
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+from typing import Iterator
+
+
+# Per thread/asyncio task logging state. New threads (incl. pool workers) start from the defaults, tasks inherit a
+# copy from whoever created them - so concurrent jobs never see each other's tags and nothing needs a lock
+_log_tag: ContextVar[str] = ContextVar("log_tag", default="")
+_log_silent: ContextVar[bool] = ContextVar("log_silent", default=False)
+_log_fields: ContextVar[dict] = ContextVar("log_fields", default={})
+
+
+class CallSiteLimiter(object):
+    """Sampling + token bucket for one log call site. Always lets the first sample_first_n records through, then
+    every round(1/sample_rate)-th, and never more than rate_per_sec on average. Deterministic counting, no locking -
+    under races a few extra or missing records are fine.
+
+    """
+
+    __slots__ = ("count", "suppressed", "tokens", "last_refill")
+
+    def __init__(self, burst: float):
+        self.count = 0
+        self.suppressed = 0
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+
+    def allow(self, sample_first_n: int, sample_rate: float, rate_per_sec: float, burst: float) -> bool:
+        self.count += 1
+
+        if self.count > sample_first_n and sample_rate < 1.0:
+            every = max(int(round(1 / sample_rate)), 1) if sample_rate > 0 else 0
+            if every == 0 or (self.count - sample_first_n) % every != 0:
+                self.suppressed += 1
+                return False
+
+        if rate_per_sec > 0:
+            now = time.monotonic()
+            self.tokens = min(burst, self.tokens + (now - self.last_refill) * rate_per_sec)
+            self.last_refill = now
+
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+
+            self.tokens -= 1
+
+        return True
+
+
+# (filename, lineno) -> CallSiteLimiter
+_call_site_limiters = {}
+_limiting_enabled = config.LOG_SAMPLE_RATE < 1.0 or config.LOG_RATE_LIMIT_PER_SEC > 0 or bool(
+    config.LOG_SAMPLE_RATE_OVERRIDES
+)
+
 
 class DistributedLogger(object):
-    _tag = ""
-    _silent = False
+    """Thin wrapper around a logging.Logger, one per name. The tag, silent flag and context fields (job id, queue,
+    delivery tag etc. - added to every record as extra fields) come from contextvars, not from the instance.
+
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+        self._sample_rate = self._get_sample_rate(logger.name)
+
+    @staticmethod
+    def _get_sample_rate(name: str) -> float:
+        # Longest matching logger name prefix from LOG_SAMPLE_RATE_OVERRIDES wins
+        matches = [
+            prefix
+            for prefix in config.LOG_SAMPLE_RATE_OVERRIDES
+            if name == prefix or name.startswith(f"{prefix}.")
+        ]
+        if matches:
+            return config.LOG_SAMPLE_RATE_OVERRIDES[max(matches, key=len)]
+
+        return config.LOG_SAMPLE_RATE
 
     @property
     def logger(self):
@@ -19,50 +100,84 @@ class DistributedLogger(object):
 
     @property
     def tag(self):
-        return self._tag
+        return _log_tag.get()
 
     @tag.setter
     def tag(self, tag):
-        self._tag = tag
+        _log_tag.set(tag)
 
     @property
     def silent(self):
-        return self._silent
+        return _log_silent.get()
 
     @silent.setter
     def silent(self, silent):
-        self._silent = silent
+        _log_silent.set(silent)
+
+    def isEnabledFor(self, level):
+        # Lets callers skip building expensive log messages that would be dropped anyway
+        return not _log_silent.get() and self._logger.isEnabledFor(level)
+
+    def _log(self, level, msg, args, kwargs):
+        # Only for this call site, e.g. logger.info(..., sample_rate=config.LOG_HOT_PATH_SAMPLE_RATE) in hot loops
+        sample_rate = kwargs.pop("sample_rate", None)
+
+        # Check the level before building anything - pass %-style args rather than f-strings for big payloads so
+        # they are only rendered for records that actually get emitted
+        if not self.isEnabledFor(level):
+            return
+
+        fields = _log_fields.get()
+
+        if level < logging.WARNING and (_limiting_enabled or sample_rate is not None):
+            # 0 = _log(), 1 = info()/debug()/log(), 2 = the call site
+            frame = sys._getframe(2)
+            site = (frame.f_code.co_filename, frame.f_lineno)
+
+            limiter = _call_site_limiters.get(site)
+            if limiter is None:
+                limiter = _call_site_limiters.setdefault(site, CallSiteLimiter(config.LOG_RATE_LIMIT_BURST))
+
+            if not limiter.allow(
+                config.LOG_SAMPLE_FIRST_N,
+                self._sample_rate if sample_rate is None else sample_rate,
+                config.LOG_RATE_LIMIT_PER_SEC,
+                config.LOG_RATE_LIMIT_BURST,
+            ):
+                return
+
+            if limiter.suppressed > 0:
+                # Let readers know how much this record stands for
+                fields = {**fields, "suppressed": limiter.suppressed}
+                limiter.suppressed = 0
+
+        if fields:
+            kwargs["extra"] = {**fields, **kwargs["extra"]} if kwargs.get("extra") else fields
+
+        # Keep the wrapper's frame out of funcName/lineno
+        kwargs.setdefault("stacklevel", 3)
+        self._logger.log(level, f"{_log_tag.get()}::{msg}", *args, **kwargs)
 
     def log(self, level, msg, *args, **kwargs):
-        self._logger.log(level, msg, *args, **kwargs)
+        self._log(level, msg, args, kwargs)
 
     def info(self, msg, *args, **kwargs):
-        msg = f"{self._tag}::{msg}"
-        if not self._silent:
-            self._logger.info(msg, *args, **kwargs)
+        self._log(logging.INFO, msg, args, kwargs)
 
     def debug(self, msg, *args, **kwargs):
-        msg = f"{self._tag}::{msg}"
-        if not self._silent:
-            self._logger.debug(msg, *args, **kwargs)
+        self._log(logging.DEBUG, msg, args, kwargs)
 
     def error(self, msg, *args, **kwargs):
-        msg = f"{self._tag}::{msg}"
-        if not self._silent:
-            self._logger.error(msg, *args, **kwargs)
+        self._log(logging.ERROR, msg, args, kwargs)
 
     def warn(self, msg, *args, **kwargs):
-        msg = f"{self._tag}::{msg}"
-        if not self._silent:
-            self._logger.warning(msg, *args, **kwargs)
+        self._log(logging.WARNING, msg, args, kwargs)
 
     def warning(self, msg, *args, **kwargs):
-        msg = f"{self._tag}::{msg}"
-        if not self._silent:
-            self._logger.warning(msg, *args, **kwargs)
+        self._log(logging.WARNING, msg, args, kwargs)
 
 
-log_wrapper = DistributedLogger()
+_loggers = {}
 
 
 def get_formatter():
@@ -72,44 +187,177 @@ def get_formatter():
     return formatter
 
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with anything passed through extra={} as top level fields"""
+
+    # Attributes every LogRecord has - anything else on a record came in through extra={}
+    _RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+            "process": record.process,
+        }
+
+        for k, v in record.__dict__.items():
+            if k not in self._RECORD_ATTRS:
+                payload[k] = v
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+
+        return json.dumps(payload, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread, which does the formatting and the stdout writes. If the queue is full
+    (stdout can't keep up) records are dropped and counted instead of blocking the caller.
+
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only resolve what can't wait: %-args may be mutated once the caller moves on, and exc_info holds frames.
+        # JSON/text formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+_handler_lock = Lock()
+
+
 def get_console_handler(formatter):
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(logging.Formatter(formatter))
+    if config.LOG_FORMAT == "json":
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(logging.Formatter(formatter))
     return console_handler
 
 
+def get_handler() -> logging.Handler:
+    """The handler shared by every logger from get_logger(). With LOG_ASYNC (default) that's a queue handler, and a
+    single listener thread writes to stdout - worker threads never wait on stdout"""
+    global _handler, _listener
+
+    with _handler_lock:
+        if _handler is None:
+            console_handler = get_console_handler(get_formatter())
+
+            if config.LOG_ASYNC is True:
+                _handler = NonBlockingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+                _listener = QueueListener(_handler.queue, console_handler, respect_handler_level=True)
+                _listener.start()
+                # Flush whatever is still queued on exit
+                atexit.register(stop_log_listener)
+
+            else:
+                _handler = console_handler
+
+    return _handler
+
+
+def stop_log_listener():
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+        if _handler.dropped > 0:
+            sys.stderr.write(f"Logging queue was full, dropped {_handler.dropped} record(s)\n")
+
+
 def get_logger(logger_name=None) -> DistributedLogger:
     root_logger = logging.getLogger(logger_name)
     root_logger.setLevel(logging.INFO)
 
     if not root_logger.handlers:
-        formatter = get_formatter()
-        root_logger.addHandler(get_console_handler(formatter))
+        root_logger.addHandler(get_handler())
 
         # with this pattern, it's rarely necessary to propagate the error up to parent
         root_logger.propagate = False
 
-    log_wrapper.logger = root_logger
-    return log_wrapper
+    # Racing threads may both build one on first use - harmless, they wrap the same logging.Logger
+    distributed_logger = _loggers.get(logger_name)
+    if distributed_logger is None:
+        distributed_logger = _loggers.setdefault(logger_name, DistributedLogger(root_logger))
+
+    return distributed_logger
 
 
 def set_logger_tag(log_tag):
-    log_wrapper.tag = log_tag
+    """Tag for the current thread/task only"""
+    _log_tag.set(log_tag)
 
 
 def set_logger_silent(log_silent):
-    log_wrapper.silent = log_silent
+    """Silence the current thread/task only"""
+    _log_silent.set(log_silent)
+
+
+@contextmanager
+def log_context(tag=None, **fields) -> Iterator[None]:
+    """Tag and/or extra fields (e.g. job_id) on every record logged by this thread/task inside the block, restored
+    on exit - use this around pool jobs, since pool threads are reused
+
+    """
+    tag_token = _log_tag.set(tag) if tag is not None else None
+    fields_token = _log_fields.set({**_log_fields.get(), **fields}) if fields else None
+
+    try:
+        yield
+
+    finally:
+        if fields_token is not None:
+            _log_fields.reset(fields_token)
+
+        if tag_token is not None:
+            _log_tag.reset(tag_token)
 
 
 def log_function_entry_and_exit(decorated_function):
     """
     Function decorator logging entry + exit and parameters of functions.
 
-    Entry and exit as logging.info, parameters as logging.DEBUG.
+    Entry and exit as logging.info, parameters as logging.DEBUG. The time taken also goes to the profiling registry
+    (see src.common.metrics.profiling), so decorated functions show up in the SIGUSR1 report.
     """
 
     @functools.wraps(decorated_function)
     def wrapper(*dec_fn_args, **dec_fn_kwargs):
+        # Imported here - profiling itself logs through this module
+        from src.common.metrics.profiling import call_profiled, function_name
+
         # Log function entry
         func_name = decorated_function.__qualname__
         name_dict = dict(func_name=func_name)
@@ -117,7 +365,7 @@ def log_function_entry_and_exit(decorated_function):
 
         # Execute wrapped (decorated) function:
         start_time = time.perf_counter()
-        out = decorated_function(*dec_fn_args, **dec_fn_kwargs)
+        out = call_profiled(function_name(decorated_function), decorated_function, *dec_fn_args, **dec_fn_kwargs)
         end_time = time.perf_counter()
 
         logging.info(f"<<< Exiting function: {func_name}. Time taken: {end_time-start_time} secs", extra=name_dict)
@@ -0,0 +1,107 @@
+import logging
+
+import pytest
+
+import src.config as config
+
+from src.common.logger import logger as logger_module
+from src.common.logger.logger import CallSiteLimiter, DistributedLogger
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(logger_module, "time", fake)
+    return fake
+
+
+def allowed(limiter: CallSiteLimiter, calls: int, **kwargs) -> list:
+    params = {"sample_first_n": 0, "sample_rate": 1.0, "rate_per_sec": 0, "burst": 1, **kwargs}
+    return [limiter.allow(**params) for _ in range(calls)]
+
+
+def test_first_n_then_one_in_every(clock):
+    limiter = CallSiteLimiter(burst=1)
+
+    results = allowed(limiter, 10, sample_first_n=3, sample_rate=0.25)
+
+    assert results == [True, True, True, False, False, False, True, False, False, False]
+    assert limiter.suppressed == 6
+
+
+def test_zero_sample_rate_drops_everything_after_first_n(clock):
+    limiter = CallSiteLimiter(burst=1)
+
+    assert allowed(limiter, 4, sample_first_n=1, sample_rate=0.0) == [True, False, False, False]
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    limiter = CallSiteLimiter(burst=3)
+
+    assert allowed(limiter, 4, rate_per_sec=2, burst=3) == [True, True, True, False]
+
+    clock.now += 1.0
+    assert allowed(limiter, 3, rate_per_sec=2, burst=3) == [True, True, False]
+
+    # Never refills past the burst
+    clock.now += 60
+    assert allowed(limiter, 4, rate_per_sec=2, burst=3) == [True, True, True, False]
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_suppressed_count_is_reported_on_the_next_record(monkeypatch):
+    monkeypatch.setattr(config, "LOG_SAMPLE_FIRST_N", 1)
+    handler = ListHandler()
+    logging_logger = logging.getLogger("tests.call_site_limiter")
+    logging_logger.setLevel(logging.INFO)
+    logging_logger.propagate = False
+    logging_logger.addHandler(handler)
+    logger = DistributedLogger(logging_logger)
+
+    for i in range(5):
+        logger.info("hot loop %s", i, sample_rate=0.5)
+    logger.warning("never dropped", sample_rate=0.0)
+
+    assert [record.getMessage() for record in handler.records] == [
+        "::hot loop 0",
+        "::hot loop 2",
+        "::hot loop 4",
+        "::never dropped",
+    ]
+    assert not hasattr(handler.records[0], "suppressed")
+    assert handler.records[1].suppressed == 1
+    assert handler.records[2].suppressed == 1
+    logging_logger.removeHandler(handler)
+
+
+def test_log_takes_a_sample_rate_too(monkeypatch):
+    monkeypatch.setattr(config, "LOG_SAMPLE_FIRST_N", 1)
+    handler = ListHandler()
+    logging_logger = logging.getLogger("tests.call_site_limiter.log")
+    logging_logger.setLevel(logging.INFO)
+    logging_logger.propagate = False
+    logging_logger.addHandler(handler)
+    logger = DistributedLogger(logging_logger)
+
+    for i in range(3):
+        logger.log(logging.INFO, "hot loop %s", i, sample_rate=0.5)
+
+    assert [record.getMessage() for record in handler.records] == ["::hot loop 0", "::hot loop 2"]
+    assert handler.records[0].funcName == "test_log_takes_a_sample_rate_too"
+    logging_logger.removeHandler(handler)
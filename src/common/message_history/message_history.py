@@ -1,36 +1,104 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage, messages_from_dict, message_to_dict
 
+import src.config as config
+
 from src.common.data_models import models
 
 from src.common.logger.logger import get_logger
+from src.common.metrics.tracing import SpanKind, start_span
 
 logger = get_logger(__name__)
 
 
 class SqlMessageHistory(BaseChatMessageHistory):
-    """Chat message history backed by MySQL."""
+    """Chat message history backed by MySQL.
+
+    Only the most recent window_size messages are loaded (newest first, ORDER BY ... LIMIT on the
+    (session_id, deleted_at, created_at) index), so a turn in a long session doesn't read and decode the whole
+    conversation. load_older() pages further back on demand.
 
-    def __init__(self, session_id: int, user_id: int, client_id: int):
+    """
+
+    def __init__(
+        self,
+        session_id: int,
+        user_id: int,
+        client_id: int,
+        window_size: Optional[int] = config.CHAT_HISTORY_WINDOW_SIZE,
+    ):
         """
         Initialize a new instance of the SqlMessageHistory class.
 
+        :param int window_size: Most recent messages to load, None or 0 loads the whole session
         """
         self.session_id = session_id
         self.user_id = user_id
         self.client_id = client_id
+        self.window_size = window_size
         self.messages: List[BaseMessage] = []
+        # Whether the session has messages before the loaded ones
+        self.has_older = False
+        # (created_at, id) of the oldest loaded row, where load_older() continues from
+        self._oldest_loaded = None
 
         self.prepare_data()
 
     def prepare_data(self) -> None:
         """Prepare the Data."""
-        histories = models.ChatHistories.select(models.ChatHistories.message).where(
-            models.ChatHistories.session_id == self.session_id, models.ChatHistories.deleted_at.is_null()
+        with start_span("chat_history.load", kind=SpanKind.CLIENT, attributes={"db.system": "mysql"}) as span:
+            self.messages = self._fetch_page(self.window_size)
+            span.set_attribute("messages", len(self.messages))
+
+    def load_older(self, page_size: Optional[int] = None) -> List[BaseMessage]:
+        """Prepend the page of messages before the oldest loaded one.
+
+        :param int page_size: Defaults to window_size, None/0 loads everything that is left
+        :return: The newly loaded messages, oldest first (empty once there are no more)
+        """
+        if not self.has_older:
+            return []
+
+        with start_span("chat_history.load_older", kind=SpanKind.CLIENT, attributes={"db.system": "mysql"}) as span:
+            older = self._fetch_page(page_size if page_size is not None else self.window_size, self._oldest_loaded)
+            self.messages = older + self.messages
+            span.set_attribute("messages", len(older))
+
+        return older
+
+    def _fetch_page(self, limit: Optional[int], before=None) -> List[BaseMessage]:
+        """Up to limit messages before the (created_at, id) cursor - or the latest ones without one - oldest first"""
+        chat_histories = models.ChatHistories
+        query = chat_histories.select(chat_histories.id, chat_histories.created_at, chat_histories.message).where(
+            chat_histories.session_id == self.session_id, chat_histories.deleted_at.is_null()
         )
-        self.messages = messages_from_dict([h.message for h in histories])
+
+        if before is not None:
+            created_at, history_id = before
+            # Keyset pagination, id breaks ties between messages saved within the same second
+            query = query.where(
+                (chat_histories.created_at < created_at)
+                | ((chat_histories.created_at == created_at) & (chat_histories.id < history_id))
+            )
+
+        query = query.order_by(chat_histories.created_at.desc(), chat_histories.id.desc())
+        if limit:
+            # One extra row tells us whether there is anything left to page through
+            query = query.limit(limit + 1)
+
+        # Replica, unless this job already wrote to the primary
+        histories = list(models.read_only(query))
+
+        self.has_older = bool(limit) and len(histories) > limit
+        histories = histories[:limit] if limit else histories
+        histories.reverse()
+
+        if histories:
+            self._oldest_loaded = (histories[0].created_at, histories[0].id)
+
+        return messages_from_dict([h.message for h in histories])
 
     def add_message(self, message: BaseMessage) -> None:
         now = datetime.now()
@@ -41,10 +109,13 @@ class SqlMessageHistory(BaseChatMessageHistory):
         history.session_id = self.session_id
         history.message = message_to_dict(message)
         history.created_at = now
-        history.save()
+        with start_span("chat_history.add_message", kind=SpanKind.CLIENT, attributes={"db.system": "mysql"}):
+            history.save()
         logger.info(f"SAVED MESSAGE HISTORY")
 
     def clear(self) -> None:
         self.messages = []
+        self.has_older = False
+        self._oldest_loaded = None
         models.ChatHistories.delete().where(models.ChatHistories.session_id == self.session_id).execute()
         logger.info(f"SAVED MESSAGE HISTORY:  {self.message_history_type}")
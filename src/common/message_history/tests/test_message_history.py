@@ -0,0 +1,122 @@
+import types
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from langchain_core.messages import HumanMessage, message_to_dict
+from peewee import CharField, DateTimeField, IntegerField, Model, SqliteDatabase
+
+from src.common.data_models.models import JSONField
+from src.common.message_history import message_history
+from src.common.message_history.message_history import SqlMessageHistory
+
+
+db = SqliteDatabase(":memory:")
+
+
+class ChatHistories(Model):
+    user_id = IntegerField()
+    client_id = IntegerField()
+    session_id = CharField()
+    message = JSONField(null=True)
+    created_at = DateTimeField()
+    deleted_at = DateTimeField(null=True)
+
+    class Meta:
+        database = db
+        table_name = "ChatHistories"
+
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def database(monkeypatch):
+    db.connect(reuse_if_open=True)
+    db.create_tables([ChatHistories])
+    monkeypatch.setattr(
+        message_history, "models", types.SimpleNamespace(ChatHistories=ChatHistories, read_only=lambda query: query)
+    )
+
+    yield
+
+    db.drop_tables([ChatHistories])
+    db.close()
+
+
+def add_messages(count: int, session_id: str = "s1", same_second: bool = False):
+    for i in range(count):
+        ChatHistories.create(
+            user_id=1,
+            client_id=1,
+            session_id=session_id,
+            message=message_to_dict(HumanMessage(content=f"{session_id}-{i}")),
+            # Saved within the same second, only the id orders them
+            created_at=START if same_second else START + timedelta(seconds=i),
+        )
+
+
+def contents(messages) -> list:
+    return [message.content for message in messages]
+
+
+def test_loads_only_the_latest_window_oldest_first():
+    add_messages(5)
+    add_messages(3, session_id="other")
+
+    history = SqlMessageHistory("s1", 1, 1, window_size=2)
+
+    assert contents(history.messages) == ["s1-3", "s1-4"]
+    assert history.has_older is True
+
+
+def test_short_session_has_nothing_older():
+    add_messages(2)
+
+    history = SqlMessageHistory("s1", 1, 1, window_size=2)
+
+    assert contents(history.messages) == ["s1-0", "s1-1"]
+    assert history.has_older is False
+    assert history.load_older() == []
+
+
+@pytest.mark.parametrize("same_second", [False, True])
+def test_load_older_pages_back_to_the_start(same_second):
+    add_messages(5, same_second=same_second)
+    history = SqlMessageHistory("s1", 1, 1, window_size=2)
+
+    assert contents(history.load_older()) == ["s1-1", "s1-2"]
+    assert history.has_older is True
+    assert contents(history.load_older()) == ["s1-0"]
+    assert history.has_older is False
+    assert history.load_older() == []
+
+    assert contents(history.messages) == [f"s1-{i}" for i in range(5)]
+
+
+def test_load_older_without_page_size_loads_the_rest():
+    add_messages(5)
+    history = SqlMessageHistory("s1", 1, 1, window_size=1)
+
+    assert contents(history.load_older(page_size=0)) == ["s1-0", "s1-1", "s1-2", "s1-3"]
+    assert history.has_older is False
+
+
+def test_deleted_messages_are_skipped():
+    add_messages(3)
+    ChatHistories.update(deleted_at=START).where(ChatHistories.id == 3).execute()
+
+    history = SqlMessageHistory("s1", 1, 1, window_size=2)
+
+    assert contents(history.messages) == ["s1-0", "s1-1"]
+    assert history.has_older is False
+
+
+def test_no_window_loads_everything():
+    add_messages(4)
+
+    history = SqlMessageHistory("s1", 1, 1, window_size=None)
+
+    assert contents(history.messages) == [f"s1-{i}" for i in range(4)]
+    assert history.has_older is False
@@ -0,0 +1,190 @@
+import bisect
+import math
+
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Seconds - covers everything from a fast ack to a long extraction job
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+
+def _label_values(labels: dict) -> LabelValues:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_values: LabelValues, extra: Optional[dict] = None) -> str:
+    items = list(label_values) + list((extra or {}).items())
+    if not items:
+        return ""
+
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+
+    return repr(float(value))
+
+
+class Metric(object):
+    type_name = ""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._lock = Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        return lines + self._render_samples()
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing value, e.g. messages processed"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str = ""):
+        super().__init__(name, description)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_values(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in self._values.items()]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {_format_labels(k): v for k, v in self._values.items()}
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. messages in flight"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_values(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values, e.g. processing time in seconds"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_values(labels)
+        index = bisect.bisect_left(self._buckets, value)
+
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self._buckets) + 2)
+
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, values in self._values.items():
+                cumulative = 0
+                for bucket, bucket_count in zip(self._buckets, values):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, {'le': _format_value(bucket)})} {cumulative}")
+
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {values[-1]}")
+
+        return lines
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                _format_labels(k): {"sum": v[-2], "count": v[-1], "mean": v[-2] / v[-1] if v[-1] else 0}
+                for k, v in self._values.items()
+            }
+
+
+class MetricsRegistry(object):
+    """Process-wide collection of metrics. Asking for the same name twice returns the same metric, so every
+    consumer/reconnect adds to the same series.
+
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = Lock()
+
+    def _get_or_create(self, metric_class, name: str, description: str, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, description, **kwargs)
+
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return registry
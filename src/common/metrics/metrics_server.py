@@ -0,0 +1,74 @@
+import json
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Optional
+
+import src.config as config
+
+from src.common.logger.logger import get_logger
+from src.common.metrics.metrics import MetricsRegistry, get_metrics_registry
+
+
+logger = get_logger(__name__)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.registry.render_prometheus().encode()
+            content_type = "text/plain; version=0.0.4"
+
+        elif self.path == "/metrics.json":
+            body = json.dumps(self.registry.snapshot()).encode()
+            content_type = "application/json"
+
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood stdout
+        pass
+
+
+def start_metrics_server(
+    port: Optional[int] = config.METRICS_PORT,
+    registry: Optional[MetricsRegistry] = None,
+) -> Optional[ThreadingHTTPServer]:
+    """Serve the registry on /metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+    :param int port: Port to listen on. 0/None disables the server
+    :param MetricsRegistry registry: Defaults to the process-wide registry
+    :return: The server, or None if it is disabled or the port couldn't be bound - metrics are never worth failing
+        the worker's start-up for
+    """
+    if not port:
+        logger.info("Metrics server disabled")
+        return None
+
+    handler = type(
+        "BoundMetricsRequestHandler", (MetricsRequestHandler,), {"registry": registry or get_metrics_registry()}
+    )
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+
+    except OSError as e:
+        logger.error(f"Metrics server couldn't listen on :{port}, running without it. E:{e}")
+        return None
+
+    server.daemon_threads = True
+
+    Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics server listening on :{port}/metrics")
+
+    return server
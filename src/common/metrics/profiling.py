@@ -0,0 +1,338 @@
+import cProfile
+import functools
+import inspect
+import io
+import math
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+
+from collections import deque
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+import src.config as config
+
+from src.common.logger.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class FunctionStats(object):
+    """Call count, errors and cumulative time for one function, plus a window of the most recent durations for
+    percentiles"""
+
+    def __init__(self, reservoir_size: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=reservoir_size)
+        self._lock = Lock()
+
+    def record(self, duration: float, failed: bool = False):
+        with self._lock:
+            self.count += 1
+            self.errors += int(failed)
+            self.total += duration
+            self.max = max(self.max, duration)
+            self._recent.append(duration)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, errors, total, max_duration = self.count, self.errors, self.total, self.max
+
+        return {
+            "count": count,
+            "errors": errors,
+            "total_secs": total,
+            "mean_secs": total / count if count else 0.0,
+            "p50_secs": _percentile(recent, 50),
+            "p95_secs": _percentile(recent, 95),
+            "p99_secs": _percentile(recent, 99),
+            "max_secs": max_duration,
+        }
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+
+    # Nearest rank
+    rank = max(math.ceil(percentile / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class ProfilingRegistry(object):
+    """In-memory per-function latency stats for this process. Fed by @profile_function and
+    log_function_entry_and_exit, dumped on SIGUSR1.
+
+    Process pool children (use_process_pool workers, e.g. knowledge extraction) each have their own registry, which
+    is never reported back to the parent - the parent only sees the consumer-level metrics for those jobs.
+
+    """
+
+    def __init__(self, reservoir_size: Optional[int] = config.PROFILING_RESERVOIR_SIZE):
+        self._reservoir_size = reservoir_size
+        self._stats: Dict[str, FunctionStats] = {}
+        self._lock = Lock()
+
+    def record(self, name: str, duration: float, failed: bool = False):
+        stats = self._stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(name, FunctionStats(self._reservoir_size))
+
+        stats.record(duration, failed)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            items = list(self._stats.items())
+
+        return {name: stats.snapshot() for name, stats in items}
+
+    def format_report(self, limit: Optional[int] = None) -> str:
+        """Plain text table, functions with the most cumulative time first"""
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]["total_secs"], reverse=True)[:limit]
+
+        lines = [f"{'function':<60} {'count':>8} {'errors':>6} {'total':>10} {'p50':>9} {'p95':>9} {'p99':>9}"]
+        for name, s in rows:
+            lines.append(
+                f"{name[-60:]:<60} {s['count']:>8} {s['errors']:>6} {s['total_secs']:>10.3f} "
+                f"{s['p50_secs']:>9.4f} {s['p95_secs']:>9.4f} {s['p99_secs']:>9.4f}"
+            )
+
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+registry = ProfilingRegistry()
+
+
+def get_profiling_registry() -> ProfilingRegistry:
+    return registry
+
+
+def function_name(fn: Callable) -> str:
+    return f"{getattr(fn, '__module__', '?')}.{getattr(fn, '__qualname__', repr(fn))}"
+
+
+class CProfileSession(object):
+    """On-demand cProfile sampling. cProfile only sees the thread that enabled it, so while a session is active
+    every @profile_function call (i.e. every message a worker thread processes) runs under its own profiler and
+    the results are merged here. On Python 3.12+ only one profiler can be active per process, calls starting while
+    another thread is profiled just run unprofiled. Process pool children aren't sampled.
+
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = Lock()
+
+    def add(self, profiler: cProfile.Profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+
+    def format_report(self, limit: Optional[int] = config.PROFILING_REPORT_LIMIT) -> str:
+        with self._lock:
+            if self._stats is None:
+                return "No profiled calls"
+
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+
+        return out.getvalue()
+
+
+_cprofile_session: Optional[CProfileSession] = None
+# cProfile can't nest within one thread
+_profiling_thread = threading.local()
+
+
+def _run_profiled(fn: Callable, args, kwargs):
+    session = _cprofile_session
+
+    if session is None or getattr(_profiling_thread, "active", False):
+        return fn(*args, **kwargs)
+
+    profiler = cProfile.Profile()
+
+    try:
+        profiler.enable()
+
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process ("Another profiling tool is already active"), so
+        # concurrent jobs there run unprofiled while another thread's is being sampled
+        return fn(*args, **kwargs)
+
+    _profiling_thread.active = True
+
+    try:
+        return fn(*args, **kwargs)
+
+    finally:
+        profiler.disable()
+        _profiling_thread.active = False
+        session.add(profiler)
+
+
+def call_profiled(name: str, fn: Callable, *args, **kwargs):
+    """One-off version of @profile_function, for callables that can't be wrapped up front (e.g. message processors
+    that have to stay picklable for the process pool)"""
+    start_time = time.perf_counter()
+    failed = True
+
+    try:
+        out = _run_profiled(fn, args, kwargs)
+        failed = False
+        return out
+
+    finally:
+        registry.record(name, time.perf_counter() - start_time, failed)
+
+
+def profile_function(fn: Optional[Callable] = None, *, name: Optional[str] = None):
+    """Record every call's duration (and whether it raised) in the profiling registry, and run it under cProfile
+    while a sampling session is active. Works on plain and async def functions.
+
+        @profile_function
+        def chat(...): ...
+
+        @profile_function(name="extraction.parse_pdf")
+        def parse(...): ...
+
+    """
+
+    def decorator(decorated_function: Callable):
+        func_name = name or function_name(decorated_function)
+
+        if inspect.iscoroutinefunction(decorated_function):
+
+            @functools.wraps(decorated_function)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                failed = True
+
+                try:
+                    out = await decorated_function(*args, **kwargs)
+                    failed = False
+                    return out
+
+                finally:
+                    registry.record(func_name, time.perf_counter() - start_time, failed)
+
+            return async_wrapper
+
+        @functools.wraps(decorated_function)
+        def wrapper(*args, **kwargs):
+            return call_profiled(func_name, decorated_function, *args, **kwargs)
+
+        return wrapper
+
+    return decorator(fn) if fn is not None else decorator
+
+
+def start_cprofile_session():
+    global _cprofile_session
+
+    if _cprofile_session is None:
+        _cprofile_session = CProfileSession()
+        logger.info("cProfile sampling started")
+
+
+def stop_cprofile_session() -> Optional[str]:
+    """:return: The merged cProfile report, or None if no session was running"""
+    global _cprofile_session
+
+    session, _cprofile_session = _cprofile_session, None
+    if session is None:
+        return None
+
+    logger.info(f"cProfile sampling stopped after {time.time() - session.started_at:.1f} secs")
+    return session.format_report()
+
+
+def start_tracemalloc():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(config.PROFILING_TRACEMALLOC_FRAMES)
+        logger.info("tracemalloc started")
+
+
+def stop_tracemalloc() -> Optional[str]:
+    """:return: Top allocation sites at the time it was stopped, or None if it wasn't tracing"""
+    if not tracemalloc.is_tracing():
+        return None
+
+    report = format_tracemalloc_snapshot()
+    tracemalloc.stop()
+    logger.info("tracemalloc stopped")
+
+    return report
+
+
+def format_tracemalloc_snapshot(limit: Optional[int] = config.PROFILING_REPORT_LIMIT) -> str:
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+
+    lines = [f"tracemalloc: current={current / 2 ** 20:.1f} MiB, peak={peak / 2 ** 20:.1f} MiB"]
+    lines += [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+
+    return "\n".join(lines)
+
+
+def dump_profiling_report():
+    """Function stats, plus a tracemalloc snapshot if it is tracing"""
+    logger.info(f"Profiling report:\n{registry.format_report(config.PROFILING_REPORT_LIMIT)}")
+
+    if tracemalloc.is_tracing():
+        logger.info(format_tracemalloc_snapshot())
+
+
+def toggle_sampling():
+    """Start cProfile/tracemalloc (per PROFILING_SAMPLE_MODE), or stop them and dump what they collected"""
+    modes = config.PROFILING_SAMPLE_MODE
+
+    if _cprofile_session is not None or tracemalloc.is_tracing():
+        cprofile_report = stop_cprofile_session()
+        if cprofile_report is not None:
+            logger.info(f"cProfile report:\n{cprofile_report}")
+
+        tracemalloc_report = stop_tracemalloc()
+        if tracemalloc_report is not None:
+            logger.info(tracemalloc_report)
+
+    else:
+        if "cprofile" in modes:
+            start_cprofile_session()
+
+        if "tracemalloc" in modes:
+            start_tracemalloc()
+
+
+def _in_background(fn: Callable):
+    # Signal handlers interrupt the main thread anywhere (e.g. while it holds the logging queue's lock) - do the
+    # actual work on a fresh thread
+    def handler(signum: int, frame):
+        Thread(target=fn, name=f"profiling-{signal.Signals(signum).name}", daemon=True).start()
+
+    return handler
+
+
+def install_profiling_signal_handlers():
+    """SIGUSR1 dumps the report, SIGUSR2 starts/stops cProfile/tracemalloc sampling. Must be called from the main
+    thread. Pool child processes keep their own stats and don't get the signals"""
+    signal.signal(signal.SIGUSR1, _in_background(dump_profiling_report))
+    signal.signal(signal.SIGUSR2, _in_background(toggle_sampling))
+    logger.info("Profiling: SIGUSR1 dumps the report, SIGUSR2 starts/stops cProfile/tracemalloc sampling")
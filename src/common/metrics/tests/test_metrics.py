@@ -0,0 +1,63 @@
+import socket
+
+import pytest
+
+from src.common.metrics.metrics import MetricsRegistry
+from src.common.metrics.metrics_server import start_metrics_server
+
+
+def test_counter_and_gauge_rendering():
+    registry = MetricsRegistry()
+    messages = registry.counter("messages_total", "Messages processed")
+    messages.inc(queue="chat", status="ok")
+    messages.inc(2, queue="chat", status="ok")
+    in_flight = registry.gauge("in_flight", "Messages in flight")
+    in_flight.set(3)
+    in_flight.dec()
+
+    assert registry.render_prometheus() == (
+        "# HELP messages_total Messages processed\n"
+        "# TYPE messages_total counter\n"
+        'messages_total{queue="chat",status="ok"} 3.0\n'
+        "# HELP in_flight Messages in flight\n"
+        "# TYPE in_flight gauge\n"
+        "in_flight 2.0\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.observe(value, queue="q")
+
+    lines = registry.render_prometheus().splitlines()
+
+    assert lines[2:] == [
+        'latency_seconds_bucket{queue="q",le="0.1"} 2',
+        'latency_seconds_bucket{queue="q",le="1.0"} 3',
+        'latency_seconds_bucket{queue="q",le="+Inf"} 4',
+        'latency_seconds_sum{queue="q"} 5.65',
+        'latency_seconds_count{queue="q"} 4',
+    ]
+    assert latency.snapshot()['{queue="q"}']["count"] == 4
+
+
+def test_same_name_returns_same_metric():
+    registry = MetricsRegistry()
+
+    assert registry.counter("a") is registry.counter("a")
+    with pytest.raises(ValueError):
+        registry.histogram("a")
+
+
+def test_server_survives_port_in_use():
+    with socket.socket() as taken:
+        taken.bind(("0.0.0.0", 0))
+        taken.listen()
+
+        assert start_metrics_server(taken.getsockname()[1], MetricsRegistry()) is None
+
+
+def test_server_disabled_without_port():
+    assert start_metrics_server(0) is None
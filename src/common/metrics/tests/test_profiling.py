@@ -0,0 +1,93 @@
+import pytest
+
+from src.common.metrics import profiling
+from src.common.metrics.profiling import ProfilingRegistry, _percentile, profile_function
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+
+    assert _percentile([], 50) == 0.0
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 99) == 99.0
+    assert _percentile([3.0], 95) == 3.0
+
+
+def test_registry_aggregates_per_function():
+    registry = ProfilingRegistry(reservoir_size=10)
+    for duration in (1.0, 2.0, 3.0):
+        registry.record("a", duration)
+    registry.record("a", 4.0, failed=True)
+    registry.record("b", 0.5)
+
+    snapshot = registry.snapshot()
+
+    assert snapshot["a"]["count"] == 4
+    assert snapshot["a"]["errors"] == 1
+    assert snapshot["a"]["total_secs"] == 10.0
+    assert snapshot["a"]["mean_secs"] == 2.5
+    assert snapshot["a"]["max_secs"] == 4.0
+    assert snapshot["a"]["p50_secs"] == 2.0
+    assert snapshot["b"]["count"] == 1
+
+
+def test_reservoir_keeps_recent_durations_only():
+    registry = ProfilingRegistry(reservoir_size=2)
+    for duration in (10.0, 1.0, 2.0):
+        registry.record("a", duration)
+
+    stats = registry.snapshot()["a"]
+
+    # Percentiles come from the window, totals from every call
+    assert stats["p99_secs"] == 2.0
+    assert stats["max_secs"] == 10.0
+    assert stats["count"] == 3
+
+
+def test_report_orders_by_total_time():
+    registry = ProfilingRegistry(reservoir_size=10)
+    registry.record("fast", 0.1)
+    registry.record("slow", 5.0)
+
+    lines = registry.format_report().splitlines()
+
+    assert lines[1].startswith("slow")
+    assert lines[2].startswith("fast")
+    assert len(registry.format_report(limit=1).splitlines()) == 2
+
+
+def test_profile_function_records_failures(monkeypatch):
+    registry = ProfilingRegistry(reservoir_size=10)
+    monkeypatch.setattr(profiling, "registry", registry)
+
+    @profile_function(name="job")
+    def job(fail: bool):
+        if fail:
+            raise RuntimeError("boom")
+        return "ok"
+
+    assert job(False) == "ok"
+    with pytest.raises(RuntimeError):
+        job(True)
+
+    stats = registry.snapshot()["job"]
+    assert (stats["count"], stats["errors"]) == (2, 1)
+
+
+class BusyProfile(object):
+    """cProfile.Profile on Python 3.12+ while another thread is profiling"""
+
+    def enable(self):
+        raise ValueError("Another profiling tool is already active")
+
+
+def test_runs_unprofiled_when_profiler_is_busy(monkeypatch):
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+    profiling.start_cprofile_session()
+
+    try:
+        assert profiling.call_profiled("busy", lambda x: x * 2, 21) == 42
+        assert not getattr(profiling._profiling_thread, "active", False)
+
+    finally:
+        profiling.stop_cprofile_session()
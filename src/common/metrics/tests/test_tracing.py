@@ -0,0 +1,103 @@
+import pytest
+
+import src.config as config
+
+from src.common.metrics import tracing
+from src.common.metrics.tracing import (
+    TRACEPARENT_HEADER,
+    InMemorySpanExporter,
+    SpanContext,
+    StatusCode,
+    extract,
+    inject,
+    start_span,
+)
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture
+def exporter():
+    previous = tracing.get_exporter()
+    in_memory = InMemorySpanExporter()
+    tracing.set_exporter(in_memory)
+    yield in_memory
+    tracing.set_exporter(previous)
+
+
+@pytest.fixture
+def always_sample(monkeypatch):
+    monkeypatch.setattr(config, "TRACING_SAMPLE_RATE", 1.0)
+
+
+def test_traceparent_round_trip():
+    context = SpanContext(TRACE_ID, SPAN_ID, sampled=False)
+
+    parsed = SpanContext.from_traceparent(context.to_traceparent())
+
+    assert (parsed.trace_id, parsed.span_id, parsed.sampled, parsed.is_remote) == (TRACE_ID, SPAN_ID, False, True)
+
+
+@pytest.mark.parametrize(
+    "traceparent",
+    [None, "", "garbage", f"01-{TRACE_ID}-{SPAN_ID}-01", f"00-{TRACE_ID[:-1]}-{SPAN_ID}-01"],
+)
+def test_invalid_traceparent_is_ignored(traceparent):
+    assert SpanContext.from_traceparent(traceparent) is None
+
+
+def test_extract_accepts_bytes_and_uppercase():
+    context = extract({TRACEPARENT_HEADER: f"00-{TRACE_ID.upper()}-{SPAN_ID}-01".encode()})
+
+    assert (context.trace_id, context.sampled) == (TRACE_ID, True)
+    assert extract(None) is None
+    assert extract({"other": "header"}) is None
+
+
+def test_inject_without_span_leaves_headers_alone():
+    headers = {"a": 1}
+
+    assert inject(headers) == {"a": 1}
+    assert inject(None) == {}
+
+
+def test_inject_extract_continues_the_trace(exporter, always_sample):
+    with start_span("publish") as producer:
+        headers = inject({"a": 1})
+
+    assert headers["a"] == 1
+    parent = extract(headers)
+    assert (parent.trace_id, parent.span_id) == (producer.context.trace_id, producer.context.span_id)
+
+    with start_span("consume", parent=parent) as consumer:
+        pass
+
+    assert consumer.context.trace_id == producer.context.trace_id
+    assert consumer.parent_span_id == producer.context.span_id
+    # A remote parent starts a new local root in this process
+    assert consumer.is_local_root
+
+
+def test_children_nest_and_errors_are_recorded(exporter, always_sample):
+    with pytest.raises(RuntimeError):
+        with start_span("root") as root:
+            with start_span("child") as child:
+                raise RuntimeError("boom")
+
+    assert child.parent_span_id == root.context.span_id
+    assert child.local_root_id == root.context.span_id
+    assert child.status_code == StatusCode.ERROR
+    assert [span.name for span in exporter.get_finished_spans(root.context.trace_id)] == ["child", "root"]
+
+
+def test_unsampled_traces_are_not_exported(exporter, monkeypatch):
+    monkeypatch.setattr(config, "TRACING_SAMPLE_RATE", 0.0)
+
+    with start_span("root") as root:
+        headers = inject()
+
+    assert not exporter.get_finished_spans()
+    assert extract(headers).sampled is False
+    assert root.end_time_unix_nano is not None
@@ -0,0 +1,429 @@
+import functools
+import inspect
+import random
+import re
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import src.config as config
+
+from src.common.logger.logger import get_logger, log_context
+
+
+logger = get_logger(__name__)
+
+
+# W3C trace context header, carried in the AMQP message headers
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class SpanKind(object):
+    INTERNAL = "INTERNAL"
+    SERVER = "SERVER"
+    CLIENT = "CLIENT"
+    PRODUCER = "PRODUCER"
+    CONSUMER = "CONSUMER"
+
+
+class StatusCode(object):
+    UNSET = "UNSET"
+    OK = "OK"
+    ERROR = "ERROR"
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """What crosses process boundaries (AMQP headers, process pool jobs). Picklable"""
+
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+    is_remote: bool = False
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, traceparent: Optional[str]) -> Optional["SpanContext"]:
+        if not traceparent:
+            return None
+
+        if isinstance(traceparent, bytes):
+            traceparent = traceparent.decode()
+
+        match = _TRACEPARENT_RE.match(traceparent.strip().lower())
+        if match is None:
+            return None
+
+        trace_id, span_id, flags = match.groups()
+        return cls(trace_id, span_id, sampled=bool(int(flags, 16) & 1), is_remote=True)
+
+
+def _new_id(bits: int) -> str:
+    # All zero ids are invalid in W3C trace context
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+class Span(object):
+    """One timed stage of a request. Same data model as an OpenTelemetry span (ids, kind, attributes, events, links,
+    status), so the exported dicts map 1:1 onto OTLP if we ever ship them to a collector.
+
+    """
+
+    __slots__ = (
+        "name",
+        "context",
+        "parent_span_id",
+        "kind",
+        "attributes",
+        "events",
+        "links",
+        "status_code",
+        "status_message",
+        "start_time_unix_nano",
+        "end_time_unix_nano",
+        "local_root_id",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        context: SpanContext,
+        parent: Optional[SpanContext] = None,
+        kind: str = SpanKind.INTERNAL,
+        attributes: Optional[dict] = None,
+        links: Optional[List[SpanContext]] = None,
+        local_root_id: Optional[str] = None,
+    ):
+        self.name = name
+        self.context = context
+        self.parent_span_id = parent.span_id if parent is not None else None
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.events = []
+        self.links = list(links) if links else []
+        self.status_code = StatusCode.UNSET
+        self.status_message = None
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+        # Outermost span of this trace in this process - finished spans are grouped under it for export
+        self.local_root_id = local_root_id or context.span_id
+
+    @property
+    def is_local_root(self) -> bool:
+        return self.local_root_id == self.context.span_id
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time_unix_nano is None:
+            return None
+
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[dict] = None):
+        self.events.append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes or {}})
+
+    def set_status(self, status_code: str, message: Optional[str] = None):
+        self.status_code = status_code
+        self.status_message = message
+
+    def record_exception(self, e: BaseException):
+        self.add_event("exception", {"exception.type": type(e).__name__, "exception.message": str(e)})
+        self.set_status(StatusCode.ERROR, f"{type(e).__name__}: {e}")
+
+    def end(self):
+        """Stamp the end time and hand the span to the exporter. Ending twice is a no-op"""
+        if self.end_time_unix_nano is not None:
+            return
+
+        self.end_time_unix_nano = time.time_ns()
+
+        if self.context.sampled:
+            _exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": self.end_time_unix_nano,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "events": self.events,
+            "links": [{"trace_id": link.trace_id, "span_id": link.span_id} for link in self.links],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+
+
+class SpanExporter(object):
+    def export(self, span: Span):
+        raise NotImplementedError
+
+
+class NoopSpanExporter(SpanExporter):
+    def export(self, span: Span):
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps the last max_spans finished spans in this process, for tests and ad hoc inspection"""
+
+    def __init__(self, max_spans: int = config.TRACING_MAX_SPANS_PER_TRACE):
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def get_finished_spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        return [span for span in list(self._spans) if trace_id is None or span.context.trace_id == trace_id]
+
+    def clear(self):
+        self._spans.clear()
+
+
+class LogSpanExporter(SpanExporter):
+    """Writes traces to stdout through the (JSON) log pipeline. Finished spans are held back until the outermost span
+    of their trace in this process ends, then logged as one record: a readable stage-by-stage breakdown as the
+    message, plus every span as a dict under "spans".
+
+    """
+
+    def __init__(self, max_spans_per_trace: int = config.TRACING_MAX_SPANS_PER_TRACE):
+        self._max_spans_per_trace = max_spans_per_trace
+        # local root span_id -> [finished child spans]
+        self._pending: Dict[str, List[Span]] = {}
+        self._lock = Lock()
+
+    def open(self, span: Span):
+        """Start collecting for a local root span"""
+        with self._lock:
+            self._pending.setdefault(span.context.span_id, [])
+
+    def export(self, span: Span):
+        if not span.is_local_root:
+            with self._lock:
+                children = self._pending.get(span.local_root_id)
+                if children is not None:
+                    if len(children) < self._max_spans_per_trace:
+                        children.append(span)
+                    return
+
+            # Outlived its root (e.g. a fire-and-forget task) - log it on its own
+            self._log([span])
+            return
+
+        with self._lock:
+            children = self._pending.pop(span.context.span_id, [])
+
+        self._log([span] + children)
+
+    @staticmethod
+    def _log(spans: List[Span]):
+        root = spans[0]
+        logger.info(
+            "Trace %s: %s\n%s",
+            root.context.trace_id,
+            root.name,
+            format_breakdown(spans),
+            extra={"trace_id": root.context.trace_id, "spans": [span.to_dict() for span in spans]},
+            # Already sampled by TRACING_SAMPLE_RATE
+            sample_rate=1.0,
+        )
+
+
+def format_breakdown(spans: List[Span]) -> str:
+    """Indented span tree with durations, children in start order"""
+    span_ids = {span.context.span_id for span in spans}
+    children = {}
+    roots = []
+
+    for span in sorted(spans, key=lambda s: s.start_time_unix_nano):
+        if span.parent_span_id in span_ids:
+            children.setdefault(span.parent_span_id, []).append(span)
+        else:
+            roots.append(span)
+
+    lines = []
+
+    def add(span: Span, depth: int):
+        status = " ERROR" if span.status_code == StatusCode.ERROR else ""
+        lines.append(f"{'  ' * depth}{span.name} {span.duration_ms or 0:.1f} ms{status}")
+        for child in children.get(span.context.span_id, []):
+            add(child, depth + 1)
+
+    for span in roots:
+        add(span, 0)
+
+    return "\n".join(lines)
+
+
+def _get_exporter(name: str) -> SpanExporter:
+    if name == "log":
+        return LogSpanExporter()
+
+    if name == "memory":
+        return InMemorySpanExporter()
+
+    if name != "none":
+        logger.warning(f"Unknown TRACING_EXPORTER {name}, tracing is off")
+
+    return NoopSpanExporter()
+
+
+_exporter = _get_exporter(config.TRACING_EXPORTER)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def get_exporter() -> SpanExporter:
+    return _exporter
+
+
+def set_exporter(exporter: SpanExporter):
+    global _exporter
+    _exporter = exporter
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def create_span(
+    name: str,
+    kind: str = SpanKind.INTERNAL,
+    parent: Optional[Union[Span, SpanContext]] = None,
+    attributes: Optional[dict] = None,
+    links: Optional[List[SpanContext]] = None,
+) -> Span:
+    """A started span that is NOT made current - the caller has to end() it. For stages whose start and end come in
+    separate callbacks (e.g. langchain's); everything else should use start_span().
+
+    :param parent: Defaults to the current span. A SpanContext (e.g. from AMQP headers) starts a new local root
+    """
+    if parent is None:
+        parent = _current_span.get()
+
+    # A span parent keeps us in its local tree, a bare context (from another process) starts a new one
+    local_root_id = None
+    if isinstance(parent, Span):
+        local_root_id = parent.local_root_id
+        parent = parent.context
+
+    if parent is not None:
+        context = SpanContext(parent.trace_id, _new_id(64), sampled=parent.sampled)
+
+    else:
+        # New trace - the sampling decision is made here and inherited by everything downstream
+        context = SpanContext(_new_id(128), _new_id(64), sampled=random.random() < config.TRACING_SAMPLE_RATE)
+
+    span = Span(name, context, parent, kind, attributes, links, local_root_id)
+
+    if span.is_local_root and context.sampled and isinstance(_exporter, LogSpanExporter):
+        _exporter.open(span)
+
+    return span
+
+
+@contextmanager
+def start_span(
+    name: str,
+    kind: str = SpanKind.INTERNAL,
+    parent: Optional[Union[Span, SpanContext]] = None,
+    attributes: Optional[dict] = None,
+    links: Optional[List[SpanContext]] = None,
+) -> Iterator[Span]:
+    """Time the block as a span, current for everything it calls. Exceptions are recorded on the span and re-raised.
+
+        with start_span("vectorstore.search", attributes={"k": 5}) as span:
+            ...
+
+    Local root spans (the first one of a trace in this process) also put trace_id on every log record of the block.
+    """
+    span = create_span(name, kind, parent, attributes, links)
+    token = _current_span.set(span)
+
+    try:
+        if span.is_local_root:
+            with log_context(trace_id=span.context.trace_id):
+                yield span
+        else:
+            yield span
+
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(fn: Optional[Callable] = None, *, name: Optional[str] = None, kind: str = SpanKind.INTERNAL):
+    """Run every call of the function in a span. Works on plain and async def functions.
+
+        @traced
+        def chat(...): ...
+
+        @traced(name="translation.google", kind=SpanKind.CLIENT)
+        def translate(...): ...
+
+    """
+
+    def decorator(decorated_function: Callable):
+        span_name = name or decorated_function.__qualname__
+
+        if inspect.iscoroutinefunction(decorated_function):
+
+            @functools.wraps(decorated_function)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name, kind):
+                    return await decorated_function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(decorated_function)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, kind):
+                return decorated_function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator(fn) if fn is not None else decorator
+
+
+def record_exception(e: BaseException):
+    """Record a caught exception on the current span, if there is one"""
+    span = _current_span.get()
+    if span is not None:
+        span.record_exception(e)
+
+
+def inject(headers: Optional[dict] = None) -> dict:
+    """Add the current span's traceparent to (a copy of) the message headers"""
+    headers = dict(headers or {})
+
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.context.to_traceparent()
+
+    return headers
+
+
+def extract(headers: Optional[dict]) -> Optional[SpanContext]:
+    """The publisher's span context from the message headers, None if it wasn't traced"""
+    if not headers:
+        return None
+
+    return SpanContext.from_traceparent(headers.get(TRACEPARENT_HEADER))
@@ -1,4 +1,4 @@
-from src.common.data_models.models import db
+from src.common.data_models.models import release_connection
 
 
 class DBConnectionMiddleware(object):
@@ -14,5 +14,5 @@ class DBConnectionMiddleware(object):
         # This returns the connections back to the pool for efficient reuse.
         # Reference :
         # https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#connection-pool
-        if not db.is_closed():
-            db.close()
+        # Also ends the request's read-your-writes stickiness to the primary
+        release_connection()
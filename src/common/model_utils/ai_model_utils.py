@@ -1,26 +1,196 @@
+import json
+import time
+
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import src.config as config
+
 from src.common.data_models import models
 
 from src.common.logger.logger import get_logger
+from src.common.redis.utils import get_connection
 
 logger = get_logger(__name__)
 
 
+DEFAULT_MODEL_DETAILS = {"model_code": "gpt-4o", "supported_languages": ["en"]}
+
+
+class ModelDetailsCache(object):
+    """Read-through cache of resolved AiModels rows (model_code + supported_languages) by id.
+
+    Entries live in this process for ttl secs. With use_redis they are also written to Redis, so other processes
+    (and this one after a restart) skip MySQL too. invalidate() clears both tiers, but other processes keep their
+    local copy until it expires - keep the ttl short enough for that to be acceptable.
+
+    """
+
+    def __init__(self, ttl: int = config.AI_MODEL_CACHE_TTL, use_redis: bool = config.AI_MODEL_CACHE_REDIS):
+        self.ttl = ttl
+        self.use_redis = use_redis
+        # model_id -> (expires_at, details)
+        self._entries: Dict[int, Tuple[float, dict]] = {}
+        self._lock = Lock()
+        self._connection = None
+
+    @staticmethod
+    def _redis_key(model_id: int) -> str:
+        return f"ai_model_details:{model_id}"
+
+    def _get_connection(self):
+        # One client for the cache's lifetime, not kept while Redis is unreachable so a later miss tries again
+        if self._connection is None:
+            self._connection = get_connection()
+
+        return self._connection
+
+    def get(self, model_id: int) -> Optional[dict]:
+        if self.ttl <= 0:
+            return None
+
+        entry = self._entries.get(model_id)
+        if entry is not None:
+            expires_at, details = entry
+            if expires_at > time.monotonic():
+                return details
+
+        details = self._get_from_redis(model_id)
+        if details is not None:
+            self._set_local(model_id, details)
+
+        return details
+
+    def set(self, model_id: int, details: dict):
+        if self.ttl <= 0:
+            return
+
+        self._set_local(model_id, details)
+        self._set_in_redis(model_id, details)
+
+    def invalidate(self, model_id: Optional[int] = None):
+        """Drop one model, or every model if model_id is None"""
+        with self._lock:
+            model_ids = list(self._entries) if model_id is None else [model_id]
+            for key in model_ids:
+                self._entries.pop(key, None)
+
+        if not self.use_redis:
+            return
+
+        try:
+            connection = self._get_connection()
+            if connection is None:
+                return
+
+            if model_id is None:
+                keys = list(connection.scan_iter(match=self._redis_key("*")))
+                if keys:
+                    connection.delete(*keys)
+            else:
+                connection.delete(self._redis_key(model_id))
+
+        except Exception as e:
+            logger.error(f"Failed to invalidate cached ai model details {model_id}. E:{e}")
+
+    def _set_local(self, model_id: int, details: dict):
+        with self._lock:
+            self._entries[model_id] = (time.monotonic() + self.ttl, details)
+
+    def _get_from_redis(self, model_id: int) -> Optional[dict]:
+        if not self.use_redis:
+            return None
+
+        try:
+            connection = self._get_connection()
+            if connection is None:
+                return None
+
+            value = connection.get(self._redis_key(model_id))
+            return json.loads(value) if value is not None else None
+
+        except Exception as e:
+            logger.error(f"Failed to read cached ai model details {model_id}. E:{e}")
+            return None
+
+    def _set_in_redis(self, model_id: int, details: dict):
+        if not self.use_redis:
+            return
+
+        try:
+            connection = self._get_connection()
+            if connection is not None:
+                connection.set(self._redis_key(model_id), json.dumps(details), ex=self.ttl)
+
+        except Exception as e:
+            logger.error(f"Failed to cache ai model details {model_id}. E:{e}")
+
+
+model_details_cache = ModelDetailsCache()
+
+
 def fetch_model_details(model_id: int = 1):
+    details = model_details_cache.get(model_id)
+    if details is not None:
+        return _copy_details(details)
+
     try:
-        model_details = (
+        model_details = models.read_only(
             models.AiModels.select(models.AiModels.id, models.AiModels.metadata, models.AiModels.model_code)
-            .where(models.AiModels.id == model_id)
+            # Same rows as preload_all_models() - soft-deleted models fall back to the default
+            .where(models.AiModels.id == model_id, models.AiModels.deleted_at.is_null())
             .dicts()
-            .get()
-        )
-        model_metadata = model_details.get("metadata", {})
-        supported_languages = _fetch_supported_languages(model_metadata=model_metadata)
-        model_code = model_details.get("model_code", None)
+        ).get()
+        details = _resolve_model_details(model_details)
+        model_details_cache.set(model_id, details)
 
-        return {"model_code": model_code, "supported_languages": supported_languages}
+        return _copy_details(details)
     except Exception as e:
+        # Not cached, so the next call retries the DB
         logger.error(f"Failed to fetch ai model details {e}")
-        return {"model_code": "gpt-4o", "supported_languages": ["en"]}
+        return _copy_details(DEFAULT_MODEL_DETAILS)
+
+
+def invalidate_model_details(model_id: Optional[int] = None):
+    """Call after changing an AiModels row (or all of them, with no model_id)"""
+    model_details_cache.invalidate(model_id)
+
+
+def preload_all_models() -> int:
+    """Load every AiModels row into the cache in one query, so fetch_model_details doesn't have to go to the DB on
+    the first chat for each model. Rows re-expire after the cache ttl and are then read through one by one again.
+
+    :return: How many models were cached
+    """
+    try:
+        rows = models.read_only(
+            models.AiModels.select(models.AiModels.id, models.AiModels.metadata, models.AiModels.model_code)
+            .where(models.AiModels.deleted_at.is_null())
+            .dicts()
+        )
+        count = 0
+        for row in rows:
+            model_details_cache.set(row["id"], _resolve_model_details(row))
+            count += 1
+
+        logger.info(f"Preloaded {count} ai model(s)")
+        return count
+    except Exception as e:
+        logger.error(f"Failed to preload ai model details {e}")
+        return 0
+
+
+def _resolve_model_details(model_details: dict) -> dict:
+    model_metadata = model_details.get("metadata") or {}
+    supported_languages = _fetch_supported_languages(model_metadata=model_metadata)
+    model_code = model_details.get("model_code", None)
+
+    return {"model_code": model_code, "supported_languages": supported_languages}
+
+
+def _copy_details(details: dict) -> dict:
+    # Callers get their own copy, so nothing they change leaks into the cache
+    return {**details, "supported_languages": list(details["supported_languages"])}
 
 
 def _fetch_supported_languages(model_metadata: dict):
@@ -0,0 +1,205 @@
+import types
+
+import pytest
+
+from peewee import CharField, DateTimeField, Model, SqliteDatabase
+
+from src.common.data_models.models import JSONField
+from src.common.model_utils import ai_model_utils
+from src.common.model_utils.ai_model_utils import (
+    DEFAULT_MODEL_DETAILS,
+    ModelDetailsCache,
+    fetch_model_details,
+    invalidate_model_details,
+    preload_all_models,
+)
+
+
+db = SqliteDatabase(":memory:")
+
+
+class AiModels(Model):
+    model_code = CharField()
+    metadata = JSONField(null=True)
+    deleted_at = DateTimeField(null=True)
+
+    class Meta:
+        database = db
+        table_name = "AiModels"
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [key for key in self.values if key.startswith(prefix)]
+
+
+class CountingDatabase(object):
+    def __init__(self):
+        self.queries = 0
+
+    def read_only(self, query):
+        self.queries += 1
+        return query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(ai_model_utils, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def database(monkeypatch):
+    db.connect(reuse_if_open=True)
+    db.create_tables([AiModels])
+    languages = {"English": "en", "German": "de"}
+    AiModels.create(id=1, model_code="gpt-4o", metadata={"ai_model_supported_languages": languages})
+    AiModels.create(id=2, model_code="gemini", metadata=None)
+    AiModels.create(id=3, model_code="retired", deleted_at="2024-01-01 00:00:00")
+
+    counting = CountingDatabase()
+    fake_models = types.SimpleNamespace(AiModels=AiModels, read_only=counting.read_only)
+    monkeypatch.setattr(ai_model_utils, "models", fake_models)
+
+    yield counting
+
+    db.drop_tables([AiModels])
+    db.close()
+
+
+@pytest.fixture
+def cache(monkeypatch, clock):
+    model_details_cache = ModelDetailsCache(ttl=60, use_redis=False)
+    monkeypatch.setattr(ai_model_utils, "model_details_cache", model_details_cache)
+    return model_details_cache
+
+
+def test_read_through_until_ttl(database, cache, clock):
+    expected = {"model_code": "gpt-4o", "supported_languages": ["en", "de"]}
+
+    assert fetch_model_details(1) == expected
+    assert fetch_model_details(1) == expected
+    assert database.queries == 1
+
+    clock.now += 61
+    assert fetch_model_details(1) == expected
+    assert database.queries == 2
+
+
+def test_missing_metadata_defaults_to_english(database, cache):
+    assert fetch_model_details(2) == {"model_code": "gemini", "supported_languages": ["en"]}
+
+
+def test_callers_cannot_change_the_cached_copy(database, cache):
+    fetch_model_details(1)["supported_languages"].append("fr")
+
+    assert fetch_model_details(1)["supported_languages"] == ["en", "de"]
+
+
+def test_fallback_is_not_cached(database, cache):
+    assert fetch_model_details(99) == DEFAULT_MODEL_DETAILS
+    assert fetch_model_details(99) == DEFAULT_MODEL_DETAILS
+    assert database.queries == 2
+
+
+def test_invalidate_one_or_all(database, cache):
+    fetch_model_details(1)
+    fetch_model_details(2)
+
+    invalidate_model_details(1)
+    fetch_model_details(1)
+    fetch_model_details(2)
+    assert database.queries == 3
+
+    invalidate_model_details()
+    fetch_model_details(1)
+    fetch_model_details(2)
+    assert database.queries == 5
+
+
+def test_preload_skips_deleted_models(database, cache):
+    assert preload_all_models() == 2
+
+    fetch_model_details(1)
+    fetch_model_details(2)
+    assert database.queries == 1
+    assert cache.get(3) is None
+
+
+def test_deleted_models_are_not_read_through(database, cache):
+    assert fetch_model_details(3) == DEFAULT_MODEL_DETAILS
+    assert cache.get(3) is None
+
+
+def test_zero_ttl_disables_caching(database, monkeypatch):
+    monkeypatch.setattr(ai_model_utils, "model_details_cache", ModelDetailsCache(ttl=0, use_redis=False))
+
+    fetch_model_details(1)
+    fetch_model_details(1)
+    assert database.queries == 2
+
+
+def test_redis_tier_is_shared_between_processes(monkeypatch, clock):
+    redis = FakeRedis()
+    monkeypatch.setattr(ai_model_utils, "get_connection", lambda: redis)
+    details = {"model_code": "gpt-4o", "supported_languages": ["en"]}
+
+    ModelDetailsCache(ttl=60, use_redis=True).set(1, details)
+    other_process = ModelDetailsCache(ttl=60, use_redis=True)
+    assert other_process.get(1) == details
+
+    other_process.invalidate()
+    assert redis.values == {}
+    assert ModelDetailsCache(ttl=60, use_redis=True).get(1) is None
+
+
+def test_redis_errors_fall_back_to_local(monkeypatch, clock):
+    def broken_connection():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(ai_model_utils, "get_connection", broken_connection)
+    cache = ModelDetailsCache(ttl=60, use_redis=True)
+
+    cache.set(1, {"model_code": "gpt-4o", "supported_languages": ["en"]})
+    assert cache.get(1)["model_code"] == "gpt-4o"
+    assert cache.get(2) is None
+    cache.invalidate(1)
+
+
+def test_redis_client_is_reused(monkeypatch, clock):
+    connections = []
+
+    def get_connection():
+        connections.append(FakeRedis())
+        return connections[-1]
+
+    monkeypatch.setattr(ai_model_utils, "get_connection", get_connection)
+    cache = ModelDetailsCache(ttl=60, use_redis=True)
+
+    cache.set(1, {"model_code": "gpt-4o", "supported_languages": ["en"]})
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert len(connections) == 1
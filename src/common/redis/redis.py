@@ -12,7 +12,8 @@ class RedisConnection:
 
     def __init__(self):
         self.__dict__ = self.__shared_state
-        self.redis_connection = None
+        # The client is shared by every instance - only set it up the first time, don't drop an open one
+        self.__dict__.setdefault("redis_connection", None)
 
     def __connect(self) -> None:
         try:
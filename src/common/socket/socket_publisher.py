@@ -2,6 +2,7 @@ from typing import Optional
 
 from src.common.socket.constants import SocketErrorMessage
 from src.common.logger.logger import get_logger
+from src.common.metrics.tracing import SpanKind, start_span
 from src.common.socket.pusher import Pusher
 
 logger = get_logger(__name__)
@@ -51,8 +52,11 @@ class SocketPublisher(object):
                 },
             }
 
-            logger.info(f"Going to publish response via Pusher. payload: {payload}")
-            self.pusher_client.send(self.channel, event_name, payload)
+            logger.info("Going to publish response via Pusher. payload: %s", payload)
+            with start_span(
+                "pusher.send", kind=SpanKind.CLIENT, attributes={"channel": self.channel, "event_name": event_name}
+            ):
+                self.pusher_client.send(self.channel, event_name, payload)
 
         except Exception as e:
             logger.error(f"Socket Error - {e}", exc_info=True)
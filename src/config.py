@@ -8,6 +8,14 @@ TEST_SUITE = os.environ.get("TEST_SUITE", "other").lower()
 # don't publish to queue if True - will just print out payload
 TEST_DUMMY_AMQP_PUBLISH = os.environ.get("TEST_DUMMY_AMQP_PUBLISH", "false").lower() == "true"
 USE_DB_POOL = os.environ.get("USE_DB_POOL", "false").lower() == "true"
+# DB connection pools (DatabaseManager and PooledDatabaseManager): max connections per process (a worker's
+# WorkerConfig.db_pool_size overrides it), secs before an idle connection is recycled, secs a checkout waits for a
+# free connection (0 waits forever, as in peewee) and how often idle connections past the stale timeout are closed
+# (0 = only on checkout)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_STALE_TIMEOUT = int(os.environ.get("DB_POOL_STALE_TIMEOUT", "300"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_REAPER_INTERVAL = float(os.environ.get("DB_POOL_REAPER_INTERVAL", "60"))
 
 DB_HOST = os.environ.get("DB_HOST", "")
 DB_PORT = os.environ.get("DB_PORT", "")
@@ -17,6 +25,10 @@ DB_PASSWORD = os.environ.get("DB_PASSWORD", "")
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
 REDIS_DB = int(os.environ.get("REDIS_DB", 0))
+# AiModels lookups (fetch_model_details) cached per process for this many secs, 0 disables. With
+# AI_MODEL_CACHE_REDIS they are shared through Redis too, so a fresh process doesn't need MySQL either
+AI_MODEL_CACHE_TTL = int(os.environ.get("AI_MODEL_CACHE_TTL", "300"))
+AI_MODEL_CACHE_REDIS = os.environ.get("AI_MODEL_CACHE_REDIS", "false").lower() == "true"
 OPENAI_LLM_MODEL = os.environ.get("CHAT_LLM_MODEL", "gpt-4o")
 GEMINI_LLM_MODEL = os.environ.get("GEMINI_LLM_MODEL", "gemini-1.5-flash")
 
@@ -32,12 +44,78 @@ EXCHANGE_NAME = os.environ.get("EXCHANGE_NAME", "pencil_exchange")
 DELAY_EXCHANGE_NAME = os.environ.get("DELAY_EXCHANGE_NAME", "pencil_delay_exchange")
 ENABLE_REQUEUE = True
 X_MAX_PRIORITY = 255  # We should ideally set it lower: https://www.rabbitmq.com/docs/priority#resource-usage
+# Persistent publisher connections, one confirm-mode channel each
+AMQP_PUBLISHER_POOL_SIZE = int(os.environ.get("AMQP_PUBLISHER_POOL_SIZE", "4"))
+AMQP_PUBLISHER_CHECKOUT_TIMEOUT = float(os.environ.get("AMQP_PUBLISHER_CHECKOUT_TIMEOUT", "30"))
+AMQP_PUBLISHER_MAX_RETRIES = int(os.environ.get("AMQP_PUBLISHER_MAX_RETRIES", "1"))
+AMQP_PUBLISHER_CONFIRM_TIMEOUT = float(os.environ.get("AMQP_PUBLISHER_CONFIRM_TIMEOUT", "30"))
+# Body encoding for published messages: json, orjson (same wire format, faster) or msgpack. Consumers decode by the
+# message's content_type, so this can be changed per service. orjson/msgpack aren't project dependencies - install
+# them in the image before opting in, otherwise they fall back to json
+AMQP_MESSAGE_CODEC = os.environ.get("AMQP_MESSAGE_CODEC", "json")
+# asyncio consumer: bodies at least this big are decoded on the executor instead of the event loop
+AMQP_DECODE_OFFLOAD_BYTES = int(os.environ.get("AMQP_DECODE_OFFLOAD_BYTES", str(64 * 1024)))
+# Secs in-flight messages get to finish on shutdown before being requeued - keep below terminationGracePeriodSeconds
+CONSUMER_DRAIN_TIMEOUT = float(os.environ.get("CONSUMER_DRAIN_TIMEOUT", "25"))
+CONSUMER_DRAIN_POLL_INTERVAL = 0.5
+# Message dedup state in Redis. Processing claims must outlast the slowest job
+DEDUP_DONE_TTL = int(os.environ.get("DEDUP_DONE_TTL", str(24 * 60 * 60)))
+DEDUP_PROCESSING_TTL = int(os.environ.get("DEDUP_PROCESSING_TTL", str(60 * 60)))
+# Messages are deduplicated by the publisher's message_id. Set this to also dedupe messages without one by a hash of
+# their body - an identical resubmission is then dropped for DEDUP_DONE_TTL
+DEDUP_BODY_HASH_FALLBACK = os.environ.get("DEDUP_BODY_HASH_FALLBACK", "false").lower() == "true"
+# Secs a redelivered message waits before being requeued while its first delivery is still being processed
+DEDUP_REQUEUE_DELAY = float(os.environ.get("DEDUP_REQUEUE_DELAY", "5"))
+# Failed message retries through DELAY_EXCHANGE_NAME: base_delay * 2^(n-1), capped
+RETRY_BASE_DELAY_MS = int(os.environ.get("RETRY_BASE_DELAY_MS", "5000"))
+RETRY_MAX_DELAY_MS = int(os.environ.get("RETRY_MAX_DELAY_MS", str(5 * 60 * 1000)))
+# Local priority scheduling: secs a prefetched message has to wait to gain one priority level
+LOCAL_PRIORITY_AGING_INTERVAL = float(os.environ.get("LOCAL_PRIORITY_AGING_INTERVAL", "1"))
+# Micro-batching consumers: max wait for a batch to fill up
+DEFAULT_BATCH_TIMEOUT_MS = int(os.environ.get("DEFAULT_BATCH_TIMEOUT_MS", "200"))
+
+# Worker metrics served on :METRICS_PORT/metrics (Prometheus text), 0 (default) disables. Give each worker on a host
+# its own port - 9100 is node-exporter's
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# Function profiling: durations kept per function for p50/p95/p99, rows/frames in the SIGUSR1/SIGUSR2 reports and
+# what SIGUSR2 samples - cprofile, tracemalloc or both (comma separated)
+PROFILING_RESERVOIR_SIZE = int(os.environ.get("PROFILING_RESERVOIR_SIZE", "1024"))
+PROFILING_REPORT_LIMIT = int(os.environ.get("PROFILING_REPORT_LIMIT", "40"))
+PROFILING_TRACEMALLOC_FRAMES = int(os.environ.get("PROFILING_TRACEMALLOC_FRAMES", "10"))
+PROFILING_SAMPLE_MODE = os.environ.get("PROFILING_SAMPLE_MODE", "cprofile").lower().split(",")
+# Request tracing (src.common.metrics.tracing): log (one record per trace on stdout), memory or none (default -
+# traceparent headers are still propagated). The sample rate is decided where a trace starts and travels with the
+# traceparent AMQP header; each sampled trace is one large log record, so keep it low in production
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none").lower()
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", "0.01"))
+TRACING_MAX_SPANS_PER_TRACE = int(os.environ.get("TRACING_MAX_SPANS_PER_TRACE", "512"))
 
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
 # Runtime Environment Identifiers & Logs
 LOG_FILE = "bddnai-knowledge-extraction.log"
+# json (one object per line) or text
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Log records go through a queue to a single writer thread instead of every thread writing to stdout itself
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "true").lower() == "true"
+# Records beyond this many waiting for stdout are dropped rather than blocking the caller
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Per call site limits for INFO/DEBUG logs (warnings and errors are never dropped). The first LOG_SAMPLE_FIRST_N
+# records of each call site always go out, after that 1 in 1/LOG_SAMPLE_RATE, and at most LOG_RATE_LIMIT_PER_SEC
+# (bursts of LOG_RATE_LIMIT_BURST) per call site. 1.0 / 0 disable sampling / rate limiting
+LOG_SAMPLE_FIRST_N = int(os.environ.get("LOG_SAMPLE_FIRST_N", "10"))
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_RATE_LIMIT_PER_SEC = float(os.environ.get("LOG_RATE_LIMIT_PER_SEC", "0"))
+LOG_RATE_LIMIT_BURST = float(os.environ.get("LOG_RATE_LIMIT_BURST", "20"))
+# Per logger sample rate overrides, e.g. "src.common.classes.asset.concept=0.01,src.common.socket=0.5"
+LOG_SAMPLE_RATE_OVERRIDES = {
+    k.strip(): float(v)
+    for k, _, v in (item.partition("=") for item in os.environ.get("LOG_SAMPLE_RATE_OVERRIDES", "").split(","))
+    if k.strip() and v.strip()
+}
+# Sample rate for log statements inside known hot loops (asset lookups per placeholder etc.)
+LOG_HOT_PATH_SAMPLE_RATE = float(os.environ.get("LOG_HOT_PATH_SAMPLE_RATE", "0.01"))
 
 # R2
 R2_ENABLED = os.environ.get("R2_ENABLED", "false") == "true"
@@ -60,9 +138,38 @@ GS_PUBLIC_ACL = os.environ.get("GS_PUBLIC_ACL", "true").lower() == "true"
 GCP_TIMEOUT = 15 * 60  # 15 mins
 GCP_TIMEOUT_SHORT = 5 * 60  # 5 mins
 
+# Claim check: AMQP bodies over the threshold go to object storage (s3 - or R2 if enabled - or gs) and only a
+# reference is enqueued. 0 (default) disables - only turn it on once every consumer of the queue understands the
+# x-claim-check header. Offloaded objects aren't deleted on ack: set a lifecycle rule on the prefix, or run
+# scripts/cleanup_claim_checks.py, which deletes them after the retention (keep it above the longest retry delay
+# plus the time messages may sit in a dead-letter queue)
+AMQP_CLAIM_CHECK_THRESHOLD_BYTES = int(os.environ.get("AMQP_CLAIM_CHECK_THRESHOLD_BYTES", "0"))
+AMQP_CLAIM_CHECK_BACKEND = os.environ.get("AMQP_CLAIM_CHECK_BACKEND", "s3")
+AMQP_CLAIM_CHECK_BUCKET = os.environ.get(
+    "AMQP_CLAIM_CHECK_BUCKET", GS_BUCKET if AMQP_CLAIM_CHECK_BACKEND == "gs" else AWS_S3_BUCKET
+)
+AMQP_CLAIM_CHECK_PREFIX = os.environ.get("AMQP_CLAIM_CHECK_PREFIX", "amqp-claim-check/")
+AMQP_CLAIM_CHECK_RETENTION_DAYS = int(os.environ.get("AMQP_CLAIM_CHECK_RETENTION_DAYS", "14"))
+# Fetched bodies kept per worker process, so redeliveries/retries don't download again
+AMQP_CLAIM_CHECK_CACHE_SIZE = int(os.environ.get("AMQP_CLAIM_CHECK_CACHE_SIZE", "8"))
+
 CHAT_PROCESSOR_QUEUE = os.environ.get("CHAT_PROCESSOR_QUEUE", "chat_queue")
 CHAT_PROCESSOR_ROUTING_KEY = os.environ.get("CHAT_ROUTING_KEY", "*.chat_processor")
 CHAT_DEFAULT_MESSAGE_PRIORITY = int(os.environ.get("CHAT_DEFAULT_MESSAGE_PRIORITY", "100"))
+# Unset max workers keeps one thread per message with prefetch 1
+CHAT_PROCESSOR_MAX_WORKERS = (
+    int(os.environ["CHAT_PROCESSOR_MAX_WORKERS"]) if "CHAT_PROCESSOR_MAX_WORKERS" in os.environ else None
+)
+CHAT_PROCESSOR_PREFETCH_COUNT = int(os.environ.get("CHAT_PROCESSOR_PREFETCH_COUNT", CHAT_PROCESSOR_MAX_WORKERS or 1))
+CHAT_PROCESSOR_LOCAL_PRIORITY_SCHEDULING = (
+    os.environ.get("CHAT_PROCESSOR_LOCAL_PRIORITY_SCHEDULING", "false").lower() == "true"
+)
+# asyncio consumer - concurrency is the number of messages awaited at once on the event loop. Can't be combined with
+# CHAT_PROCESSOR_LOCAL_PRIORITY_SCHEDULING
+CHAT_PROCESSOR_USE_ASYNCIO = os.environ.get("CHAT_PROCESSOR_USE_ASYNCIO", "false").lower() == "true"
+CHAT_PROCESSOR_MAX_CONCURRENCY = int(os.environ.get("CHAT_PROCESSOR_MAX_CONCURRENCY", "1"))
+# Most recent messages of a session loaded into the chat (SqlMessageHistory's window), older ones stay in the DB
+CHAT_HISTORY_WINDOW_SIZE = int(os.environ.get("CHAT_HISTORY_WINDOW_SIZE", "50"))
 
 KNOWLEDGE_EXTRACTION_PROCESSOR_QUEUE = os.environ.get(
     "KNOWLEDGE_EXTRACTION_PROCESSOR_QUEUE", "knowledge_extraction_processor_queue"
@@ -73,6 +180,29 @@ KNOWLEDGE_EXTRACTION_PROCESSOR_ROUTING_KEY = os.environ.get(
 KNOWLEDGE_EXTRACTION_PROCESSOR_MESSAGE_PRIORITY = int(
     os.environ.get("KNOWLEDGE_EXTRACTION_PROCESSOR_MESSAGE_PRIORITY", "100")
 )
+KNOWLEDGE_EXTRACTION_PROCESSOR_MAX_WORKERS = (
+    int(os.environ["KNOWLEDGE_EXTRACTION_PROCESSOR_MAX_WORKERS"])
+    if "KNOWLEDGE_EXTRACTION_PROCESSOR_MAX_WORKERS" in os.environ
+    else None
+)
+KNOWLEDGE_EXTRACTION_PROCESSOR_PREFETCH_COUNT = int(
+    os.environ.get("KNOWLEDGE_EXTRACTION_PROCESSOR_PREFETCH_COUNT", KNOWLEDGE_EXTRACTION_PROCESSOR_MAX_WORKERS or 1)
+)
+# Parse PDFs etc. in child processes so the pika ioloop keeps up with heartbeats
+KNOWLEDGE_EXTRACTION_PROCESSOR_LOCAL_PRIORITY_SCHEDULING = (
+    os.environ.get("KNOWLEDGE_EXTRACTION_PROCESSOR_LOCAL_PRIORITY_SCHEDULING", "false").lower() == "true"
+)
+KNOWLEDGE_EXTRACTION_PROCESSOR_USE_PROCESS_POOL = (
+    os.environ.get("KNOWLEDGE_EXTRACTION_PROCESSOR_USE_PROCESS_POOL", "false").lower() == "true"
+)
+KNOWLEDGE_EXTRACTION_PROCESSOR_DEDUPLICATE = (
+    os.environ.get("KNOWLEDGE_EXTRACTION_PROCESSOR_DEDUPLICATE", "false").lower() == "true"
+)
+# Total attempts before a failed extraction job is dead-lettered. Unset or 0 disables retries (failed jobs are
+# dropped) - turning it on declares the retry binding and <queue>.dead_letter queue on the broker
+KNOWLEDGE_EXTRACTION_PROCESSOR_RETRY_MAX_ATTEMPTS = (
+    int(os.environ.get("KNOWLEDGE_EXTRACTION_PROCESSOR_RETRY_MAX_ATTEMPTS", "0")) or None
+)
 
 SKIP_TEXT_EDITOR_POST_GENERATION_STEPS = (
     os.environ.get("SKIP_TEXT_EDITOR_POST_GENERATION_STEPS", "false").lower() == "true"
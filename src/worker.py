@@ -1,9 +1,14 @@
 import argparse
 import logging
+import signal
 
+from src.common.data_models import models
 from src.common.data_models.bind_models import connect_and_bind_models
 from src.common.amqp.worker_config import WorkerConfigs
 from src.common.logger.logger import get_logger
+from src.common.metrics.metrics_server import start_metrics_server
+from src.common.metrics.profiling import install_profiling_signal_handlers
+from src.common.model_utils.ai_model_utils import preload_all_models
 
 
 logging.getLogger("pika").setLevel(logging.WARNING)
@@ -11,20 +16,41 @@ logging.getLogger("pika").setLevel(logging.WARNING)
 logger = get_logger(__name__)
 
 
+def handle_shutdown_signal(signum: int, frame):
+    # src.common installs ThreadTerminateEvent.signal_handler, which aborts running jobs. For the worker we want the
+    # consumer's KeyboardInterrupt path instead - stop consuming, requeue what hasn't started, let in-flight jobs
+    # finish (up to CONSUMER_DRAIN_TIMEOUT) and only then close the connection
+    logger.info(f"Caught {signal.Signals(signum).name}, draining consumer")
+    raise KeyboardInterrupt
+
+
 def main(parser: argparse.ArgumentParser):
     args = vars(parser.parse_args())
 
-    worker_name = args.get("worker", None)
-    assert worker_name is not None, "worker_name is None"
+    worker_names = args.get("worker", None)
+    assert worker_names, "worker_name is None"
 
-    # Get worker config from enum
-    worker_config = WorkerConfigs[worker_name]
+    # Get worker configs from enum, dropping repeats
+    worker_configs = [WorkerConfigs[worker_name] for worker_name in dict.fromkeys(worker_names)]
 
+    # Workers sharing this process (multi-queue mode) share its DB pool
+    models.db_manager.set_pool_size(sum(worker_config.get_db_pool_size() for worker_config in worker_configs))
     connect_and_bind_models()
+    preload_all_models()
+    models.release_connection()
+    start_metrics_server()
+
+    logger.info(f"--- Starting {', '.join(worker_config.name for worker_config in worker_configs)} ---")
 
-    logger.info(f"--- Starting {worker_config.name} ---")
+    if len(worker_configs) == 1:
+        consumer = worker_configs[0].create_consumer()
+    else:
+        # Several small queues in one process, sharing one AMQP connection
+        consumer = WorkerConfigs.create_multi_queue_consumer(worker_configs)
 
-    consumer = worker_config.create_consumer()
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    signal.signal(signal.SIGINT, handle_shutdown_signal)
+    install_profiling_signal_handlers()
 
     try:
         consumer.run()
@@ -38,6 +64,8 @@ def main(parser: argparse.ArgumentParser):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Brand-DNAi Knowledge Extraction Worker")
-    parser.add_argument("-w", "--worker", required=True, choices=WorkerConfigs.get_available_configs())
+    parser.add_argument(
+        "-w", "--worker", required=True, nargs="+", choices=WorkerConfigs.get_available_configs()
+    )
 
     main(parser)